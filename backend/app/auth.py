@@ -1,34 +1,96 @@
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import case, event, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User, TokenData
+from app.executors import PoolBrokenError, PoolSaturatedError
+from app.passwords import verify_password_async
 import os
+import threading
+import time
 
 # Настройки для JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")  # В продакшене задайте переменную окружения
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Настройки для хеширования паролей
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
-
 # Настройки для HTTP Bearer токенов
 security = HTTPBearer()
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверка пароля"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    """Хеширование пароля"""
-    return pwd_context.hash(password)
+@dataclass(frozen=True)
+class CurrentUser:
+    """Данные пользователя, достаточные для проверки доступа"""
+    id: int
+    username: str
+    is_active: bool
+
+
+class AuthCache:
+    """
+    Кеш проверенных токенов: токен -> данные пользователя.
+
+    Запись живёт не дольше ttl секунд и не дольше самого токена, поэтому
+    деактивация пользователя в другом процессе вступает в силу не позже
+    чем через ttl. В текущем процессе запись сбрасывается сразу.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, CurrentUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[CurrentUser]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token: str, user: CurrentUser, token_expires_at: Optional[float] = None):
+        if self.max_entries == 0 or self.ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        if token_expires_at is not None:
+            # Переводим срок жизни токена (UNIX-время) в monotonic
+            expires_at = min(expires_at, time.monotonic() + token_expires_at - time.time())
+        with self._lock:
+            self._entries[token] = (expires_at, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """Сбрасывает все токены пользователя"""
+        with self._lock:
+            for token in [token for token, (_, user) in self._entries.items() if user.id == user_id]:
+                del self._entries[token]
+
+
+auth_cache = AuthCache(
+    max_entries=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "60")),
+)
+
+
+@event.listens_for(User.is_active, "set")
+def _on_user_active_changed(target, value, oldvalue, initiator):
+    """Деактивация (и повторная активация) пользователя сбрасывает его токены в кеше"""
+    if target.id is not None and value != oldvalue:
+        auth_cache.invalidate_user(target.id)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -50,26 +112,65 @@ def verify_token(token: str, credentials_exception):
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
+        token_data = TokenData(
+            username=username,
+            user_id=payload.get("uid"),
+            expires_at=payload.get("exp")
+        )
     except JWTError:
         raise credentials_exception
     return token_data
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    """Аутентификация пользователя"""
-    user = db.query(User).filter(User.username == username).first()
+def find_login_user(db: Session, login: str, allow_email: bool = True) -> Optional[User]:
+    """
+    Пользователь по username или email одним запросом.
+    Совпадение по username важнее, как и раньше при двух отдельных запросах.
+    """
+    if not allow_email:
+        return db.query(User).filter(User.username == login).first()
+    return db.query(User).filter(
+        or_(User.username == login, User.email == login)
+    ).order_by(case((User.username == login, 0), else_=1)).first()
+
+
+async def authenticate_user(db: AsyncSession, login: str, password: str, allow_email: bool = True):
+    """Аутентификация пользователя: один запрос к БД и ровно одна проверка пароля"""
+    user = await db.run_sync(find_login_user, login, allow_email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    try:
+        password_ok = await verify_password_async(password, user.hashed_password)
+    except (PoolSaturatedError, PoolBrokenError):
+        raise password_pool_busy_error()
+    if not password_ok:
         return False
     return user
 
 
-def get_current_user(
+def password_pool_busy_error() -> HTTPException:
+    """Ответ 503 при переполнении очереди хеширования паролей или сбое её процессов"""
+    return HTTPException(
+        status_code=503,
+        detail="Too many login attempts in progress, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+
+def _find_token_user(db: Session, token_data: TokenData) -> Optional[User]:
+    # В новых токенах есть id пользователя, в старых - только username
+    if token_data.user_id is not None:
+        user = db.get(User, token_data.user_id)
+        if user is not None and user.username != token_data.username:
+            return None
+        return user
+    return db.query(User).filter(User.username == token_data.username).first()
+
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
+    db: AsyncSession = Depends(get_db)
+) -> CurrentUser:
     """Получение текущего пользователя из токена"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,15 +179,21 @@ def get_current_user(
     )
     
     token = credentials.credentials
-    token_data = verify_token(token, credentials_exception)
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return cached
     
-    user = db.query(User).filter(User.username == token_data.username).first()
+    token_data = verify_token(token, credentials_exception)
+    user = await db.run_sync(_find_token_user, token_data)
     if user is None:
         raise credentials_exception
-    return user
+
+    current_user = CurrentUser(id=user.id, username=user.username, is_active=bool(user.is_active))
+    auth_cache.put(token, current_user, token_data.expires_at)
+    return current_user
 
 
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+def get_current_active_user(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     """Получение активного пользователя"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
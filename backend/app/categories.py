@@ -0,0 +1,117 @@
+"""
+Справочники и нормализация названий категорий кешбека.
+Используются и при распознавании скриншотов, и при ручном вводе категорий.
+"""
+import re
+from functools import lru_cache
+from typing import Optional
+
+# Слова, которые нужно удалить из названий категорий
+STOP_WORDS = frozenset([
+    'подробнее', 'далее', 'еще', 'больше', 'всего', 'итого',
+    'сумма', 'бонус', 'кешбек', 'накопления', 'процент', '%', 'руб',
+    'рублей', 'коп', 'копеек', 'до', 'от', 'с', 'по', 'на', 'за',
+    'в', 'во', 'к', 'ко', 'о', 'об', 'обо', 'при', 'про', 'со', 'из',
+    'изо', 'над', 'под', 'подо', 'перед', 'передо', 'зао',
+    'между', 'среди', 'через', 'сквозь', 'для', 'ради', 'благодаря',
+    'согласно', 'вопреки', 'навстречу', 'наподобие', 'вроде', 'вследствие',
+    'ввиду', 'вслед', 'вместо', 'кроме', 'сверх',
+    'около', 'возле', 'близ', 'вдоль', 'вокруг', 'против',
+    'напротив', 'позади', 'впереди', 'сверху', 'снизу', 'внутри',
+    'снаружи', 'вне', 'внутрь', 'наружу', 'вверх', 'вниз', 'вперед',
+    'назад', 'влево', 'вправо', 'налево', 'направо', 'туда', 'сюда',
+    'оттуда', 'отсюда', 'везде', 'всюду', 'нигде', 'никуда',
+    'никогда', 'всегда', 'иногда', 'часто', 'редко',
+])
+
+# Иконка по умолчанию (Material-UI)
+DEFAULT_ICON = 'shopping_cart'
+
+# Ключевые слова для подбора иконки, в порядке приоритета
+CATEGORY_ICONS = {
+    'азс': 'local_gas_station',
+    'заправка': 'local_gas_station',
+    'бензин': 'local_gas_station',
+    'кафе': 'restaurant',
+    'ресторан': 'restaurant',
+    'еда': 'restaurant',
+    'супермаркет': 'shopping_cart',
+    'продукты': 'shopping_cart',
+    'магазин': 'shopping_cart',
+    'аптека': 'local_pharmacy',
+    'лекарство': 'local_pharmacy',
+    'медицина': 'local_pharmacy',
+    'клиника': 'medical_services',
+    'больница': 'medical_services',
+    'транспорт': 'directions_bus',
+    'автобус': 'directions_bus',
+    'метро': 'train',
+    'такси': 'local_taxi',
+    'билет': 'confirmation_number',
+    'кино': 'movie',
+    'развлечение': 'sports_esports',
+    'игра': 'sports_esports',
+    'онлайн': 'shopping_bag',
+    'интернет': 'shopping_bag',
+    'курс': 'school',
+    'образование': 'school',
+    'книга': 'menu_book',
+    'отель': 'hotel',
+    'путешествие': 'flight',
+    'авиа': 'flight',
+    'спорт': 'fitness_center',
+    'тренажер': 'fitness_center',
+    'красота': 'face',
+    'салон': 'content_cut',
+    'ремонт': 'build',
+    'стройка': 'construction',
+    'услуга': 'support_agent',
+}
+
+# Все ключевые слова в одной регулярке. Lookahead находит совпадение на
+# каждой позиции, поэтому пересекающиеся слова ("спортивный транспорт")
+# не теряются, а из найденных выбирается самое приоритетное
+_ICON_RE = re.compile('(?=(' + '|'.join(map(re.escape, CATEGORY_ICONS)) + '))')
+_ICON_PRIORITY = {key: priority for priority, key in enumerate(CATEGORY_ICONS)}
+_ICONS_BY_PRIORITY = list(CATEGORY_ICONS.values())
+
+
+def normalize_category_name(category_name: str) -> str:
+    """Нормализует название: нижний регистр, ё -> е, одиночные пробелы"""
+    return ' '.join(category_name.lower().replace('ё', 'е').split())
+
+
+_KEY_JUNK_RE = re.compile(r'[^\w\s]|_|\d')
+
+
+def make_category_key(category_name: str) -> str:
+    """
+    Ключ категории для поиска и сравнения: нижний регистр, ё -> е,
+    без знаков препинания, цифр и стоп-слов ("Кешбек на АЗС" -> "азс")
+    """
+    normalized = _KEY_JUNK_RE.sub(' ', category_name.lower().replace('ё', 'е'))
+    return ' '.join(word for word in normalized.split() if word not in STOP_WORDS)
+
+
+@lru_cache(maxsize=4096)
+def _icon_for_normalized(normalized_name: str) -> str:
+    best = None
+    for match in _ICON_RE.finditer(normalized_name):
+        priority = _ICON_PRIORITY[match.group(1)]
+        if best is None or priority < best:
+            best = priority
+    if best is None:
+        return DEFAULT_ICON
+    return _ICONS_BY_PRIORITY[best]
+
+
+def get_category_icon(category_name: str) -> str:
+    """Определяет иконку для категории по её названию"""
+    return _icon_for_normalized(normalize_category_name(category_name))
+
+
+def resolve_category_icon(category_name: str, icon: Optional[str] = None) -> str:
+    """Иконка, выбранная пользователем, или подобранная по названию"""
+    if icon and icon != DEFAULT_ICON:
+        return icon
+    return get_category_icon(category_name)
@@ -0,0 +1,277 @@
+"""
+Нечёткий поиск категорий кешбека.
+
+Для каждого пользователя в памяти строится триграммный индекс по основам
+слов из названий категорий. Это даёт поиск без учёта регистра и окончаний
+("аптек", "Аптеки"), устойчивость к опечаткам и английские синонимы
+("pharmacy"). Кроме того, как и прежний ILIKE '%запрос%', находится любая
+категория, в названии которой запрос встречается подстрокой ("маркет" -
+"Супермаркеты"): для этого отдельно индексируются триграммы названий целиком.
+Индекс строится одним запросом при первом поиске и затем обновляется из
+эндпоинтов создания, изменения и удаления категорий.
+"""
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, FrozenSet, List, Set, Tuple
+from sqlalchemy.orm import Session
+from app.categories import make_category_key, normalize_category_name
+from app.models import Bank, Card, CashbackCategory
+
+# Окончания русских слов, от длинных к коротким
+_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'ах', 'ях',
+    'ов', 'ев', 'ей', 'ой', 'ый', 'ий', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ом', 'ем', 'ам', 'ям', 'ую', 'юю', 'ы', 'и', 'а', 'я', 'е', 'о', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+# Минимальная длина основы после отсечения окончания
+_MIN_STEM = 3
+# Релевантность основы, которая начинается с запроса ("марк" - "Маркетплейсы")
+_PREFIX_SCORE = 0.8
+# Релевантность категории, в названии которой запрос встречается только
+# подстрокой ("марк" - "Супермаркеты"): ниже совпадения по началу слова
+_INFIX_SCORE = 0.7
+
+
+def stem(word: str) -> str:
+    """Упрощённый стемминг: отсекает падежное окончание"""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+# Английские названия категорий -> русские
+_SYNONYMS = {
+    'pharmacy': 'аптеки', 'pharmacies': 'аптеки', 'drugstore': 'аптеки',
+    'restaurant': 'рестораны', 'restaurants': 'рестораны',
+    'cafe': 'кафе', 'cafes': 'кафе', 'coffee': 'кофейни',
+    'fastfood': 'фастфуд', 'food': 'еда',
+    'supermarket': 'супермаркеты', 'supermarkets': 'супермаркеты',
+    'groceries': 'продукты', 'grocery': 'продукты',
+    'gas': 'азс', 'fuel': 'азс', 'petrol': 'азс',
+    'taxi': 'такси', 'transport': 'транспорт', 'metro': 'метро',
+    'cinema': 'кино', 'movies': 'кино', 'entertainment': 'развлечения',
+    'travel': 'путешествия', 'hotel': 'отели', 'hotels': 'отели',
+    'flights': 'авиабилеты', 'books': 'книги', 'education': 'образование',
+    'sport': 'спорт', 'sports': 'спорт', 'fitness': 'спорт',
+    'beauty': 'красота', 'clothes': 'одежда', 'clothing': 'одежда',
+    'shoes': 'обувь', 'pets': 'животные', 'medicine': 'медицина',
+    'electronics': 'электроника', 'home': 'дом', 'repair': 'ремонт',
+    'marketplace': 'маркетплейсы', 'marketplaces': 'маркетплейсы',
+}
+
+
+def search_terms(text: str) -> Tuple[str, ...]:
+    """Основы слов названия или запроса"""
+    terms = []
+    for word in make_category_key(text).split():
+        word = _SYNONYMS.get(word, word)
+        terms.extend(stem(part) for part in word.split())
+    return tuple(terms)
+
+
+def _trigrams(term: str) -> FrozenSet[str]:
+    padded = f"  {term} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _infix_trigrams(text: str) -> FrozenSet[str]:
+    """Триграммы без дополнения пробелами: есть у любой подстроки длиннее двух символов"""
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class _UserIndex:
+    """Индекс категорий одного пользователя"""
+
+    def __init__(self):
+        # id -> (год, месяц, основы слов, нормализованное название)
+        self.docs: Dict[int, Tuple[int, int, Tuple[str, ...], str]] = {}
+        self.term_docs: Dict[str, Set[int]] = defaultdict(set)
+        self.term_trigrams: Dict[str, FrozenSet[str]] = {}
+        self.trigram_terms: Dict[str, Set[str]] = defaultdict(set)
+        # Триграммы названий целиком - для поиска подстроки
+        self.name_trigram_docs: Dict[str, Set[int]] = defaultdict(set)
+
+    def add(self, category_id: int, name: str, year: int, month: int):
+        self.remove(category_id)
+        terms = search_terms(name)
+        normalized = normalize_category_name(name)
+        self.docs[category_id] = (year, month, terms, normalized)
+        for trigram in _infix_trigrams(normalized):
+            self.name_trigram_docs[trigram].add(category_id)
+        for term in terms:
+            if term not in self.term_trigrams:
+                trigrams = _trigrams(term)
+                self.term_trigrams[term] = trigrams
+                for trigram in trigrams:
+                    self.trigram_terms[trigram].add(term)
+            self.term_docs[term].add(category_id)
+
+    def remove(self, category_id: int):
+        doc = self.docs.pop(category_id, None)
+        if doc is None:
+            return
+        for trigram in _infix_trigrams(doc[3]):
+            ids = self.name_trigram_docs.get(trigram)
+            if ids is not None:
+                ids.discard(category_id)
+                if not ids:
+                    del self.name_trigram_docs[trigram]
+        for term in doc[2]:
+            ids = self.term_docs.get(term)
+            if ids is None:
+                continue
+            ids.discard(category_id)
+            if not ids:
+                # Основа больше не встречается - убираем её триграммы
+                del self.term_docs[term]
+                for trigram in self.term_trigrams.pop(term, ()):
+                    terms = self.trigram_terms.get(trigram)
+                    if terms is not None:
+                        terms.discard(term)
+                        if not terms:
+                            del self.trigram_terms[trigram]
+
+    def _similar_terms(self, query_term: str) -> Dict[str, float]:
+        """Похожие основы: сходство по триграммам (Жаккар), префикс считается совпадением"""
+        query_trigrams = _trigrams(query_term)
+        shared: Dict[str, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for term in self.trigram_terms.get(trigram, ()):
+                shared[term] += 1
+        scores = {}
+        for term, count in shared.items():
+            score = count / (len(query_trigrams) + len(self.term_trigrams[term]) - count)
+            if term == query_term:
+                score = 1.0
+            elif len(query_term) >= _MIN_STEM and term.startswith(query_term):
+                score = max(score, _PREFIX_SCORE)
+            scores[term] = score
+        return scores
+
+    def _infix_matches(self, query: str) -> Set[int]:
+        """Категории, в названии которых запрос встречается подстрокой"""
+        trigrams = _infix_trigrams(query)
+        if trigrams:
+            postings = sorted((self.name_trigram_docs.get(trigram, set()) for trigram in trigrams), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            # Запрос короче трёх символов: проверяем все названия
+            candidates = self.docs.keys()
+        return {category_id for category_id in candidates if query in self.docs[category_id][3]}
+
+    def search(self, query: str, year: int, month: int, threshold: float) -> List[Tuple[int, float, bool]]:
+        """[(id, релевантность, запрос - подстрока названия)] за период, от лучших к худшим"""
+        terms = search_terms(query)
+        normalized = normalize_category_name(query)
+        infix = self._infix_matches(normalized) if normalized else set()
+        doc_scores: Dict[int, float] = defaultdict(float)
+        for query_term in terms:
+            best: Dict[int, float] = {}
+            for term, score in self._similar_terms(query_term).items():
+                for category_id in self.term_docs.get(term, ()):
+                    if score > best.get(category_id, 0.0):
+                        best[category_id] = score
+            for category_id, score in best.items():
+                doc_scores[category_id] += score / len(terms)
+
+        for category_id in infix:
+            doc_scores[category_id] = max(doc_scores[category_id], _INFIX_SCORE)
+
+        results = []
+        for category_id, score in doc_scores.items():
+            doc_year, doc_month = self.docs[category_id][:2]
+            is_infix = category_id in infix
+            if doc_year == year and doc_month == month and (score >= threshold or is_infix):
+                results.append((category_id, score, is_infix))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results
+
+
+class CategorySearchIndex:
+    """Индексы категорий пользователей с вытеснением давно не использованных (LRU)"""
+
+    def __init__(self, max_users: int = 1000, threshold: float = 0.4):
+        self.max_users = max(1, max_users)
+        self.threshold = threshold
+        self._users: "OrderedDict[int, _UserIndex]" = OrderedDict()
+        # Поколение индекса пользователя: защищает от сохранения устаревшей сборки
+        self._generations: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session, user_id: int) -> _UserIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                self._users.move_to_end(user_id)
+                return index
+            generation = self._generations[user_id]
+
+        rows = db.query(
+            CashbackCategory.id,
+            CashbackCategory.category_name,
+            CashbackCategory.year,
+            CashbackCategory.month,
+        ).join(Card, CashbackCategory.card_id == Card.id).join(Bank, Card.bank_id == Bank.id).filter(
+            Bank.user_id == user_id
+        ).all()
+        index = _UserIndex()
+        for row in rows:
+            index.add(row.id, row.category_name or "", row.year, row.month)
+
+        with self._lock:
+            if self._generations[user_id] == generation:
+                self._users[user_id] = index
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        return index
+
+    def search(self, db: Session, user_id: int, query: str, year: int, month: int) -> List[Tuple[int, float]]:
+        """Категории пользователя за период, похожие на запрос: [(id, релевантность)]"""
+        index = self._load(db, user_id)
+        with self._lock:
+            results = index.search(query, year, month, self.threshold)
+        if not results:
+            return []
+        # Если есть точные совпадения, слабые нечёткие не показываем;
+        # совпадения подстрокой остаются всегда, как при прежнем ILIKE
+        cutoff = results[0][1] * 0.75
+        return [(category_id, score) for category_id, score, infix in results if score >= cutoff or infix]
+
+    def update(self, user_id: int, category: CashbackCategory):
+        """Добавляет или обновляет категорию в построенном индексе"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                index.add(category.id, category.category_name or "", category.year, category.month)
+            else:
+                self._generations[user_id] += 1
+
+    def remove(self, user_id: int, category_id: int):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                index.remove(category_id)
+            else:
+                self._generations[user_id] += 1
+
+    def invalidate_user(self, user_id: int):
+        """Сбрасывает индекс пользователя (например, после удаления банка или карты)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._generations[user_id] += 1
+
+    def clear(self):
+        """Сбрасывает индексы всех пользователей (массовые изменения, например перенос месяца)"""
+        with self._lock:
+            self._users.clear()
+            for user_id in self._generations:
+                self._generations[user_id] += 1
+
+
+category_search = CategorySearchIndex(
+    max_users=int(os.getenv("SEARCH_INDEX_MAX_USERS", "1000")),
+    threshold=float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", "0.4")),
+)
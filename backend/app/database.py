@@ -1,30 +1,362 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, create_engine, event, inspect, text
+from sqlalchemy.orm import Session, sessionmaker
+from app.categories import make_category_key
 from app.models import Base
+import logging
 import os
+import threading
+
+logger = logging.getLogger(__name__)
 
 # Создание подключения к базе данных
 # Поддерживаем переменную окружения DATABASE_URL для удобства в контейнере
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cashback_optimizer.db")
 
+# Асинхронный режим: запросы эндпоинтов идут через AsyncEngine (aiosqlite / asyncpg)
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes", "on")
+
+
+def _pool_options(url: str) -> dict:
+    """Размеры пула соединений из переменных окружения"""
+    if url.startswith("sqlite") and ":memory:" in url:
+        # Для базы в памяти SQLAlchemy использует пул из одного соединения
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": not url.startswith("sqlite"),
+    }
+
+
+def _async_url(url: str) -> str:
+    """Адрес базы с асинхронным драйвером"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql://", "postgres://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+# Синхронный движок: инициализация, миграции и фоновые задачи.
 # Если используется sqlite, нужно передать connect_args
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = create_engine(
+        DATABASE_URL, connect_args={"check_same_thread": False}, **_pool_options(DATABASE_URL)
+    )
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **_pool_options(DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    ASYNC_DATABASE_URL = _async_url(DATABASE_URL)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options(ASYNC_DATABASE_URL))
+    # После commit объекты не перечитываются: ленивая загрузка в async-сессии невозможна
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# Профиль SQLite: WAL позволяет читать во время записи, остальные настройки -
+# меньше fsync, больше кеша и ожидание блокировки вместо "database is locked"
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+SQLITE_IN_MEMORY = IS_SQLITE and (":memory:" in DATABASE_URL or DATABASE_URL.rstrip("/") == "sqlite:")
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Отрицательное значение - размер в КиБ
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-32000")),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+}
+# Последовательная запись из синхронных сессий этого процесса
+SQLITE_WRITER_LOCK = IS_SQLITE and not SQLITE_IN_MEMORY and (
+    os.getenv("SQLITE_WRITER_LOCK", "1").lower() in ("1", "true", "yes", "on")
+)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Настройки SQLite для каждого нового соединения"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if name == "journal_mode" and SQLITE_IN_MEMORY:
+                continue
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    if async_engine is not None:
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+
+# SQLite допускает одного писателя: вместо борьбы за файловую блокировку
+# потоки ждут своей очереди на этой блокировке, а чтение идёт параллельно.
+# Блокировка берётся на первой записи и отпускается в конце транзакции, поэтому
+# запись с commit должна укладываться в один вызов ThreadedSession (add + commit
+# или run_sync(execute_and_commit, ...)): иначе она держалась бы между await,
+# пока ждущие её запросы занимают потоки пула, нужные владельцу для commit
+_writer_lock = threading.Lock()
+_WRITER_KEY = "sqlite_writer_lock"
+
+
+def _acquire_writer(session: Session):
+    if session.info.get(_WRITER_KEY):
+        return
+    # Не дольше busy_timeout: дальше ожидание берёт на себя сам SQLite
+    if _writer_lock.acquire(timeout=SQLITE_PRAGMAS["busy_timeout"] / 1000):
+        session.info[_WRITER_KEY] = True
+
+
+def _release_writer(session: Session) -> bool:
+    if session.info.pop(_WRITER_KEY, False):
+        _writer_lock.release()
+        return True
+    return False
+
+
+def _writer_before_flush(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        _acquire_writer(session)
+
+
+def _writer_before_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _acquire_writer(orm_execute_state.session)
+
+
+def _writer_transaction_end(session, transaction):
+    # Блокировка держится до конца внешней транзакции (commit, rollback или close)
+    if transaction.parent is None:
+        _release_writer(session)
+
+
+if SQLITE_WRITER_LOCK:
+    # Только синхронные сессии: блокировка потока в async-режиме остановила бы event loop
+    event.listen(SessionLocal, "before_flush", _writer_before_flush)
+    event.listen(SessionLocal, "do_orm_execute", _writer_before_execute)
+    event.listen(SessionLocal, "after_transaction_end", _writer_transaction_end)
+
+
+class ThreadedSession:
+    """
+    Синхронная сессия с интерфейсом AsyncSession. Каждый вызов выполняется
+    в пуле потоков, поэтому эндпоинты пишутся одинаково для обоих режимов.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def _call(self, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Блокировка писателя не переживает вызов: транзакция, оставленная
+            # открытой до следующего await, дальше ждёт уже только busy_timeout
+            if _release_writer(self.sync_session):
+                logger.warning("Write transaction left open after %s, use execute_and_commit", getattr(fn, "__name__", fn))
+
+    async def _run(self, fn, *args, **kwargs):
+        return await run_in_threadpool(self._call, fn, *args, **kwargs)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        # Строки выбираются сразу, чтобы чтение курсора не происходило в event loop
+        kwargs.setdefault("execution_options", {"prebuffer_rows": True})
+        return await self._run(self.sync_session.execute, statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await self._run(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        result = await self.execute(statement, params, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await self._run(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        await self._run(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await self._run(self.sync_session.flush)
+
+    async def commit(self):
+        await self._run(self.sync_session.commit)
+
+    async def rollback(self):
+        await self._run(self.sync_session.rollback)
+
+    async def refresh(self, instance, attribute_names=None):
+        await self._run(self.sync_session.refresh, instance, attribute_names)
+
+    async def close(self):
+        await self._run(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """fn(sync_session, *args) - для кода, написанного под синхронную сессию"""
+        return await self._run(fn, self.sync_session, *args, **kwargs)
+
+
+def execute_and_commit(session: Session, statements) -> list:
+    """
+    Выполняет запросы на изменение и фиксирует транзакцию одним вызовом
+    (через db.run_sync). Возвращает rowcount каждого запроса.
+    """
+    counts = [session.execute(statement).rowcount or 0 for statement in statements]
+    session.commit()
+    return counts
+
+
+def dialect_insert(model):
+    """INSERT с поддержкой ON CONFLICT для диалекта базы (SQLite или PostgreSQL)"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
 
 def init_db():
     """Инициализация базы данных"""
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+
+
+# Строки категорий, удалённые при объединении дубликатов
+DUPLICATES_TABLE = "cashback_categories_duplicates"
+
+
+def _merge_duplicate_categories(conn) -> int:
+    """
+    Объединяет категории одной карты с одним ключом за один месяц
+    ("Кешбек на АЗС" и "АЗС"): остаётся строка с большим процентом,
+    она получает признак постоянной категории и лимиты остальных строк,
+    если своих нет. Остальные строки копируются в DUPLICATES_TABLE и
+    удаляются. Возвращает число удалённых строк.
+    """
+    groups = conn.execute(text(
+        "SELECT card_id, category_key, year, month FROM cashback_categories "
+        "WHERE category_key IS NOT NULL "
+        "GROUP BY card_id, category_key, year, month HAVING COUNT(*) > 1"
+    )).all()
+    if not groups:
+        return 0
+    if not inspect(conn).has_table(DUPLICATES_TABLE):
+        conn.execute(text(f"CREATE TABLE {DUPLICATES_TABLE} AS SELECT * FROM cashback_categories WHERE 1 = 0"))
+
+    removed = 0
+    for group in groups:
+        rows = conn.execute(text(
+            "SELECT id, is_permanent, cashback_cap, min_spend FROM cashback_categories "
+            "WHERE card_id = :card_id AND category_key = :category_key AND year = :year AND month = :month "
+            "ORDER BY COALESCE(cashback_percent, 0) DESC, id DESC"
+        ), group._asdict()).all()
+        kept, duplicates = rows[0], rows[1:]
+        conn.execute(text(
+            "UPDATE cashback_categories SET is_permanent = :is_permanent, "
+            "cashback_cap = :cashback_cap, min_spend = :min_spend WHERE id = :id"
+        ), {
+            "id": kept.id,
+            "is_permanent": any(row.is_permanent for row in rows),
+            "cashback_cap": next((row.cashback_cap for row in rows if row.cashback_cap is not None), None),
+            "min_spend": next((row.min_spend for row in rows if row.min_spend is not None), None),
+        })
+        ids = {"ids": [row.id for row in duplicates]}
+        conn.execute(text(
+            f"INSERT INTO {DUPLICATES_TABLE} SELECT * FROM cashback_categories WHERE id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True)), ids)
+        conn.execute(text(
+            "DELETE FROM cashback_categories WHERE id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True)), ids)
+        removed += len(duplicates)
+    return removed
 
 
-def get_db():
-    """Dependency для получения сессии БД"""
-    db = SessionLocal()
+def migrate_db():
+    """
+    Обновление схемы существующей базы: create_all не меняет уже созданные
+    таблицы, поэтому новые колонки и индексы добавляются здесь.
+    """
+    inspector = inspect(engine)
+    added_columns = set()
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                ))
+                added_columns.add((table.name, column.name))
+                # Уже сохранённые строки получают значение по умолчанию из модели
+                if column.default is not None and column.default.is_scalar:
+                    conn.execute(
+                        table.update().where(column.is_(None)).values({column.name: column.default.arg})
+                    )
+
+        # Заполняем ключи категорий для уже сохранённых записей
+        if ("cashback_categories", "category_key") in added_columns:
+            rows = conn.execute(text(
+                "SELECT id, category_name FROM cashback_categories WHERE category_key IS NULL"
+            )).all()
+            if rows:
+                conn.execute(
+                    text("UPDATE cashback_categories SET category_key = :key WHERE id = :id"),
+                    [{"id": row.id, "key": make_category_key(row.category_name or "")} for row in rows]
+                )
+        
+        # Перед созданием уникального индекса объединяем дубликаты категорий
+        existing_indexes = {index["name"] for index in inspector.get_indexes("cashback_categories")}
+        if "ix_cashback_categories_card_key_period" not in existing_indexes:
+            merged = _merge_duplicate_categories(conn)
+            if merged:
+                logger.warning(
+                    "Merged %s duplicate cashback categories, removed rows are kept in %s",
+                    merged, DUPLICATES_TABLE
+                )
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+async def get_db():
+    """
+    Dependency для получения сессии БД: AsyncSession в режиме DB_ASYNC,
+    иначе синхронная сессия за ThreadedSession с тем же интерфейсом.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
+    db = ThreadedSession(SessionLocal(expire_on_commit=False))
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+
+async def dispose_engines():
+    """Закрывает соединения пулов при остановке приложения"""
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def _noop():
+    return None
+
+
+class PoolSaturatedError(Exception):
+    """Очередь пула заполнена, задача не принята"""
+
+
+class PoolBrokenError(Exception):
+    """Процесс пула аварийно завершился и при повторной попытке"""
+
+
+class BoundedProcessPool:
+    """
+    Пул процессов для CPU-тяжёлых задач с ограниченной очередью.
+
+    Задачи выполняются вне event loop, а число одновременно ожидающих
+    задач ограничено: сверх workers + queue_size новые задачи отклоняются
+    исключением PoolSaturatedError. Если процесс пула погиб (нехватка
+    памяти, падение tesseract), пул пересоздаётся, а задача повторяется
+    один раз. Пул также собирает статистику (длина очереди, время
+    выполнения задач) для подбора размеров.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        queue_size: int,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: Tuple = (),
+        latency_window: int = 200,
+    ):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._initializer = initializer
+        self._initargs = initargs
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._restarts = 0
+        self._latencies = deque(maxlen=latency_window)
+
+    @property
+    def capacity(self) -> int:
+        """Максимальное число задач в работе и в очереди"""
+        return self.workers + self.queue_size
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=self._initializer,
+                initargs=self._initargs,
+            )
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """Убирает сломанный пул; следующая задача создаст новый"""
+        if self._executor is executor:
+            self._executor = None
+            self._restarts += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+
+    def start(self):
+        """Заранее запускает процессы пула, чтобы первый запрос не ждал инициализации"""
+        self._get_executor().submit(_noop)
+
+    def has_capacity(self, jobs: int = 1) -> bool:
+        """Проверка, что пул примет ещё jobs задач"""
+        return self._pending + jobs <= self.capacity
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет fn(*args) в пуле процессов, не блокируя event loop"""
+        if not self.has_capacity():
+            self._rejected += 1
+            raise PoolSaturatedError(f"{self.name} queue is full")
+
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            try:
+                result = await self._submit(fn, *args)
+            except BrokenProcessPool:
+                # Задачу мог погубить чужой сбой: повторяем в новом пуле один раз
+                try:
+                    result = await self._submit(fn, *args)
+                except BrokenProcessPool as e:
+                    raise PoolBrokenError(f"{self.name} worker crashed") from e
+        except Exception:
+            self._failed += 1
+            raise
+        else:
+            self._completed += 1
+            return result
+        finally:
+            self._pending -= 1
+            self._latencies.append(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущая загрузка пула и задержки последних задач"""
+        latencies = sorted(self._latencies)
+        latency_ms = {"last": None, "avg": None, "p95": None, "max": None}
+        if latencies:
+            latency_ms = {
+                "last": round(self._latencies[-1] * 1000, 1),
+                "avg": round(sum(latencies) / len(latencies) * 1000, 1),
+                "p95": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1),
+            }
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "running": min(self._pending, self.workers),
+            "queued": max(0, self._pending - self.workers),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "restarts": self._restarts,
+            "latency_ms": latency_ms,
+        }
+
+    def shutdown(self):
+        """Останавливает процессы пула"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
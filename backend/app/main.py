@@ -1,7 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from app.database import init_db
+from app.database import dispose_engines, init_db
+from app.merchants import merchant_directory
+from app.passwords import hash_pool
+from app.rollover import rollover_scheduler
 from app.routers import banks, cashback, ocr, auth
 
 # Инициализация приложения
@@ -36,6 +39,21 @@ app.include_router(ocr.router)
 async def startup_event():
     """Инициализация базы данных при запуске"""
     init_db()
+    merchant_directory.load()
+    ocr.ocr_pool.start()
+    hash_pool.start()
+    await ocr.job_queue.start()
+    rollover_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановка фоновых задач и пулов процессов"""
+    await rollover_scheduler.stop()
+    await ocr.job_queue.stop()
+    ocr.ocr_pool.shutdown()
+    hash_pool.shutdown()
+    await dispose_engines()
 
 
 @app.get("/")
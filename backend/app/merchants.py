@@ -0,0 +1,216 @@
+"""
+Определение категории кешбека по названию магазина.
+
+Общий справочник магазинов лежит в app/data/merchants.json и загружается
+при запуске, пользователь может дополнить его своими магазинами. Названия
+собираются в автомат Ахо-Корасик: точное название находится одним проходом
+по бору, а все названия внутри описания операции ("Оплата ПЯТЕРОЧКА 1234")
+- одним проходом по тексту независимо от размера справочника. Из
+совпадений побеждает самое левое, а из них - самое длинное ("Яндекс Такси"
+важнее, чем "Такси").
+"""
+import json
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.categories import normalize_category_name
+from app.models import UserMerchant
+
+MERCHANTS_FILE = os.getenv(
+    "MERCHANTS_FILE", os.path.join(os.path.dirname(__file__), "data", "merchants.json")
+)
+
+
+def normalize_merchant(name: str) -> str:
+    """Нижний регистр, ё -> е, одиночные пробелы"""
+    return normalize_category_name(name)
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def load_merchant_file(path: str = MERCHANTS_FILE) -> List[Tuple[str, str]]:
+    """Пары (магазин, категория) из файла {"категория": ["магазин", ...]}"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [(name, category) for category, names in data.items() for name in names]
+
+
+class MerchantMatch(NamedTuple):
+    category: str
+    merchant: str  # нормализованное название из справочника
+    start: int
+    end: int
+
+
+class MerchantIndex:
+    """Автомат Ахо-Корасик по названиям магазинов"""
+
+    def __init__(self, merchants: Iterable[Tuple[str, str]]):
+        # Узлы бора: переходы, ссылка на самый длинный собственный суффикс,
+        # номер названия, которое заканчивается в узле, и ссылка на ближайший
+        # суффикс, который тоже является названием
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._word: List[int] = [-1]
+        self._next_word: List[int] = [-1]
+        self._names: List[str] = []
+        self._categories: List[str] = []
+
+        for name, category in merchants:
+            key = normalize_merchant(name)
+            if not key:
+                continue
+            node = 0
+            for char in key:
+                child = self._goto[node].get(char)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][char] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._word.append(-1)
+                    self._next_word.append(-1)
+                node = child
+            # При повторе названия остаётся первая категория
+            if self._word[node] < 0:
+                self._word[node] = len(self._names)
+                self._names.append(key)
+                self._categories.append(category)
+        self._max_length = max((len(name) for name in self._names), default=0)
+        self._build_links()
+
+    def _build_links(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                self._next_word[child] = fail if self._word[fail] >= 0 else self._next_word[fail]
+                queue.append(child)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def lookup(self, name: str) -> Optional[MerchantMatch]:
+        """Магазин с точно таким названием (без учёта регистра и ё)"""
+        key = normalize_merchant(name)
+        node = 0
+        for char in key:
+            node = self._goto[node].get(char)
+            if node is None:
+                return None
+        word = self._word[node]
+        if word < 0:
+            return None
+        return MerchantMatch(self._categories[word], self._names[word], 0, len(key))
+
+    def find(self, text: str) -> Optional[MerchantMatch]:
+        """Самый левый (при равенстве - самый длинный) магазин, названный в тексте отдельным словом"""
+        text = normalize_merchant(text)
+        best: Optional[MerchantMatch] = None
+        node = 0
+        for end, char in enumerate(text, 1):
+            # Дальше начинаются только совпадения правее уже найденного
+            if best is not None and end - best.start > self._max_length:
+                break
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            if end < len(text) and _is_word_char(text[end]):
+                continue
+            word_node = node if self._word[node] >= 0 else self._next_word[node]
+            while word_node >= 0:
+                word = self._word[word_node]
+                start = end - len(self._names[word])
+                if start == 0 or not _is_word_char(text[start - 1]):
+                    if best is None or start < best.start or (start == best.start and end > best.end):
+                        best = MerchantMatch(self._categories[word], self._names[word], start, end)
+                word_node = self._next_word[word_node]
+        return best
+
+
+class MerchantDirectory:
+    """
+    Общий справочник магазинов и справочники пользователей.
+
+    Индексы пользователей строятся при первом обращении и хранятся
+    с вытеснением давно не использованных (LRU), как таблицы рекомендаций.
+    """
+
+    def __init__(self, path: str = MERCHANTS_FILE, max_users: int = 1000):
+        self.path = path
+        self.max_users = max(1, max_users)
+        self._global: Optional[MerchantIndex] = None
+        self._users: "OrderedDict[int, MerchantIndex]" = OrderedDict()
+        # Поколение справочника пользователя: защищает от сохранения устаревшего индекса
+        self._generations: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Загружает общий справочник (при запуске приложения)"""
+        index = MerchantIndex(load_merchant_file(self.path))
+        with self._lock:
+            self._global = index
+
+    @property
+    def global_index(self) -> MerchantIndex:
+        if self._global is None:
+            self.load()
+        return self._global
+
+    def user_index(self, db: Session, user_id: int) -> MerchantIndex:
+        """Индекс магазинов пользователя; строится при первом обращении"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                self._users.move_to_end(user_id)
+                return index
+            generation = self._generations[user_id]
+
+        rows = db.execute(
+            select(UserMerchant.name, UserMerchant.category_name).where(UserMerchant.user_id == user_id)
+        ).all()
+        index = MerchantIndex((row.name, row.category_name) for row in rows)
+
+        with self._lock:
+            if self._generations[user_id] == generation:
+                self._users[user_id] = index
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        return index
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._generations[user_id] += 1
+            self._users.pop(user_id, None)
+
+    def resolve(self, name: str, user_index: Optional[MerchantIndex] = None) -> Tuple[Optional[MerchantMatch], Optional[str]]:
+        """
+        Магазин и источник (user или dictionary): сначала точное название,
+        затем название внутри текста; справочник пользователя важнее общего.
+        """
+        indexes = [(self.global_index, "dictionary")]
+        if user_index is not None and len(user_index):
+            indexes.insert(0, (user_index, "user"))
+        for method in ("lookup", "find"):
+            for index, source in indexes:
+                match = getattr(index, method)(name)
+                if match is not None:
+                    return match, source
+        return None, None
+
+    def classify(self, description: str, user_index: Optional[MerchantIndex] = None) -> Optional[str]:
+        """Категория магазина из описания операции"""
+        match, _ = self.resolve(description, user_index)
+        return match.category if match else None
+
+
+merchant_directory = MerchantDirectory(max_users=int(os.getenv("MERCHANT_CACHE_MAX_USERS", "1000")))
@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, Boolean, create_engine
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Boolean, Text, Index, create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import relationship, sessionmaker, validates
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
+from app.categories import make_category_key, normalize_category_name
 
 Base = declarative_base()
 
@@ -18,6 +19,8 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     
     banks = relationship("Bank", back_populates="user", cascade="all, delete-orphan")
+    merchants = relationship("UserMerchant", cascade="all, delete-orphan")
+    rollovers = relationship("CategoryRollover", cascade="all, delete-orphan")
 
 
 class Bank(Base):
@@ -25,7 +28,7 @@ class Bank(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     
     user = relationship("User", back_populates="banks")
     cards = relationship("Card", back_populates="bank", cascade="all, delete-orphan")
@@ -36,8 +39,10 @@ class Card(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    bank_id = Column(Integer, ForeignKey("banks.id"))
+    bank_id = Column(Integer, ForeignKey("banks.id"), index=True)
     card_type = Column(String)  # Visa, MasterCard, etc.
+    monthly_cashback_cap = Column(Float)  # максимум кешбека по карте за месяц (None - без лимита)
+    min_monthly_spend = Column(Float)  # кешбек начисляется при тратах по карте от этой суммы
     
     bank = relationship("Bank", back_populates="cards")
     cashback_categories = relationship("CashbackCategory", back_populates="card", cascade="all, delete-orphan")
@@ -45,16 +50,79 @@ class Card(Base):
 
 class CashbackCategory(Base):
     __tablename__ = "cashback_categories"
+    __table_args__ = (
+        # Категории карты за период (дерево банков, перенос на следующий месяц)
+        Index("ix_cashback_categories_card_period", "card_id", "year", "month"),
+        # Поиск категории за период (рекомендации)
+        Index("ix_cashback_categories_period_key", "year", "month", "category_key"),
+        # Одна категория с таким ключом на карте за месяц (upsert при сохранении)
+        Index("ix_cashback_categories_card_key_period", "card_id", "category_key", "year", "month", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     category_name = Column(String, index=True)
+    category_key = Column(String)  # нормализованное название, см. make_category_key
     cashback_percent = Column(Float)
     card_id = Column(Integer, ForeignKey("cards.id"))
     month = Column(Integer)  # 1-12
     year = Column(Integer, default=datetime.now().year)
     icon = Column(String, default="shopping_cart")  # Название иконки из Material-UI
+    is_permanent = Column(Boolean, default=False)  # переносится на следующий месяц автоматически
+    cashback_cap = Column(Float)  # максимум кешбека в категории за месяц (None - без лимита)
+    min_spend = Column(Float)  # кешбек в категории начисляется при тратах от этой суммы
     
     card = relationship("Card", back_populates="cashback_categories")
+    
+    @validates("category_name")
+    def _update_category_key(self, key, value):
+        """Ключ категории пересчитывается при каждой записи названия"""
+        self.category_key = make_category_key(value) if value else None
+        return value
+
+
+class UserMerchant(Base):
+    """Магазин из справочника пользователя (дополняет общий справочник app/data/merchants.json)"""
+    __tablename__ = "user_merchants"
+    __table_args__ = (
+        Index("ix_user_merchants_user_name", "user_id", "name_key", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    name = Column(String)
+    name_key = Column(String)  # нормализованное название, см. normalize_category_name
+    category_name = Column(String)
+    
+    @validates("name")
+    def _update_name_key(self, key, value):
+        self.name_key = normalize_category_name(value) if value else None
+        return value
+
+
+class CategoryRollover(Base):
+    """Отметка, что постоянные категории пользователя уже перенесены на месяц"""
+    __tablename__ = "category_rollovers"
+    __table_args__ = (
+        Index("ix_category_rollovers_user_period", "user_id", "year", "month", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    year = Column(Integer)
+    month = Column(Integer)
+    rolled_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OCRJob(Base):
+    __tablename__ = "ocr_jobs"
+    
+    id = Column(String, primary_key=True, index=True)  # uuid4 hex
+    image_hash = Column(String, unique=True, index=True)  # ключ кеша OCR: sha256 файла и настроек
+    status = Column(String, default="pending")  # pending, processing, done, failed
+    result = Column(Text, nullable=True)  # JSON со списком категорий
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
 
 
 # Pydantic Models (для API)
@@ -86,6 +154,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    user_id: Optional[int] = None
+    expires_at: Optional[float] = None
 
 
 class BankCreate(BaseModel):
@@ -107,11 +177,16 @@ class BankResponse(BaseModel):
 class CardCreate(BaseModel):
     name: str
     card_type: Optional[str] = "Unknown"
+    monthly_cashback_cap: Optional[float] = None
+    min_monthly_spend: Optional[float] = None
 
 
 class CardUpdate(BaseModel):
     name: Optional[str] = None
     card_type: Optional[str] = None
+    # Лимиты сбрасываются явным null
+    monthly_cashback_cap: Optional[float] = None
+    min_monthly_spend: Optional[float] = None
 
 
 class CardResponse(BaseModel):
@@ -119,6 +194,8 @@ class CardResponse(BaseModel):
     name: str
     bank_id: int
     card_type: Optional[str] = None
+    monthly_cashback_cap: Optional[float] = None
+    min_monthly_spend: Optional[float] = None
     
     class Config:
         from_attributes = True
@@ -130,6 +207,9 @@ class CashbackCategoryCreate(BaseModel):
     month: int = datetime.now().month
     year: int = datetime.now().year
     icon: Optional[str] = "shopping_cart"
+    is_permanent: bool = False
+    cashback_cap: Optional[float] = None
+    min_spend: Optional[float] = None
 
 
 class CashbackCategoryUpdate(BaseModel):
@@ -138,6 +218,14 @@ class CashbackCategoryUpdate(BaseModel):
     month: Optional[int] = None
     year: Optional[int] = None
     icon: Optional[str] = None
+    is_permanent: Optional[bool] = None
+    # Лимиты сбрасываются явным null
+    cashback_cap: Optional[float] = None
+    min_spend: Optional[float] = None
+
+
+class CashbackCategoryBulkCreate(BaseModel):
+    categories: List[CashbackCategoryCreate]
 
 
 class CashbackCategoryResponse(BaseModel):
@@ -148,11 +236,29 @@ class CashbackCategoryResponse(BaseModel):
     month: int
     year: int
     icon: str = "shopping_cart"
+    is_permanent: bool = False
+    cashback_cap: Optional[float] = None
+    min_spend: Optional[float] = None
     
     class Config:
         from_attributes = True
 
 
+class RolloverRequest(BaseModel):
+    # Месяц, категории которого копируются на следующий
+    month: int
+    year: int
+    card_id: Optional[int] = None
+    bank_id: Optional[int] = None
+    permanent_only: bool = False
+
+
+class RolloverResponse(BaseModel):
+    copied: int
+    month: int
+    year: int
+
+
 class CardWithCashback(CardResponse):
     cashback_categories: List[CashbackCategoryResponse] = []
 
@@ -169,9 +275,215 @@ class RecommendationResponse(BaseModel):
         from_attributes = True
 
 
+class OptimalCard(BaseModel):
+    card_id: int
+    card_name: str
+    bank_name: str
+    category_id: int
+    cashback_percent: float
+
+
+class OptimalCategory(BaseModel):
+    category_key: str
+    category_name: str
+    icon: str = "shopping_cart"
+    cards: List[OptimalCard]  # от большего кешбека к меньшему
+
+
+class OptimalCardsResponse(BaseModel):
+    month: int
+    year: int
+    categories: List[OptimalCategory]
+
+
+class CategoryStatistics(BaseModel):
+    category_key: str
+    category_name: str
+    cards: int
+    max_percent: float
+    avg_percent: float
+    best_card_id: int
+    best_card_name: str
+    best_bank_name: str
+
+
+class CardStatistics(BaseModel):
+    card_id: int
+    card_name: str
+    bank_id: int
+    categories: int
+    max_percent: Optional[float] = None
+    avg_percent: Optional[float] = None
+
+
+class BankStatistics(BaseModel):
+    bank_id: int
+    bank_name: str
+    cards: int
+    cards_with_categories: int
+    categories: int
+    coverage: float  # доля всех категорий месяца, которые покрывает банк
+    max_percent: Optional[float] = None
+    avg_percent: Optional[float] = None
+
+
+class StatisticsTotals(BaseModel):
+    categories: int
+    unique_categories: int
+    cards_with_categories: int
+    banks_with_categories: int
+    max_percent: Optional[float] = None
+    avg_percent: Optional[float] = None
+
+
+class StatisticsPeriod(BaseModel):
+    year: int
+    month: int
+    categories: int
+
+
+class StatisticsResponse(BaseModel):
+    year: int
+    month: int
+    totals: StatisticsTotals
+    categories: List[CategoryStatistics]
+    cards: List[CardStatistics]
+    banks: List[BankStatistics]
+    periods: List[StatisticsPeriod]
+
+
+class OptimizeRequest(BaseModel):
+    # Траты за месяц: название категории -> сумма
+    spend: Dict[str, float]
+    month: Optional[int] = None
+    year: Optional[int] = None
+
+
+class SpendAllocation(BaseModel):
+    category_name: str  # как в запросе
+    card_id: int
+    card_name: str
+    bank_name: str
+    amount: float
+    cashback_percent: float
+    cashback: float
+
+
+class CardAllocationSummary(BaseModel):
+    card_id: int
+    card_name: str
+    bank_name: str
+    spend: float
+    cashback: float
+    monthly_cashback_cap: Optional[float] = None
+    min_monthly_spend: Optional[float] = None
+
+
+class UnallocatedSpend(BaseModel):
+    category_name: str
+    amount: float
+    reason: str  # no_card - нет карты с такой категорией, no_cashback - лимиты или пороги не позволяют получить кешбек
+
+
+class OptimizeResponse(BaseModel):
+    month: int
+    year: int
+    total_spend: float
+    total_cashback: float
+    allocations: List[SpendAllocation]
+    cards: List[CardAllocationSummary]
+    unallocated: List[UnallocatedSpend]
+    excluded_cards: List[int]  # карты, по которым не набирается минимальная сумма трат
+
+
+class OfferedCategory(BaseModel):
+    # Как в результатах распознавания скриншота
+    category_name: str
+    cashback_percent: float
+    icon: Optional[str] = None
+    cashback_cap: Optional[float] = None
+
+
+class CategoryChoice(BaseModel):
+    card_id: int
+    choose: int  # сколько категорий банк разрешает выбрать
+    offered: List[OfferedCategory]
+
+
+class SelectionPlanRequest(BaseModel):
+    choose: int
+    offered: List[OfferedCategory]
+    # Траты за месяц: название категории -> сумма
+    spend: Dict[str, float]
+    month: Optional[int] = None
+    year: Optional[int] = None
+
+
+class SelectionPlanBatchRequest(BaseModel):
+    cards: List[CategoryChoice]
+    spend: Dict[str, float]
+    month: Optional[int] = None
+    year: Optional[int] = None
+
+
+class PlannedCategory(BaseModel):
+    category_name: str
+    cashback_percent: float
+    icon: str
+    spend_category: Optional[str] = None  # категория трат из запроса
+    expected_cashback: float
+
+
+class CardSelectionPlan(BaseModel):
+    card_id: int
+    card_name: str
+    selected: List[PlannedCategory]
+    gain: float  # прирост кешбека, если выбор сделает только эта карта
+
+
+class SelectionPlanResponse(BaseModel):
+    month: int
+    year: int
+    cards: List[CardSelectionPlan]
+    total_cashback: float
+    baseline_cashback: float  # кешбек по уже выбранным категориям других карт
+    gain: float
+    optimal: bool  # false - перебор остановлен по лимиту, выбор может быть не лучшим
+
+
+class UserMerchantCreate(BaseModel):
+    name: str  # как в описании операции или на кассе ("Пятёрочка")
+    category_name: str
+
+
+class UserMerchantResponse(BaseModel):
+    id: int
+    name: str
+    category_name: str
+    
+    class Config:
+        from_attributes = True
+
+
+class MerchantRecommendationResponse(BaseModel):
+    merchant: str
+    category: Optional[str] = None  # категория, к которой относится магазин
+    source: Optional[str] = None  # user - справочник пользователя, dictionary - общий справочник
+    recommendations: List[dict]  # как в RecommendationResponse
+
+
 class OCRRequest(BaseModel):
     image_base64: str  # base64 encoded image
 
 
 class OCRResponse(BaseModel):
     categories: List[dict]  # {"category_name": str, "cashback_percent": float}
+
+
+class OCRJobResponse(BaseModel):
+    id: str
+    status: str  # pending, processing, done, failed
+    categories: Optional[List[dict]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,113 @@
+"""
+Кеш результатов OCR.
+
+Ключ - sha256 от настроек распознавания и байтов изображения, поэтому
+повторная загрузка того же скриншота не запускает Tesseract. Записи
+хранятся в памяти (LRU) и, если задан каталог, дублируются на диск,
+чтобы кеш переживал перезапуск сервера.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class OCRResultCache:
+    """LRU-кеш распознанных категорий с необязательным дисковым уровнем"""
+
+    def __init__(self, max_entries: int, disk_dir: Optional[str] = None, max_disk_entries: int = 0):
+        self.max_entries = max(0, max_entries)
+        self.disk_dir = disk_dir or None
+        self.max_disk_entries = max(0, max_disk_entries)
+        self._entries: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, settings: str) -> str:
+        """Ключ кеша: хеш изображения вместе с настройками OCR"""
+        digest = hashlib.sha256(settings.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key: str, categories: List[Dict]):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = categories
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """Возвращает категории из кеша или None"""
+        categories = self._entries.get(key)
+        if categories is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return categories
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    categories = json.load(f)
+                # Обновляем время доступа для вытеснения старых файлов
+                os.utime(self._disk_path(key))
+            except (OSError, ValueError):
+                categories = None
+            if categories is not None:
+                self._remember(key, categories)
+                self.disk_hits += 1
+                return categories
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, categories: List[Dict]):
+        """Сохраняет результат распознавания"""
+        self._remember(key, categories)
+        if not self.disk_dir:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(categories, f, ensure_ascii=False)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            return
+        self._disk_writes += 1
+        if self.max_disk_entries and self._disk_writes % 50 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Удаляет самые старые файлы сверх лимита дискового кеша"""
+        try:
+            paths = [
+                os.path.join(self.disk_dir, name)
+                for name in os.listdir(self.disk_dir)
+                if name.endswith(".json")
+            ]
+            if len(paths) <= self.max_disk_entries:
+                return
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:len(paths) - self.max_disk_entries]:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_dir": self.disk_dir,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
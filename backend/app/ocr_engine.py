@@ -0,0 +1,229 @@
+"""
+Распознавание текста на скриншотах.
+
+Функции этого модуля выполняются в процессах OCR-пула,
+поэтому они не зависят от FastAPI и базы данных.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+from PIL import Image, ImageEnhance, ImageOps
+import pytesseract
+import io
+import os
+
+
+class OCREngineUnavailable(RuntimeError):
+    """Tesseract OCR не установлен"""
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class PreprocessSettings:
+    """
+    Настройки подготовки изображения перед OCR.
+
+    Время работы Tesseract растёт с числом пикселей, а скриншоты телефонов
+    сняты с плотностью ~460 DPI, тогда как для распознавания хватает ~300.
+    """
+    grayscale: bool = True
+    # Плотность, к которой уменьшается изображение (0 - не уменьшать)
+    target_dpi: int = 300
+    # Плотность скриншота. DPI из файла не используется: экспорт PNG
+    # обычно записывает 72 или 96, и тогда изображение не уменьшалось бы
+    source_dpi: int = 460
+    # Усиление контраста (1.0 - без изменений)
+    contrast: float = 2.0
+    # Порог бинаризации: 0 - выключена, -1 - автоматический (метод Оцу)
+    binarize_threshold: int = -1
+    # Обрезка полей вокруг текста
+    autocrop: bool = True
+
+    @classmethod
+    def from_env(cls) -> "PreprocessSettings":
+        return cls(
+            grayscale=_env_bool("OCR_GRAYSCALE", "1"),
+            target_dpi=int(os.getenv("OCR_TARGET_DPI", "300")),
+            source_dpi=int(os.getenv("OCR_SOURCE_DPI", "460")),
+            contrast=float(os.getenv("OCR_CONTRAST", "2.0")),
+            binarize_threshold=int(os.getenv("OCR_BINARIZE_THRESHOLD", "-1")),
+            autocrop=_env_bool("OCR_AUTOCROP", "1"),
+        )
+
+    def cache_key(self) -> str:
+        """Строка настроек для ключа кеша результатов"""
+        return (
+            f"gray={int(self.grayscale)};dpi={self.target_dpi}/{self.source_dpi};"
+            f"contrast={self.contrast};bin={self.binarize_threshold};crop={int(self.autocrop)}"
+        )
+
+
+def _otsu_threshold(image: Image.Image) -> int:
+    """Порог бинаризации по гистограмме (метод Оцу)"""
+    histogram = image.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = 0
+    weight_background = 0
+    best_threshold = 127
+    best_variance = 0.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = threshold
+    return best_threshold
+
+
+def preprocess_image(image: Image.Image, settings: PreprocessSettings) -> Image.Image:
+    """Подготовка скриншота: оттенки серого, уменьшение, контраст, бинаризация, обрезка"""
+    image = ImageOps.exif_transpose(image)
+
+    if settings.grayscale or settings.binarize_threshold:
+        image = image.convert('L')
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # Уменьшаем изображение до целевой плотности
+    if settings.target_dpi:
+        scale = settings.target_dpi / float(settings.source_dpi)
+        if scale < 1:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.LANCZOS)
+
+    if settings.contrast and settings.contrast != 1.0:
+        image = ImageEnhance.Contrast(image).enhance(settings.contrast)
+
+    if settings.binarize_threshold:
+        # Тёмная тема: переводим в тёмный текст на светлом фоне
+        histogram = image.histogram()
+        mean = sum(i * count for i, count in enumerate(histogram)) / max(1, sum(histogram))
+        if mean < 128:
+            image = ImageOps.invert(image)
+        threshold = settings.binarize_threshold
+        if threshold < 0:
+            threshold = _otsu_threshold(image)
+        image = image.point(lambda value: 255 if value > threshold else 0)
+
+    if settings.autocrop:
+        # Границы текста: всё, что заметно темнее фона
+        mask = ImageOps.invert(image.convert('L')).point(lambda value: 255 if value > 64 else 0)
+        bbox = mask.getbbox()
+        if bbox:
+            margin = 10
+            image = image.crop((
+                max(0, bbox[0] - margin),
+                max(0, bbox[1] - margin),
+                min(image.width, bbox[2] + margin),
+                min(image.height, bbox[3] + margin),
+            ))
+
+    return image
+
+
+class OCRBackend(ABC):
+    """Движок распознавания, который живёт всё время работы процесса"""
+
+    name = "base"
+
+    def __init__(self, lang: str):
+        self.lang = lang
+
+    @abstractmethod
+    def image_to_text(self, image: Image.Image) -> str:
+        """Распознаёт текст на подготовленном изображении"""
+
+
+class TesserocrBackend(OCRBackend):
+    """Tesseract через C API: модель языка загружается один раз на процесс"""
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str):
+        super().__init__(lang)
+        import tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def image_to_text(self, image: Image.Image) -> str:
+        self._api.SetImage(image)
+        return self._api.GetUTF8Text()
+
+
+class PytesseractBackend(OCRBackend):
+    """Запасной вариант: запуск процесса tesseract на каждое изображение"""
+
+    name = "pytesseract"
+
+    def image_to_text(self, image: Image.Image) -> str:
+        return pytesseract.image_to_string(image, lang=self.lang)
+
+
+def resolve_languages(requested: str, available) -> str:
+    """Оставляет только установленные языки, по умолчанию - английский"""
+    languages = [lang for lang in requested.split('+') if lang in available]
+    return '+'.join(languages) if languages else 'eng'
+
+
+def create_backend(engine: str = "auto", lang: str = "rus+eng") -> OCRBackend:
+    """
+    Создаёт движок OCR. Доступные языки определяются один раз,
+    а не перехватом ошибок на каждом запросе.
+    """
+    if engine in ("auto", "tesserocr"):
+        try:
+            import tesserocr
+            _, available = tesserocr.get_languages()
+            return TesserocrBackend(resolve_languages(lang, available))
+        except (ImportError, RuntimeError):
+            if engine == "tesserocr":
+                raise
+
+    try:
+        available = pytesseract.get_languages()
+    except pytesseract.TesseractNotFoundError as e:
+        raise OCREngineUnavailable(str(e))
+    return PytesseractBackend(resolve_languages(lang, available))
+
+
+# Движок текущего процесса OCR-пула
+_backend: Optional[OCRBackend] = None
+_backend_error: Optional[str] = None
+
+
+def init_worker(engine: str = "auto", lang: str = "rus+eng"):
+    """Инициализатор процесса пула: поднимает движок заранее, до первого запроса"""
+    global _backend, _backend_error
+    try:
+        _backend = create_backend(engine, lang)
+        _backend_error = None
+    except Exception as e:
+        # Ошибка в инициализаторе сломала бы весь пул, поэтому сообщаем о ней при распознавании
+        _backend = None
+        _backend_error = str(e)
+
+
+def recognize_text(image_bytes: bytes, settings: PreprocessSettings) -> str:
+    """Открывает изображение, подготавливает его и распознаёт текст"""
+    if _backend is None and _backend_error is None:
+        init_worker(os.getenv("OCR_ENGINE", "auto"), os.getenv("OCR_LANG", "rus+eng"))
+    if _backend is None:
+        raise OCREngineUnavailable(_backend_error)
+
+    image = preprocess_image(Image.open(io.BytesIO(image_bytes)), settings)
+    try:
+        return _backend.image_to_text(image)
+    except pytesseract.TesseractNotFoundError as e:
+        # Исключение pytesseract не переживает передачу между процессами
+        raise OCREngineUnavailable(str(e))
@@ -0,0 +1,193 @@
+"""
+Очередь фоновых OCR-задач.
+
+Задачи хранятся в таблице ocr_jobs, а загруженные изображения - на диске
+до окончания обработки, поэтому незавершённые задачи переживают перезапуск
+сервера. Повторная загрузка того же файла возвращает существующую задачу.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.executors import PoolSaturatedError
+from app.models import OCRJob, OCRJobResponse
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+JOBS_DIR = os.path.join(UPLOAD_DIR, "ocr_jobs")
+
+# Пауза перед повторной попыткой, если OCR-пул занят интерактивными загрузками
+RETRY_DELAY_SECONDS = 1.0
+
+
+def _image_path(image_hash: str) -> str:
+    return os.path.join(JOBS_DIR, image_hash)
+
+
+def job_to_response(job: OCRJob) -> OCRJobResponse:
+    """Преобразует задачу из БД в ответ API"""
+    return OCRJobResponse(
+        id=job.id,
+        status=job.status,
+        categories=json.loads(job.result) if job.result else None,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
+
+def submit_job(db: Session, image_hash: str, image_bytes: bytes) -> Tuple[OCRJob, bool]:
+    """
+    Создаёт задачу для изображения.
+    Возвращает задачу и флаг, нужно ли ставить её в очередь.
+    """
+    job = db.query(OCRJob).filter(OCRJob.image_hash == image_hash).first()
+    if job and job.status != "failed":
+        return job, False
+
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    with open(_image_path(image_hash), "wb") as f:
+        f.write(image_bytes)
+
+    if job:
+        # Повторяем упавшую задачу
+        job.status = "pending"
+        job.result = None
+        job.error = None
+        job.finished_at = None
+    else:
+        job = OCRJob(id=uuid.uuid4().hex, image_hash=image_hash, status="pending")
+        db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Тот же файл одновременно загрузили дважды
+        db.rollback()
+        return db.query(OCRJob).filter(OCRJob.image_hash == image_hash).first(), False
+    db.refresh(job)
+    return job, True
+
+
+def _take_job(job_id: str) -> Optional[bytes]:
+    """Помечает задачу как выполняемую и читает изображение"""
+    db = SessionLocal()
+    try:
+        job = db.query(OCRJob).filter(OCRJob.id == job_id).first()
+        if not job or job.status == "done":
+            return None
+        try:
+            with open(_image_path(job.image_hash), "rb") as f:
+                image_bytes = f.read()
+        except OSError:
+            job.status = "failed"
+            job.error = "Uploaded image is missing"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            return None
+        job.status = "processing"
+        db.commit()
+        return image_bytes
+    finally:
+        db.close()
+
+
+def _finish_job(job_id: str, categories: Optional[List[Dict]], error: Optional[str]):
+    """Сохраняет результат задачи и удаляет изображение"""
+    db = SessionLocal()
+    try:
+        job = db.query(OCRJob).filter(OCRJob.id == job_id).first()
+        if not job:
+            return
+        if error is None:
+            job.status = "done"
+            job.result = json.dumps(categories, ensure_ascii=False)
+        else:
+            job.status = "failed"
+            job.error = error
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        if error is None:
+            try:
+                os.remove(_image_path(job.image_hash))
+            except OSError:
+                pass
+    finally:
+        db.close()
+
+
+def _unfinished_job_ids() -> List[str]:
+    db = SessionLocal()
+    try:
+        rows = db.query(OCRJob.id).filter(
+            OCRJob.status.in_(("pending", "processing"))
+        ).order_by(OCRJob.created_at).all()
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+
+class OCRJobQueue:
+    """Диспетчер фоновых OCR-задач"""
+
+    def __init__(self, handler: Callable[[bytes], Awaitable[List[Dict]]], workers: int):
+        self._handler = handler
+        self._workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """Запускает обработчики и возвращает в очередь незавершённые задачи"""
+        self._queue = asyncio.Queue()
+        for job_id in await run_in_threadpool(_unfinished_job_ids):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, job_id: str):
+        self._queue.put_nowait(job_id)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._process(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("OCR job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job_id: str):
+        image_bytes = await run_in_threadpool(_take_job, job_id)
+        if image_bytes is None:
+            return
+
+        while True:
+            try:
+                categories = await self._handler(image_bytes)
+            except PoolSaturatedError:
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                continue
+            except Exception as e:
+                await run_in_threadpool(_finish_job, job_id, None, f"Error processing image: {str(e)}")
+                return
+            break
+
+        await run_in_threadpool(_finish_job, job_id, categories, None)
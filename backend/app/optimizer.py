@@ -0,0 +1,407 @@
+"""
+Распределение трат месяца по картам с максимальным кешбеком.
+
+С лимитами кешбека категорий и карт это задача линейного программирования:
+трата категории делится между картами, кешбек карты не больше её лимита.
+Сначала каждая категория уходит на карты с наибольшим процентом; если так
+не превышен ни один лимит карты, распределение уже оптимально. Иначе
+категории, которые можно оплатить картами с лимитом, распределяются
+симплекс-методом. Жадное распределение по убыванию процента здесь не
+подходит: категория с большим процентом может исчерпать лимит карты,
+нужной категории, у которой других карт нет.
+
+Пороги трат (по категории и по карте) в задачу не входят: трата категории
+добирается до порога остатком этой категории, минимальная сумма по карте -
+остатками трат, которые уже не приносят кешбек. Вариант или карта, порог
+которых не набирается, исключается, и распределение пересчитывается.
+"""
+from collections import defaultdict
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+from app.recommendations import RecommendationRow, RecommendationTable
+
+_INF = float("inf")
+# Суммы меньше копейки считаем нулём
+_EPS = 0.005
+# Допуск симплекс-метода
+_TOL = 1e-9
+
+
+class SpendOption(NamedTuple):
+    category: str  # название категории из запроса
+    card_id: int
+    percent: float
+    category_cap: Optional[float]
+    category_min_spend: Optional[float]
+
+
+class Edge(NamedTuple):
+    category: str
+    card: Hashable  # ключ лимита карты в card_caps
+    percent: float
+    cap: Optional[float]  # лимит кешбека категории на этой карте
+
+
+class CardLimits(NamedTuple):
+    card_id: int
+    card_name: str
+    bank_name: str
+    cap: Optional[float]
+    min_spend: Optional[float]
+
+
+def build_options(
+    spend: Dict[str, float], table: RecommendationTable
+) -> Tuple[List[SpendOption], Dict[int, CardLimits], List[str]]:
+    """Варианты оплаты каждой категории трат картами пользователя"""
+    options: List[SpendOption] = []
+    cards: Dict[int, CardLimits] = {}
+    unmatched: List[str] = []
+
+    for category in spend:
+        rows = table.match(category)
+        if not rows:
+            unmatched.append(category)
+            continue
+        # У карты может быть несколько строк одной категории - берём лучшую
+        best: Dict[int, RecommendationRow] = {}
+        for row in rows:
+            if row.card_id not in best or row.cashback_percent > best[row.card_id].cashback_percent:
+                best[row.card_id] = row
+        for row in best.values():
+            if row.cashback_percent <= 0:
+                continue
+            options.append(SpendOption(
+                category=category,
+                card_id=row.card_id,
+                percent=row.cashback_percent,
+                category_cap=row.cashback_cap,
+                category_min_spend=row.min_spend,
+            ))
+            cards[row.card_id] = CardLimits(
+                card_id=row.card_id,
+                card_name=row.card_name,
+                bank_name=row.bank_name,
+                cap=row.card_cashback_cap,
+                min_spend=row.card_min_spend,
+            )
+
+    options.sort(key=lambda option: (-option.percent, option.card_id, option.category))
+    return options, cards, unmatched
+
+
+def _simplex(
+    objective: List[float], rows: List[List[float]], bounds: List[float], upper: List[float]
+) -> List[float]:
+    """
+    max objective·x при rows·x <= bounds и 0 <= x <= upper (bounds >= 0).
+
+    Табличный симплекс-метод с верхними границами переменных: переменная,
+    дошедшая до границы, заменяется на (граница - x). Начальный базис -
+    дополнительные переменные строк, поэтому первая фаза не нужна. Входит
+    переменная с наибольшей оценкой, после вырожденных шагов - по правилу
+    Бленда, чтобы не зациклиться.
+    """
+    m, n = len(rows), len(objective)
+    width = n + m
+    table = [row + [1.0 if k == i else 0.0 for k in range(m)] for i, row in enumerate(rows)]
+    values = list(bounds)
+    basis = list(range(n, width))
+    limits = list(upper) + [_INF] * m
+    flipped = [False] * width
+    reduced = list(objective) + [0.0] * m
+    degenerate = 0
+
+    while True:
+        # Оценки базисных переменных равны нулю
+        best = max(reduced)
+        if best <= _TOL:
+            break
+        if degenerate > m:
+            entering = next(j for j, value in enumerate(reduced) if value > _TOL)
+        else:
+            entering = reduced.index(best)
+
+        # Насколько можно увеличить входящую переменную
+        step, leaving, to_upper = limits[entering], -1, False
+        for i in range(m):
+            coefficient = table[i][entering]
+            if coefficient > _TOL:
+                ratio, at_upper = values[i] / coefficient, False
+            elif coefficient < -_TOL and limits[basis[i]] < _INF:
+                ratio, at_upper = (limits[basis[i]] - values[i]) / -coefficient, True
+            else:
+                continue
+            if ratio < step - _TOL or (
+                ratio <= step + _TOL and leaving >= 0 and basis[i] < basis[leaving]
+            ):
+                step, leaving, to_upper = ratio, i, at_upper
+        if step == _INF:
+            raise ValueError("Unbounded allocation problem")
+        degenerate = degenerate + 1 if step <= _TOL else 0
+
+        if leaving < 0:
+            # Входящая переменная дошла до своей границы: базис не меняется
+            bound = limits[entering]
+            for i in range(m):
+                values[i] -= table[i][entering] * bound
+                table[i][entering] = -table[i][entering]
+            reduced[entering] = -reduced[entering]
+            flipped[entering] = not flipped[entering]
+            continue
+
+        row = table[leaving]
+        if to_upper:
+            # Уходящая переменная выходит на верхнюю границу
+            left = basis[leaving]
+            row = [-value for value in row]
+            row[left] = 1.0
+            values[leaving] = limits[left] - values[leaving]
+            flipped[left] = not flipped[left]
+
+        pivot = row[entering]
+        row = [value / pivot for value in row]
+        table[leaving] = row
+        values[leaving] /= pivot
+        columns = [k for k, value in enumerate(row) if value]
+        for i in range(m):
+            factor = table[i][entering]
+            if i == leaving or not factor:
+                continue
+            current = table[i]
+            for k in columns:
+                current[k] -= factor * row[k]
+            # Погрешность округления не должна уводить переменную ниже нуля
+            values[i] = max(0.0, values[i] - factor * values[leaving])
+        factor = reduced[entering]
+        for k in columns:
+            reduced[k] -= factor * row[k]
+        reduced[entering] = 0.0
+        basis[leaving] = entering
+
+    solution = [0.0] * width
+    for i, variable in enumerate(basis):
+        solution[variable] = values[i]
+    for j in range(n):
+        if flipped[j]:
+            solution[j] = limits[j] - solution[j]
+    return solution[:n]
+
+
+def allocate(spend: Dict[str, float], edges: Sequence[Edge], card_caps: Dict[Hashable, float]) -> List[float]:
+    """
+    Траты по каждому варианту (категория, карта) с максимальным кешбеком:
+    не больше трат категории, лимита кешбека варианта и лимита карты
+    (card_caps; карты без лимита в нём не указываются).
+    """
+    amounts = [0.0] * len(edges)
+    by_category: Dict[str, List[int]] = defaultdict(list)
+    for index, edge in enumerate(edges):
+        if edge.percent > 0:
+            by_category[edge.category].append(index)
+
+    # Без лимитов карт каждая категория уходит на варианты с большим процентом
+    card_cashback: Dict[Hashable, float] = defaultdict(float)
+    for category, indexes in by_category.items():
+        indexes.sort(key=lambda index: -edges[index].percent)
+        left = max(0.0, spend.get(category, 0.0))
+        for index in indexes:
+            if left <= _EPS:
+                break
+            edge = edges[index]
+            rate = edge.percent / 100
+            amount = left if edge.cap is None else min(left, max(0.0, edge.cap) / rate)
+            amounts[index] = amount
+            left -= amount
+            card_cashback[edge.card] += amount * rate
+    if all(card_cashback[card] <= max(0.0, cap) + _EPS for card, cap in card_caps.items()):
+        return amounts
+
+    # Иначе категории, которые можно оплатить картой с лимитом, - задача ЛП.
+    # Вариант без лимитов забирает любой остаток категории: варианты с меньшим
+    # процентом в задачу не входят
+    for category, indexes in by_category.items():
+        unlimited = next(
+            (index for index in indexes if edges[index].card not in card_caps and edges[index].cap is None), None
+        )
+        if unlimited is not None:
+            del indexes[indexes.index(unlimited) + 1:]
+
+    categories = [
+        category for category, indexes in by_category.items()
+        if any(edges[index].card in card_caps for index in indexes)
+    ]
+    variables = [index for category in categories for index in by_category[category]]
+    cards = list(dict.fromkeys(edges[index].card for index in variables if edges[index].card in card_caps))
+    category_rows = {category: row for row, category in enumerate(categories)}
+    card_rows = {card: len(categories) + row for row, card in enumerate(cards)}
+
+    rows = [[0.0] * len(variables) for _ in range(len(categories) + len(cards))]
+    objective, upper = [], []
+    for column, index in enumerate(variables):
+        edge = edges[index]
+        rate = edge.percent / 100
+        rows[category_rows[edge.category]][column] = 1.0
+        if edge.card in card_rows:
+            rows[card_rows[edge.card]][column] = rate
+        objective.append(rate)
+        upper.append(_INF if edge.cap is None else max(0.0, edge.cap) / rate)
+    bounds = [max(0.0, spend.get(category, 0.0)) for category in categories]
+    bounds += [max(0.0, card_caps[card]) for card in cards]
+
+    for index, amount in zip(variables, _simplex(objective, rows, bounds, upper)):
+        amounts[index] = amount
+    return amounts
+
+
+class _Plan(NamedTuple):
+    allocations: Dict[Tuple[str, int], List[float]]  # (категория, карта) -> [сумма, кешбек]
+    card_spend: Dict[int, float]
+    card_cashback: Dict[int, float]
+    remaining: Dict[str, float]
+    short_options: List[SpendOption]  # варианты, по которым не набран порог трат категории
+    short_cards: List[int]  # карты, по которым не набран минимум трат
+
+
+def _solve(
+    spend: Dict[str, float],
+    options: List[SpendOption],
+    cards: Dict[int, CardLimits],
+    excluded: Set[int],
+    dropped: Set[Tuple[str, int]],
+) -> _Plan:
+    active = [
+        option for option in options
+        if option.card_id not in excluded and (option.category, option.card_id) not in dropped
+    ]
+    card_caps = {card_id: limits.cap for card_id, limits in cards.items() if limits.cap is not None}
+    amounts = allocate(
+        spend,
+        [Edge(option.category, option.card_id, option.percent, option.category_cap) for option in active],
+        card_caps,
+    )
+
+    remaining = {category: max(0.0, amount) for category, amount in spend.items()}
+    allocations: Dict[Tuple[str, int], List[float]] = {}
+    card_spend: Dict[int, float] = defaultdict(float)
+    card_cashback: Dict[int, float] = defaultdict(float)
+    for option, amount in zip(active, amounts):
+        if amount <= _EPS:
+            continue
+        cashback = amount * option.percent / 100
+        allocations[(option.category, option.card_id)] = [amount, cashback]
+        remaining[option.category] -= amount
+        card_spend[option.card_id] += amount
+        card_cashback[option.card_id] += cashback
+
+    # Порог трат по категории добираем остатком трат этой категории
+    short_options = []
+    for option in active:
+        allocation = allocations.get((option.category, option.card_id))
+        deficit = (option.category_min_spend or 0.0) - (allocation[0] if allocation else 0.0)
+        if allocation is None or deficit <= _EPS:
+            continue
+        if remaining[option.category] < deficit - _EPS:
+            short_options.append(option)
+            continue
+        take = min(deficit, remaining[option.category])
+        allocation[0] += take
+        remaining[option.category] -= take
+        card_spend[option.card_id] += take
+
+    # Минимальную сумму трат по карте добираем тратами, которые не принесли кешбек
+    short_cards = []
+    for card_id in sorted(card_cashback, key=lambda card_id: -card_cashback[card_id]):
+        threshold = cards[card_id].min_spend or 0.0
+        deficit = threshold - card_spend[card_id]
+        for category in spend:
+            if deficit <= _EPS:
+                break
+            take = min(deficit, remaining[category])
+            if take <= _EPS:
+                continue
+            allocation = allocations.setdefault((category, card_id), [0.0, 0.0])
+            allocation[0] += take
+            remaining[category] -= take
+            card_spend[card_id] += take
+            deficit -= take
+        if deficit > _EPS:
+            short_cards.append(card_id)
+
+    return _Plan(allocations, card_spend, card_cashback, remaining, short_options, short_cards)
+
+
+def optimize_allocation(spend: Dict[str, float], table: RecommendationTable) -> Dict:
+    """Распределение трат по картам: суммы, кешбек, итоги по картам и нераспределённые траты"""
+    options, cards, unmatched = build_options(spend, table)
+
+    excluded: Set[int] = set()
+    dropped: Set[Tuple[str, int]] = set()
+    while True:
+        plan = _solve(spend, options, cards, excluded, dropped)
+        if plan.short_options:
+            # В каждой категории исключаем вариант с порогом, который приносит меньше всего,
+            # и пересчитываем
+            weakest: Dict[str, SpendOption] = {}
+            for option in plan.short_options:
+                cashback = plan.allocations[(option.category, option.card_id)][1]
+                current = weakest.get(option.category)
+                if current is None or cashback < plan.allocations[(current.category, current.card_id)][1]:
+                    weakest[option.category] = option
+            dropped.update((option.category, option.card_id) for option in weakest.values())
+            continue
+        if not plan.short_cards:
+            break
+        # Исключаем карту с порогом, которая приносит меньше всего, и пересчитываем
+        excluded.add(min(plan.short_cards, key=lambda card_id: plan.card_cashback[card_id]))
+
+    allocations = []
+    for (category, card_id), (amount, cashback) in plan.allocations.items():
+        if amount <= _EPS:
+            continue
+        # Траты, добавленные до порога, кешбек не увеличивают: процент - фактический
+        percent = round(cashback / amount * 100, 2)
+        limits = cards[card_id]
+        allocations.append({
+            "category_name": category,
+            "card_id": card_id,
+            "card_name": limits.card_name,
+            "bank_name": limits.bank_name,
+            "amount": round(amount, 2),
+            "cashback_percent": percent,
+            "cashback": round(cashback, 2),
+        })
+    allocations.sort(key=lambda item: (-item["cashback"], -item["amount"]))
+
+    card_summaries = [
+        {
+            "card_id": card_id,
+            "card_name": cards[card_id].card_name,
+            "bank_name": cards[card_id].bank_name,
+            "spend": round(plan.card_spend[card_id], 2),
+            "cashback": round(plan.card_cashback[card_id], 2),
+            "monthly_cashback_cap": cards[card_id].cap,
+            "min_monthly_spend": cards[card_id].min_spend,
+        }
+        for card_id in sorted(plan.card_spend, key=lambda card_id: -plan.card_cashback[card_id])
+        if plan.card_spend[card_id] > _EPS
+    ]
+
+    unmatched_set = set(unmatched)
+    unallocated = [
+        {
+            "category_name": category,
+            "amount": round(amount, 2),
+            "reason": "no_card" if category in unmatched_set else "no_cashback",
+        }
+        for category, amount in plan.remaining.items()
+        if amount > _EPS
+    ]
+
+    return {
+        "total_spend": round(sum(max(0.0, amount) for amount in spend.values()), 2),
+        "total_cashback": round(sum(plan.card_cashback.values()), 2),
+        "allocations": allocations,
+        "cards": card_summaries,
+        "unallocated": unallocated,
+        "excluded_cards": sorted(excluded),
+    }
@@ -0,0 +1,40 @@
+"""
+Хеширование и проверка паролей.
+
+pbkdf2 намеренно медленный, поэтому хеш считается в отдельном пуле
+процессов: вход и регистрация не занимают потоки, в которых выполняются
+остальные запросы, а при всплеске входов лишние запросы получают 503.
+Модуль не импортирует базу данных, чтобы процессы пула запускались быстро.
+"""
+import os
+from passlib.context import CryptContext
+from app.executors import BoundedProcessPool
+
+# Настройки для хеширования паролей
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+hash_pool = BoundedProcessPool(
+    "password-hash",
+    workers=int(os.getenv("AUTH_HASH_WORKERS", "2")),
+    queue_size=int(os.getenv("AUTH_HASH_QUEUE_SIZE", "32")),
+)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    """Хеширование пароля"""
+    return pwd_context.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля в пуле хеширования (PoolSaturatedError при переполнении)"""
+    return await hash_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Хеширование пароля в пуле хеширования (PoolSaturatedError при переполнении)"""
+    return await hash_pool.run(get_password_hash, password)
@@ -0,0 +1,299 @@
+"""
+Выбор N категорий из M предложенных банком.
+
+Ценность выбора зависит от всех карт сразу: трата в категории уходит на
+карту с наибольшим кешбеком, поэтому категория, которая уже есть на другой
+карте с большим процентом, ничего не добавляет. Траты распределяются так же,
+как в /cashback/optimize (app.optimizer.allocate): с максимальным кешбеком
+при лимитах кешбека категорий и карт. Такой кешбек не уменьшается при
+добавлении категорий, поэтому достаточно перебирать наборы ровно из N
+категорий, а кешбек без лимитов карт - верхняя граница ветки.
+
+Сначала ищется локальный оптимум (каждая карта по очереди выбирает лучшие
+категории при выборе остальных), затем метод ветвей и границ улучшает его
+до точного решения, пока не исчерпан лимит узлов перебора. В переборе
+участвуют только категории, которые могут дать прирост, поэтому десятки
+тысяч наборов отсекаются без оценки.
+"""
+import os
+from collections import defaultdict
+from itertools import combinations
+from math import comb
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from app.category_search import search_terms
+from app.optimizer import Edge, allocate
+
+# Предел числа узлов перебора: дальше возвращается лучшее найденное решение
+MAX_NODES = int(os.getenv("PLANNER_MAX_NODES", "5000"))
+# Предел числа раундов локального поиска
+_MAX_ROUNDS = 50
+# Суммы меньше копейки считаем нулём
+_EPS = 0.005
+
+
+class Offer(NamedTuple):
+    category_name: str  # как предложено банком
+    cashback_percent: float
+    icon: Optional[str]
+    spend_category: Optional[str]  # категория трат из профиля, к которой относится предложение
+    value: float  # кешбек за месяц, если категория выбрана (с учётом лимита категории)
+
+
+class PlannedCard(NamedTuple):
+    card_id: Optional[int]
+    name: str
+    choose: int
+    cap: Optional[float]
+    offers: List[Offer]
+
+
+def _terms_key(name: str) -> str:
+    return " ".join(search_terms(name))
+
+
+def make_offers(
+    spend: Dict[str, float], offered: Sequence[Tuple[str, float, Optional[float], Optional[str]]]
+) -> List[Offer]:
+    """Предложения банка (название, процент, лимит кешбека, иконка) с ожидаемым кешбеком"""
+    spend_by_terms = {_terms_key(category): category for category in spend}
+    offers = []
+    for name, percent, cap, icon in offered:
+        category = spend_by_terms.get(_terms_key(name))
+        value = 0.0
+        if category is not None and percent > 0:
+            value = spend[category] * percent / 100
+            if cap is not None:
+                value = min(value, cap)
+        offers.append(Offer(name, percent, icon, category, value))
+    return offers
+
+
+def baseline_offers(
+    spend: Dict[str, float], fixed: Sequence[Tuple[str, float, Optional[float], Optional[str]]]
+) -> List[Offer]:
+    """Уже выбранные категории других карт, которые относятся к тратам профиля"""
+    return [offer for offer in make_offers(spend, fixed) if offer.value > 0]
+
+
+class _Evaluator:
+    """
+    Итоговый кешбек набора выбранных категорий.
+
+    Траты распределяются с максимальным кешбеком при лимитах категорий
+    и карт; уже выбранные категории других карт считаются без лимита карты.
+    Без лимитов карт (caps=False) кешбек не меньше, чем с ними, - это
+    верхняя граница для метода ветвей и границ.
+    """
+
+    def __init__(self, spend: Dict[str, float], cards: List[PlannedCard], baseline: List[Offer]):
+        self.spend = spend
+        self.cards = cards
+        self.baseline = baseline
+        self.base_by_category: Dict[str, List[Offer]] = defaultdict(list)
+        self.base_values: Dict[str, float] = {}
+        for offer in baseline:
+            self.base_by_category[offer.spend_category].append(offer)
+            self.base_values[offer.spend_category] = max(self.base_values.get(offer.spend_category, 0.0), offer.value)
+        # Варианты уже выбранных категорий: без ключа карты, значит без лимита карты
+        self.base_edges = [
+            Edge(offer.spend_category, None, offer.cashback_percent, offer.value) for offer in baseline
+        ]
+        self.card_caps = {index: card.cap for index, card in enumerate(cards) if card.cap is not None}
+
+    def total(self, selection: Sequence[Sequence[int]], caps: bool = True) -> float:
+        edges = list(self.base_edges)
+        for card_index, chosen in enumerate(selection):
+            for offer_index in chosen:
+                offer = self.cards[card_index].offers[offer_index]
+                if offer.value > 0:
+                    edges.append(Edge(offer.spend_category, card_index, offer.cashback_percent, offer.value))
+        amounts = allocate(self.spend, edges, self.card_caps if caps else {})
+        return sum(amount * edge.percent / 100 for edge, amount in zip(edges, amounts))
+
+
+def _absorbs(offer: Offer, spend: Dict[str, float]) -> bool:
+    """Категория забирает все траты (лимит категории не мешает)"""
+    return offer.value >= spend[offer.spend_category] * offer.cashback_percent / 100 - _EPS
+
+
+def _useful_offers(card: PlannedCard, evaluator: _Evaluator) -> Tuple[int, ...]:
+    """
+    Предложения, которые могут дать прирост. Бесполезно предложение, если
+    уже выбранная категория другой карты или другое предложение этой же
+    карты даёт не меньший процент и забирает все траты категории.
+    """
+    useful = []
+    for index, offer in enumerate(card.offers):
+        if offer.spend_category is None or offer.value <= 0:
+            continue
+        rivals = [
+            other for other_index, other in enumerate(card.offers)
+            if other_index != index and other.spend_category == offer.spend_category
+            # Из двух одинаковых предложений оставляем первое
+            and (other.cashback_percent, other_index < index) > (offer.cashback_percent, False)
+        ]
+        rivals.extend(
+            base for base in evaluator.base_by_category.get(offer.spend_category, ())
+            if base.cashback_percent >= offer.cashback_percent
+        )
+        if not any(_absorbs(rival, evaluator.spend) for rival in rivals):
+            useful.append(index)
+    return tuple(useful)
+
+
+def _ranked_choice(card: PlannedCard, gains: List[float]) -> Tuple[int, ...]:
+    """N предложений с наибольшим приростом (при равенстве - с большим процентом)"""
+    order = sorted(
+        range(len(card.offers)),
+        key=lambda index: (-gains[index], -card.offers[index].cashback_percent, index),
+    )
+    return tuple(sorted(order[:min(card.choose, len(card.offers))]))
+
+
+def _best_response(evaluator: _Evaluator, selection: List[Tuple[int, ...]], card_index: int) -> Tuple[int, ...]:
+    """Лучший выбор карты при зафиксированном выборе остальных карт"""
+    cards = evaluator.cards
+    others = dict(evaluator.base_values)
+    for index, chosen in enumerate(selection):
+        if index == card_index:
+            continue
+        for offer_index in chosen:
+            offer = cards[index].offers[offer_index]
+            if offer.spend_category is not None:
+                others[offer.spend_category] = max(others.get(offer.spend_category, 0.0), offer.value)
+
+    card = cards[card_index]
+    gains = [
+        max(0.0, offer.value - others.get(offer.spend_category, 0.0)) if offer.spend_category else 0.0
+        for offer in card.offers
+    ]
+    return _ranked_choice(card, gains)
+
+
+def _local_search(evaluator: _Evaluator) -> Tuple[List[Tuple[int, ...]], float]:
+    cards = evaluator.cards
+    selection = [_ranked_choice(card, [offer.value for offer in card.offers]) for card in cards]
+    value = evaluator.total(selection)
+    for _ in range(_MAX_ROUNDS):
+        improved = False
+        for card_index in range(len(cards)):
+            candidate = _best_response(evaluator, selection, card_index)
+            if candidate == selection[card_index]:
+                continue
+            trial = selection[:card_index] + [candidate] + selection[card_index + 1:]
+            trial_value = evaluator.total(trial)
+            if trial_value > value + _EPS:
+                selection, value, improved = trial, trial_value, True
+        if not improved:
+            break
+    return selection, value
+
+
+def _branch_and_bound(
+    evaluator: _Evaluator,
+    incumbent: List[Tuple[int, ...]],
+    incumbent_value: float,
+    max_nodes: int,
+) -> Tuple[List[Tuple[int, ...]], float, bool]:
+    """
+    Перебор с отсечением. Граница ветки - кешбек, если все ещё не
+    рассмотренные карты возьмут все полезные предложения: сначала без
+    лимитов карт (дёшево), затем с лимитами.
+    """
+    cards = evaluator.cards
+    useful = [_useful_offers(card, evaluator) for card in cards]
+    sizes = [min(card.choose, len(offers)) for card, offers in zip(cards, useful)]
+    # Сначала карты с меньшим числом вариантов
+    order = sorted(range(len(cards)), key=lambda index: comb(len(useful[index]), sizes[index]))
+
+    def choices(index: int) -> Iterable[Tuple[int, ...]]:
+        variants = combinations(useful[index], sizes[index])
+        if comb(len(useful[index]), sizes[index]) > max_nodes:
+            # Все варианты не перебрать: не сортируем, чтобы не строить их список
+            return variants
+        offers = cards[index].offers
+        return sorted(variants, key=lambda chosen: -sum(offers[offer].value for offer in chosen))
+
+    best = list(incumbent)
+    best_value = incumbent_value
+    nodes = 0
+    complete = True
+    partial = list(useful)
+
+    def search(depth: int):
+        nonlocal best, best_value, nodes, complete
+        card_index = order[depth]
+        for chosen in choices(card_index):
+            if nodes >= max_nodes:
+                complete = False
+                break
+            nodes += 1
+            partial[card_index] = chosen
+            # Остальные карты пока берут всё: выше этого значения ветка не поднимется
+            if evaluator.total(partial, caps=False) <= best_value + _EPS:
+                continue
+            value = evaluator.total(partial)
+            if value <= best_value + _EPS:
+                continue
+            if depth + 1 < len(order):
+                search(depth + 1)
+            else:
+                best, best_value = list(partial), value
+        partial[card_index] = useful[card_index]
+
+    if order:
+        search(0)
+    return best, best_value, complete
+
+
+def _fill(card: PlannedCard, chosen: Sequence[int]) -> Tuple[int, ...]:
+    """Дополняет выбор до N категорий: сначала более ценными, затем с большим процентом"""
+    chosen = set(chosen)
+    rest = sorted(
+        (index for index in range(len(card.offers)) if index not in chosen),
+        key=lambda index: (-card.offers[index].value, -card.offers[index].cashback_percent, index),
+    )
+    return tuple(sorted(chosen | set(rest[:max(0, card.choose - len(chosen))])))
+
+
+def plan_selection(
+    spend: Dict[str, float],
+    cards: List[PlannedCard],
+    baseline: List[Offer],
+    max_nodes: int = MAX_NODES,
+) -> Dict:
+    """Лучший выбор категорий для каждой карты и ожидаемый кешбек"""
+    evaluator = _Evaluator(spend, cards, baseline)
+    selection, value = _local_search(evaluator)
+    selection, _, optimal = _branch_and_bound(evaluator, selection, value, max_nodes)
+    selection = [_fill(card, chosen) for card, chosen in zip(cards, selection)]
+    value = evaluator.total(selection)
+    baseline_total = evaluator.total([() for _ in cards])
+
+    planned = []
+    for card_index, (card, chosen) in enumerate(zip(cards, selection)):
+        alone = [chosen if index == card_index else () for index in range(len(cards))]
+        planned.append({
+            "card_id": card.card_id,
+            "card_name": card.name,
+            "selected": [
+                {
+                    "category_name": card.offers[index].category_name,
+                    "cashback_percent": card.offers[index].cashback_percent,
+                    "icon": card.offers[index].icon,
+                    "spend_category": card.offers[index].spend_category,
+                    "expected_cashback": round(card.offers[index].value, 2),
+                }
+                for index in chosen
+            ],
+            # Прирост, если бы выбор сделала только эта карта
+            "gain": round(evaluator.total(alone) - baseline_total, 2),
+        })
+
+    return {
+        "cards": planned,
+        "total_cashback": round(value, 2),
+        "baseline_cashback": round(baseline_total, 2),
+        "gain": round(value - baseline_total, 2),
+        "optimal": optimal,
+    }
@@ -0,0 +1,217 @@
+"""
+Кеш таблиц рекомендаций.
+
+Категории меняются примерно раз в месяц, а рекомендации запрашиваются при
+каждой покупке. Поэтому для пары (пользователь, период) одним запросом
+строится таблица: для каждой категории - карты, отсортированные по кешбеку.
+Таблица живёт в памяти процесса, пока эндпоинты банков, карт и категорий
+не сбросят её при изменении данных.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.categories import make_category_key
+from app.category_search import search_terms
+from app.models import Bank, Card, CashbackCategory
+
+
+class RecommendationRow(NamedTuple):
+    category_id: int
+    category_name: str
+    category_key: str
+    cashback_percent: float
+    icon: str
+    card_id: int
+    card_name: str
+    bank_id: int
+    bank_name: str
+    cashback_cap: Optional[float] = None
+    min_spend: Optional[float] = None
+    card_cashback_cap: Optional[float] = None
+    card_min_spend: Optional[float] = None
+
+
+class RecommendationTable:
+    """Лучшие карты по каждой категории пользователя за период"""
+
+    def __init__(self, rows: List[RecommendationRow]):
+        self.rows_by_id: Dict[int, RecommendationRow] = {row.category_id: row for row in rows}
+        by_key: Dict[str, List[RecommendationRow]] = defaultdict(list)
+        for row in rows:
+            by_key[row.category_key].append(row)
+        for ranked in by_key.values():
+            ranked.sort(key=lambda row: (-row.cashback_percent, row.category_id))
+        self.by_key: Dict[str, List[RecommendationRow]] = dict(by_key)
+        # Версия содержимого таблицы для ETag: считается один раз при построении
+        digest = hashlib.sha1()
+        for row in sorted(rows, key=lambda row: row.category_id):
+            digest.update(repr(tuple(row)).encode("utf-8"))
+        self.etag = f'"{digest.hexdigest()}"'
+        # Сопоставление произвольных названий с категориями (строится при первом вызове match)
+        self._terms: Optional[Dict[str, FrozenSet[str]]] = None
+        self._matches: Dict[str, List[RecommendationRow]] = {}
+
+    def best(self, category_key: str) -> List[RecommendationRow]:
+        """Карты для категории, от большего кешбека к меньшему"""
+        return self.by_key.get(category_key, [])
+
+    def match(self, category_name: str) -> List[RecommendationRow]:
+        """
+        Карты для категории по её названию из другого источника (траты, выписка):
+        с тем же ключом или теми же основами слов (Аптека / аптеки / pharmacy),
+        а если таких нет - категории, слова одной из которых входят в другую
+        (Одежда / Одежда и обувь).
+        """
+        matched = self._matches.get(category_name)
+        if matched is not None:
+            return matched
+
+        if self._terms is None:
+            self._terms = {key: _significant_terms(key) for key in self.by_key}
+        key = make_category_key(category_name)
+        terms = _significant_terms(category_name)
+        # Одна категория может быть записана на разных картах по-разному: "Аптеки" и "Аптека"
+        keys = [
+            candidate for candidate, key_terms in self._terms.items()
+            if candidate == key or (terms and key_terms == terms)
+        ]
+        if not keys and terms:
+            keys = [
+                candidate for candidate, key_terms in self._terms.items()
+                if key_terms and (key_terms <= terms or terms <= key_terms)
+            ]
+        matched = sorted(
+            (row for candidate in keys for row in self.by_key[candidate]),
+            key=lambda row: (-row.cashback_percent, row.category_id),
+        )
+        self._matches[category_name] = matched
+        return matched
+
+
+def _significant_terms(name: str) -> FrozenSet[str]:
+    """Основы слов без однобуквенных (союзы, "ж/д")"""
+    return frozenset(term for term in search_terms(name) if len(term) > 1)
+
+
+def load_recommendation_rows(db: Session, user_id: int, year: int, month: int) -> List[RecommendationRow]:
+    """Все категории пользователя за период вместе с картами и банками (один запрос)"""
+    rows = db.query(
+        CashbackCategory.id,
+        CashbackCategory.category_name,
+        CashbackCategory.category_key,
+        CashbackCategory.cashback_percent,
+        CashbackCategory.icon,
+        Card.id.label("card_id"),
+        Card.name.label("card_name"),
+        Bank.id.label("bank_id"),
+        Bank.name.label("bank_name"),
+        CashbackCategory.cashback_cap,
+        CashbackCategory.min_spend,
+        Card.monthly_cashback_cap,
+        Card.min_monthly_spend,
+    ).join(Card, CashbackCategory.card_id == Card.id).join(Bank, Card.bank_id == Bank.id).filter(
+        CashbackCategory.year == year,
+        CashbackCategory.month == month,
+        Bank.user_id == user_id
+    ).all()
+    return [
+        RecommendationRow(
+            category_id=row.id,
+            category_name=row.category_name,
+            category_key=row.category_key or "",
+            cashback_percent=row.cashback_percent or 0.0,
+            icon=row.icon,
+            card_id=row.card_id,
+            card_name=row.card_name,
+            bank_id=row.bank_id,
+            bank_name=row.bank_name,
+            cashback_cap=row.cashback_cap,
+            min_spend=row.min_spend,
+            card_cashback_cap=row.monthly_cashback_cap,
+            card_min_spend=row.min_monthly_spend,
+        )
+        for row in rows
+    ]
+
+
+class RecommendationCache:
+    """Таблицы рекомендаций по пользователям с вытеснением давно не использованных (LRU)"""
+
+    def __init__(self, max_users: int = 1000, max_periods: int = 12):
+        self.max_users = max(1, max_users)
+        self.max_periods = max(1, max_periods)
+        self._users: "OrderedDict[int, OrderedDict[Tuple[int, int], RecommendationTable]]" = OrderedDict()
+        # Поколение данных пользователя: защищает от сохранения устаревшей таблицы
+        self._generations: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, user_id: int, year: int, month: int) -> RecommendationTable:
+        """Таблица рекомендаций за период; строится при первом обращении"""
+        period = (year, month)
+        with self._lock:
+            tables = self._users.get(user_id)
+            if tables is not None and period in tables:
+                self._users.move_to_end(user_id)
+                tables.move_to_end(period)
+                self.hits += 1
+                return tables[period]
+            self.misses += 1
+            generation = self._generations[user_id]
+
+        table = RecommendationTable(load_recommendation_rows(db, user_id, year, month))
+
+        with self._lock:
+            if self._generations[user_id] == generation:
+                tables = self._users.setdefault(user_id, OrderedDict())
+                self._users.move_to_end(user_id)
+                tables[period] = table
+                while len(tables) > self.max_periods:
+                    tables.popitem(last=False)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        return table
+
+    def invalidate(self, user_id: int, year: int, month: int):
+        """Сбрасывает таблицу пользователя за один период"""
+        with self._lock:
+            self._generations[user_id] += 1
+            tables = self._users.get(user_id)
+            if tables is not None:
+                tables.pop((year, month), None)
+
+    def invalidate_user(self, user_id: int):
+        """Сбрасывает все таблицы пользователя (переименование или удаление банка, карты)"""
+        with self._lock:
+            self._generations[user_id] += 1
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        """Сбрасывает таблицы всех пользователей (массовые изменения, например перенос месяца)"""
+        with self._lock:
+            self._users.clear()
+            for user_id in self._generations:
+                self._generations[user_id] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "tables": sum(len(tables) for tables in self._users.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+recommendation_cache = RecommendationCache(
+    max_users=int(os.getenv("RECOMMENDATION_CACHE_MAX_USERS", "1000")),
+    max_periods=int(os.getenv("RECOMMENDATION_CACHE_MAX_PERIODS", "12")),
+)
+
+# Счётчики общие для всех пользователей процесса: эндпоинт /cashback/cache-stats
+# доступен, только если включён явно (отладка, нагрузочные тесты)
+CACHE_STATS_ENABLED = os.getenv("CACHE_STATS_ENABLED", "0").lower() in ("1", "true", "yes", "on")
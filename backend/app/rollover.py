@@ -0,0 +1,186 @@
+"""
+Перенос категорий кешбека на следующий месяц.
+
+Копирование выполняется одним INSERT ... SELECT на стороне базы: строки
+не загружаются в Python, а категории, которые уже есть в целевом месяце
+(та же карта и тот же ключ категории), пропускаются. Поэтому перенос
+можно повторять сколько угодно раз.
+
+Фоновая задача раз в interval секунд переносит постоянные категории
+(is_permanent) с прошлого месяца на текущий пачками пользователей. Для
+каждого пользователя перенос на месяц выполняется один раз и отмечается
+в category_rollovers: категория, которую пользователь удалил или
+переименовал после переноса, не вернётся при следующей проверке.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import exists, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from app.category_search import category_search
+from app.database import SessionLocal
+from app.models import Bank, Card, CashbackCategory, CategoryRollover, User
+from app.recommendations import recommendation_cache
+
+logger = logging.getLogger(__name__)
+
+# Колонки, которые копируются в новую строку
+_COPIED_COLUMNS = (
+    "category_name", "category_key", "cashback_percent", "card_id", "icon", "is_permanent",
+    "cashback_cap", "min_spend",
+)
+
+
+def next_period(year: int, month: int) -> Tuple[int, int]:
+    """(год, месяц) следующего месяца"""
+    if month == 12:
+        return year + 1, 1
+    return year, month + 1
+
+
+def previous_period(year: int, month: int) -> Tuple[int, int]:
+    """(год, месяц) предыдущего месяца"""
+    if month == 1:
+        return year - 1, 12
+    return year, month - 1
+
+
+def rollover_statement(
+    year: int,
+    month: int,
+    user_id: Optional[int] = None,
+    bank_id: Optional[int] = None,
+    card_id: Optional[int] = None,
+    permanent_only: bool = False,
+    user_ids: Optional[Sequence[int]] = None,
+):
+    """INSERT ... SELECT, копирующий категории месяца month/year на следующий месяц"""
+    target_year, target_month = next_period(year, month)
+    target = aliased(CashbackCategory)
+
+    source = select(
+        *(getattr(CashbackCategory, name) for name in _COPIED_COLUMNS),
+        literal(target_month).label("month"),
+        literal(target_year).label("year"),
+    ).where(
+        CashbackCategory.year == year,
+        CashbackCategory.month == month,
+        ~exists().where(
+            target.card_id == CashbackCategory.card_id,
+            target.category_key == CashbackCategory.category_key,
+            target.year == target_year,
+            target.month == target_month,
+        ),
+    )
+
+    if user_id is not None or bank_id is not None or user_ids is not None:
+        cards = select(Card.id).join(Bank)
+        if user_id is not None:
+            cards = cards.where(Bank.user_id == user_id)
+        if user_ids is not None:
+            cards = cards.where(Bank.user_id.in_(list(user_ids)))
+        if bank_id is not None:
+            cards = cards.where(Bank.id == bank_id)
+        source = source.where(CashbackCategory.card_id.in_(cards))
+    if card_id is not None:
+        source = source.where(CashbackCategory.card_id == card_id)
+    if permanent_only:
+        source = source.where(CashbackCategory.is_permanent.is_(True))
+
+    return insert(CashbackCategory).from_select(list(_COPIED_COLUMNS) + ["month", "year"], source)
+
+
+def _rollover_users(year: int, month: int, batch_size: int) -> Tuple[int, int]:
+    """
+    Переносит постоянные категории следующей пачки пользователей, для которых
+    перенос на следующий месяц ещё не отмечен: (пользователей, категорий)
+    """
+    target_year, target_month = next_period(year, month)
+    db = SessionLocal()
+    try:
+        user_ids = db.scalars(select(User.id).where(~exists().where(
+            CategoryRollover.user_id == User.id,
+            CategoryRollover.year == target_year,
+            CategoryRollover.month == target_month,
+        )).order_by(User.id).limit(batch_size)).all()
+        if not user_ids:
+            return 0, 0
+
+        result = db.execute(rollover_statement(year, month, permanent_only=True, user_ids=user_ids))
+        db.execute(insert(CategoryRollover), [
+            {"user_id": user_id, "year": target_year, "month": target_month} for user_id in user_ids
+        ])
+        try:
+            db.commit()
+        except IntegrityError:
+            # Пачку одновременно переносит другой процесс приложения:
+            # остальных пользователей перенесёт следующая проверка
+            db.rollback()
+            return 0, 0
+        return len(user_ids), result.rowcount or 0
+    finally:
+        db.close()
+
+
+async def rollover_permanent(year: int, month: int, batch_size: int = 500) -> int:
+    """
+    Переносит постоянные категории с month/year на следующий месяц для всех
+    пользователей, у которых этот перенос ещё не выполнялся
+    """
+    copied = 0
+    batch_size = max(1, batch_size)
+    # Каждая пачка пользователей - отдельная короткая транзакция, чтобы не держать блокировку записи
+    while True:
+        users, rows = await run_in_threadpool(_rollover_users, year, month, batch_size)
+        if not users:
+            break
+        copied += rows
+
+    if copied:
+        # Затронуты категории многих пользователей: сбрасываем кеши целиком
+        category_search.clear()
+        recommendation_cache.clear()
+    return copied
+
+
+class RolloverScheduler:
+    """Периодический перенос постоянных категорий на текущий месяц"""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = datetime.now()
+            year, month = previous_period(now.year, now.month)
+            try:
+                copied = await rollover_permanent(year, month, self.batch_size)
+                if copied:
+                    logger.info("Rolled over %s permanent categories to %s-%02d", copied, now.year, now.month)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Rollover of permanent categories failed")
+            await asyncio.sleep(self.interval)
+
+
+rollover_scheduler = RolloverScheduler(
+    interval=float(os.getenv("ROLLOVER_INTERVAL", "3600")),
+    batch_size=int(os.getenv("ROLLOVER_BATCH_SIZE", "500")),
+)
@@ -1,16 +1,20 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User, UserCreate, UserLogin, UserResponse, Token
 from app.auth import (
     authenticate_user, 
     create_access_token, 
-    get_password_hash, 
     get_current_active_user,
-    verify_password
+    password_pool_busy_error,
+    CurrentUser
 )
+from app.executors import PoolBrokenError, PoolSaturatedError
+from app.passwords import get_password_hash_async
 
 # Длительность жизни токена
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
@@ -18,51 +22,61 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 
+def _find_registered(db: Session, username: str, email: str):
+    """Пользователи с таким же username или email (один запрос)"""
+    return db.query(User.username, User.email).filter(
+        or_(User.username == username, User.email == email)
+    ).all()
+
+
+def _create_user(db: Session, user: UserCreate, hashed_password: str) -> User:
+    db_user = User(
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password
+    )
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
 @router.post("/register", response_model=UserResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Регистрация нового пользователя"""
-    # Проверяем, существует ли пользователь с таким username
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
+    # Проверяем, существует ли пользователь с таким username или email
+    existing = await db.run_sync(_find_registered, user.username, user.email)
+    if any(row.username == user.username for row in existing):
         raise HTTPException(
             status_code=400,
             detail="Username already registered"
         )
-    
-    # Проверяем, существует ли пользователь с таким email
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if db_user:
+    if existing:
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
     
-    # Создаем нового пользователя
-    hashed_password = get_password_hash(user.password)
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
+    # Создаем нового пользователя; хеш считается в пуле процессов
+    try:
+        hashed_password = await get_password_hash_async(user.password)
+    except (PoolSaturatedError, PoolBrokenError):
+        raise password_pool_busy_error()
+    return await db.run_sync(_create_user, user, hashed_password)
+
+
+def _issue_token(user: User) -> dict:
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    return db_user
+    return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/login", response_model=Token)
-def login_user(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login_user(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """Вход пользователя (по username или email)"""
-    # Сначала пробуем найти по username
-    user = authenticate_user(db, user_credentials.username, user_credentials.password)
-    
-    # Если не найден по username, пробуем по email
-    if not user:
-        user_by_email = db.query(User).filter(User.email == user_credentials.username).first()
-        if user_by_email and verify_password(user_credentials.password, user_by_email.hashed_password):
-            user = user_by_email
-    
+    user = await authenticate_user(db, user_credentials.username, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -70,21 +84,16 @@ def login_user(user_credentials: UserLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+    return _issue_token(user)
 
 
 @router.post("/login-form", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Вход пользователя через OAuth2 форму (для Swagger UI)"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password, allow_email=False)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -92,21 +101,23 @@ def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+    return _issue_token(user)
 
 
 @router.get("/me", response_model=UserResponse)
-def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
     """Получение информации о текущем пользователе"""
-    return current_user
+    # Email и прочие поля в кеше токенов не хранятся
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 
 @router.get("/verify-token")
-def verify_token_endpoint(current_user: User = Depends(get_current_active_user)):
+async def verify_token_endpoint(current_user: CurrentUser = Depends(get_current_active_user)):
     """Проверка валидности токена"""
     return {"valid": True, "user": current_user.username}
@@ -1,155 +1,198 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List
 from app.database import get_db
 from app.models import (
     Bank, BankCreate, BankUpdate, BankResponse, BankWithCards,
-    Card, CardCreate, CardUpdate, CardResponse, CardWithCashback, User
+    Card, CardCreate, CardUpdate, CardResponse, CardWithCashback,
+    CashbackCategory
 )
-from app.auth import get_current_active_user
+from app.auth import CurrentUser, get_current_active_user
+from app.category_search import category_search
+from app.recommendations import recommendation_cache
 
 router = APIRouter(prefix="/banks", tags=["banks"])
 
 
+def _invalidate_user_caches(user_id: int):
+    """Сбрасывает индекс поиска и рекомендации пользователя после изменения банков или карт"""
+    category_search.invalidate_user(user_id)
+    recommendation_cache.invalidate_user(user_id)
+
+
+def _cashback_categories_loader(month: int = None, year: int = None):
+    """
+    Путь загрузки категорий кешбека одним запросом (selectin) вместо
+    ленивой загрузки для каждой карты; month/year отбирают нужный период.
+    """
+    criteria = []
+    if month:
+        criteria.append(CashbackCategory.month == month)
+    if year:
+        criteria.append(CashbackCategory.year == year)
+    if criteria:
+        return Card.cashback_categories.and_(*criteria)
+    return Card.cashback_categories
+
+
 @router.get("/", response_model=List[BankWithCards])
-def get_banks(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+async def get_banks(
+    month: int = None,
+    year: int = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получить все банки пользователя"""
-    banks = db.query(Bank).filter(Bank.user_id == current_user.id).all()
-    return banks
+    """Получить все банки пользователя с картами и категориями кешбека"""
+    # Дерево банк -> карты -> категории загружается тремя запросами независимо от размера
+    banks = await db.scalars(select(Bank).options(
+        selectinload(Bank.cards).selectinload(_cashback_categories_loader(month, year))
+    ).where(Bank.user_id == current_user.id))
+    return banks.all()
 
 
 @router.post("/", response_model=BankResponse)
-def create_bank(
+async def create_bank(
     bank: BankCreate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Создать новый банк"""
     db_bank = Bank(name=bank.name, user_id=current_user.id)
     db.add(db_bank)
-    db.commit()
-    db.refresh(db_bank)
+    await db.commit()
+    await db.refresh(db_bank)
     return db_bank
 
 
 @router.get("/{bank_id}", response_model=BankWithCards)
-def get_bank(
+async def get_bank(
     bank_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    month: int = None,
+    year: int = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить банк по ID"""
-    bank = db.query(Bank).filter(
+    bank = await db.scalar(select(Bank).options(
+        selectinload(Bank.cards).selectinload(_cashback_categories_loader(month, year))
+    ).where(
         Bank.id == bank_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not bank:
         raise HTTPException(status_code=404, detail="Bank not found")
     return bank
 
 
 @router.put("/{bank_id}", response_model=BankResponse)
-def update_bank(
+async def update_bank(
     bank_id: int,
     bank_update: BankUpdate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить банк"""
-    db_bank = db.query(Bank).filter(
+    db_bank = await db.scalar(select(Bank).where(
         Bank.id == bank_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_bank:
         raise HTTPException(status_code=404, detail="Bank not found")
     
     db_bank.name = bank_update.name
-    db.commit()
-    db.refresh(db_bank)
+    await db.commit()
+    await db.refresh(db_bank)
+    recommendation_cache.invalidate_user(current_user.id)
     return db_bank
 
 
 @router.delete("/{bank_id}")
-def delete_bank(
+async def delete_bank(
     bank_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить банк"""
-    db_bank = db.query(Bank).filter(
+    db_bank = await db.scalar(select(Bank).where(
         Bank.id == bank_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_bank:
         raise HTTPException(status_code=404, detail="Bank not found")
     
-    db.delete(db_bank)
-    db.commit()
+    await db.delete(db_bank)
+    await db.commit()
+    _invalidate_user_caches(current_user.id)
     return {"message": "Bank deleted successfully"}
 
 
 # Cards routes
 @router.post("/{bank_id}/cards", response_model=CardResponse)
-def create_card(
+async def create_card(
     bank_id: int,
     card: CardCreate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Добавить карту к банку"""
-    db_bank = db.query(Bank).filter(
+    db_bank = await db.scalar(select(Bank).where(
         Bank.id == bank_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_bank:
         raise HTTPException(status_code=404, detail="Bank not found")
     
     db_card = Card(
         name=card.name,
         bank_id=bank_id,
-        card_type=card.card_type
+        card_type=card.card_type,
+        monthly_cashback_cap=card.monthly_cashback_cap,
+        min_monthly_spend=card.min_monthly_spend
     )
     db.add(db_card)
-    db.commit()
-    db.refresh(db_card)
+    await db.commit()
+    await db.refresh(db_card)
     return db_card
 
 
 @router.get("/{bank_id}/cards", response_model=List[CardWithCashback])
-def get_cards(
+async def get_cards(
     bank_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    month: int = None,
+    year: int = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить все карты банка"""
     # Проверяем, что банк принадлежит пользователю
-    db_bank = db.query(Bank).filter(
+    db_bank = await db.scalar(select(Bank).where(
         Bank.id == bank_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_bank:
         raise HTTPException(status_code=404, detail="Bank not found")
     
-    cards = db.query(Card).filter(Card.bank_id == bank_id).all()
-    return cards
+    cards = await db.scalars(select(Card).options(
+        selectinload(_cashback_categories_loader(month, year))
+    ).where(Card.bank_id == bank_id))
+    return cards.all()
 
 
 @router.put("/cards/{card_id}", response_model=CardResponse)
-def update_card(
+async def update_card(
     card_id: int,
     card_update: CardUpdate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить карту"""
     # Проверяем, что карта принадлежит пользователю через банк
-    db_card = db.query(Card).join(Bank).filter(
+    db_card = await db.scalar(select(Card).join(Bank).where(
         Card.id == card_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_card:
         raise HTTPException(status_code=404, detail="Card not found")
     
@@ -157,27 +200,32 @@ def update_card(
         db_card.name = card_update.name
     if card_update.card_type is not None:
         db_card.card_type = card_update.card_type
+    for field in ("monthly_cashback_cap", "min_monthly_spend"):
+        if field in card_update.model_fields_set:
+            setattr(db_card, field, getattr(card_update, field))
     
-    db.commit()
-    db.refresh(db_card)
+    await db.commit()
+    await db.refresh(db_card)
+    recommendation_cache.invalidate_user(current_user.id)
     return db_card
 
 
 @router.delete("/cards/{card_id}")
-def delete_card(
+async def delete_card(
     card_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить карту"""
     # Проверяем, что карта принадлежит пользователю через банк
-    db_card = db.query(Card).join(Bank).filter(
+    db_card = await db.scalar(select(Card).join(Bank).where(
         Card.id == card_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_card:
         raise HTTPException(status_code=404, detail="Card not found")
     
-    db.delete(db_card)
-    db.commit()
+    await db.delete(db_card)
+    await db.commit()
+    _invalidate_user_caches(current_user.id)
     return {"message": "Card deleted successfully"}
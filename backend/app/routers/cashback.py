@@ -1,54 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+import codecs
+from collections import defaultdict
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
 from datetime import datetime
-from app.database import get_db
+from app.database import dialect_insert, execute_and_commit, get_db
 from app.models import (
-    CashbackCategory, CashbackCategoryCreate, CashbackCategoryUpdate,
-    CashbackCategoryResponse, Card, Bank, RecommendationResponse, User
+    CashbackCategory, CashbackCategoryCreate, CashbackCategoryUpdate, CashbackCategoryBulkCreate,
+    CashbackCategoryResponse, Card, Bank, RecommendationResponse,
+    OptimalCardsResponse, RolloverRequest, RolloverResponse, StatisticsResponse,
+    OptimizeRequest, OptimizeResponse, CategoryChoice, SelectionPlanRequest, SelectionPlanBatchRequest,
+    SelectionPlanResponse, UserMerchant, UserMerchantCreate, UserMerchantResponse, MerchantRecommendationResponse
 )
-from app.auth import get_current_active_user
+from app.auth import CurrentUser, get_current_active_user
+from app.categories import DEFAULT_ICON, make_category_key, normalize_category_name, resolve_category_icon
+from app.category_search import category_search
+from app.merchants import merchant_directory
+from app.optimizer import optimize_allocation
+from app.planner import PlannedCard, baseline_offers, make_offers, plan_selection
+from app.recommendations import recommendation_cache
+from app import recommendations
+from app.rollover import next_period, rollover_statement
+from app.statements import STATEMENT_FORMATS, MissedCashbackAnalyzer, StatementError, StatementImport
+from app.statistics import load_statistics
 
 router = APIRouter(prefix="/cashback", tags=["cashback"])
 
 
 @router.get("/categories", response_model=List[CashbackCategoryResponse])
-def get_cashback_categories(
+async def get_cashback_categories(
     card_id: int = None,
     month: int = None,
     year: int = None,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить все категории кешбека пользователя"""
-    query = db.query(CashbackCategory).join(Card).join(Bank).filter(
+    query = select(CashbackCategory).join(Card).join(Bank).where(
         Bank.user_id == current_user.id
     )
     
     if card_id:
-        query = query.filter(CashbackCategory.card_id == card_id)
+        query = query.where(CashbackCategory.card_id == card_id)
     if month:
-        query = query.filter(CashbackCategory.month == month)
+        query = query.where(CashbackCategory.month == month)
     if year:
-        query = query.filter(CashbackCategory.year == year)
+        query = query.where(CashbackCategory.year == year)
     
-    categories = query.all()
-    return categories
+    categories = await db.scalars(query)
+    return categories.all()
+
+
+# Колонки, которые обновляются у уже сохранённой категории
+_UPSERT_COLUMNS = ("category_name", "cashback_percent", "icon")
+# Обновляются, только если клиент передал их явно: распознанный скриншот
+# не должен сбрасывать постоянную категорию и лимиты, заданные вручную
+_UPSERT_OPTIONAL_COLUMNS = ("is_permanent", "cashback_cap", "min_spend")
+
+
+def duplicate_category_error() -> HTTPException:
+    """Ответ 400, если на карте уже есть такая категория за этот месяц"""
+    return HTTPException(status_code=400, detail="Category already exists for this card and month")
 
 
 @router.post("/cards/{card_id}/categories", response_model=CashbackCategoryResponse)
-def create_cashback_category(
+async def create_cashback_category(
     card_id: int,
     category: CashbackCategoryCreate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Добавить категорию кешбека к карте"""
     # Проверяем существование карты и принадлежность пользователю
-    card = db.query(Card).join(Bank).filter(
+    card = await db.scalar(select(Card).join(Bank).where(
         Card.id == card_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
     
@@ -58,28 +89,112 @@ def create_cashback_category(
         card_id=card_id,
         month=category.month or datetime.now().month,
         year=category.year or datetime.now().year,
-        icon=category.icon or "shopping_cart"
+        icon=resolve_category_icon(category.category_name, category.icon),
+        is_permanent=category.is_permanent,
+        cashback_cap=category.cashback_cap,
+        min_spend=category.min_spend
     )
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise duplicate_category_error()
+    await db.refresh(db_category)
+    category_search.update(current_user.id, db_category)
+    recommendation_cache.invalidate(current_user.id, db_category.year, db_category.month)
     return db_category
 
 
+@router.post("/cards/{card_id}/categories:bulk", response_model=List[CashbackCategoryResponse])
+async def bulk_create_cashback_categories(
+    card_id: int,
+    payload: CashbackCategoryBulkCreate,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Добавить или обновить несколько категорий карты одной транзакцией
+    (например, все категории, распознанные на скриншоте).
+    Категория с тем же названием за тот же месяц обновляется, а не дублируется.
+    """
+    card = await db.scalar(select(Card.id).join(Bank).where(
+        Card.id == card_id,
+        Bank.user_id == current_user.id
+    ))
+    if not card:
+        raise HTTPException(status_code=404, detail="Card not found")
+    
+    # Одна запись на (ключ категории, месяц, год); при повторе в запросе побеждает последняя
+    items = {}
+    sent_columns = {}
+    for category in payload.categories:
+        month = category.month or datetime.now().month
+        year = category.year or datetime.now().year
+        items[(make_category_key(category.category_name), month, year)] = {
+            "category_name": category.category_name,
+            "category_key": make_category_key(category.category_name),
+            "cashback_percent": category.cashback_percent,
+            "card_id": card_id,
+            "month": month,
+            "year": year,
+            "icon": resolve_category_icon(category.category_name, category.icon),
+            "is_permanent": category.is_permanent,
+            "cashback_cap": category.cashback_cap,
+            "min_spend": category.min_spend
+        }
+        sent_columns[(make_category_key(category.category_name), month, year)] = tuple(
+            name for name in _UPSERT_OPTIONAL_COLUMNS if name in category.model_fields_set
+        )
+    if not items:
+        return []
+    
+    periods = {(month, year) for _, month, year in items}
+    # INSERT ... ON CONFLICT DO UPDATE: уникальный индекс (карта, ключ, месяц)
+    # не даёт двум одновременным сохранениям создать дубликаты. Строки с разным
+    # набором переданных полей обновляют разные колонки - по запросу на набор
+    groups = defaultdict(list)
+    for key, values in items.items():
+        groups[sent_columns[key]].append(values)
+    statements = []
+    for optional_columns, rows in groups.items():
+        statement = dialect_insert(CashbackCategory).values(rows)
+        statements.append(statement.on_conflict_do_update(
+            index_elements=["card_id", "category_key", "year", "month"],
+            set_={name: statement.excluded[name] for name in _UPSERT_COLUMNS + optional_columns},
+        ))
+    await db.run_sync(execute_and_commit, statements)
+    
+    saved = await db.scalars(select(CashbackCategory).where(
+        CashbackCategory.card_id == card_id,
+        tuple_(CashbackCategory.category_key, CashbackCategory.month, CashbackCategory.year).in_(list(items))
+    ))
+    saved_by_key = {
+        (category.category_key, category.month, category.year): category
+        for category in saved
+    }
+    
+    category_search.invalidate_user(current_user.id)
+    for month, year in periods:
+        recommendation_cache.invalidate(current_user.id, year, month)
+    return [saved_by_key[key] for key in items if key in saved_by_key]
+
+
 @router.put("/categories/{category_id}", response_model=CashbackCategoryResponse)
-def update_cashback_category(
+async def update_cashback_category(
     category_id: int,
     category_update: CashbackCategoryUpdate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить категорию кешбека"""
-    db_category = db.query(CashbackCategory).join(Card).join(Bank).filter(
+    db_category = await db.scalar(select(CashbackCategory).join(Card).join(Bank).where(
         CashbackCategory.id == category_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
+    old_period = (db_category.year, db_category.month)
     
     if category_update.category_name is not None:
         db_category.category_name = category_update.category_name
@@ -91,38 +206,99 @@ def update_cashback_category(
         db_category.year = category_update.year
     if category_update.icon is not None:
         db_category.icon = category_update.icon
+    if category_update.is_permanent is not None:
+        db_category.is_permanent = category_update.is_permanent
+    for field in ("cashback_cap", "min_spend"):
+        if field in category_update.model_fields_set:
+            setattr(db_category, field, getattr(category_update, field))
+    # Иконку по умолчанию подбираем по названию так же, как при OCR
+    if not db_category.icon or db_category.icon == DEFAULT_ICON:
+        db_category.icon = resolve_category_icon(db_category.category_name)
     
-    db.commit()
-    db.refresh(db_category)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise duplicate_category_error()
+    await db.refresh(db_category)
+    category_search.update(current_user.id, db_category)
+    recommendation_cache.invalidate(current_user.id, *old_period)
+    recommendation_cache.invalidate(current_user.id, db_category.year, db_category.month)
     return db_category
 
 
 @router.delete("/categories/{category_id}")
-def delete_cashback_category(
+async def delete_cashback_category(
     category_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить категорию кешбека"""
-    db_category = db.query(CashbackCategory).join(Card).join(Bank).filter(
+    db_category = await db.scalar(select(CashbackCategory).join(Card).join(Bank).where(
         CashbackCategory.id == category_id,
         Bank.user_id == current_user.id
-    ).first()
+    ))
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    db.delete(db_category)
-    db.commit()
+    period = (db_category.year, db_category.month)
+    await db.delete(db_category)
+    await db.commit()
+    category_search.remove(current_user.id, category_id)
+    recommendation_cache.invalidate(current_user.id, *period)
     return {"message": "Category deleted successfully"}
 
 
+@router.post("/rollover", response_model=RolloverResponse)
+async def rollover_categories(
+    request: RolloverRequest,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Скопировать категории месяца на следующий месяц: для карты, банка или
+    всех карт пользователя. Уже существующие в следующем месяце категории не дублируются.
+    """
+    if not 1 <= request.month <= 12:
+        raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
+    if request.card_id is not None:
+        card = await db.scalar(select(Card.id).join(Bank).where(
+            Card.id == request.card_id,
+            Bank.user_id == current_user.id
+        ))
+        if not card:
+            raise HTTPException(status_code=404, detail="Card not found")
+    if request.bank_id is not None:
+        bank = await db.scalar(select(Bank.id).where(
+            Bank.id == request.bank_id,
+            Bank.user_id == current_user.id
+        ))
+        if not bank:
+            raise HTTPException(status_code=404, detail="Bank not found")
+    
+    [copied] = await db.run_sync(execute_and_commit, [rollover_statement(
+        request.year,
+        request.month,
+        user_id=current_user.id,
+        bank_id=request.bank_id,
+        card_id=request.card_id,
+        permanent_only=request.permanent_only
+    )])
+    
+    target_year, target_month = next_period(request.year, request.month)
+    if copied:
+        category_search.invalidate_user(current_user.id)
+        recommendation_cache.invalidate(current_user.id, target_year, target_month)
+    return RolloverResponse(copied=copied, month=target_month, year=target_year)
+
+
 @router.get("/recommendations/{category}", response_model=RecommendationResponse)
-def get_recommendations(
+async def get_recommendations(
     category: str,
     month: int = None,
     year: int = None,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить рекомендации по выбору карты для категории"""
     # Используем текущий месяц и год, если не указано
@@ -131,38 +307,385 @@ def get_recommendations(
     if not year:
         year = datetime.now().year
     
-    # Получаем все категории для указанного месяца и года пользователя
-    categories = db.query(CashbackCategory).join(Card).join(Bank).filter(
-        CashbackCategory.category_name.ilike(f"%{category}%"),
-        CashbackCategory.month == month,
-        CashbackCategory.year == year,
-        Bank.user_id == current_user.id
-    ).all()
+    # Нечёткий поиск по индексу категорий: регистр, окончания, опечатки, синонимы
+    matches = await db.run_sync(category_search.search, current_user.id, category, year, month)
+    if not matches:
+        return RecommendationResponse(category=category, recommendations=[])
+    relevance = dict(matches)
     
-    if not categories:
-        return RecommendationResponse(
-            category=category,
-            recommendations=[]
-        )
+    # Карты, категории и банки берём из таблицы рекомендаций за период (без запроса к БД)
+    table = await db.run_sync(recommendation_cache.get, current_user.id, year, month)
     
-    # Формируем список рекомендаций
-    recommendations = []
-    for cat in categories:
-        card = db.query(Card).filter(Card.id == cat.card_id).first()
-        if card:
-            bank = db.query(Bank).filter(Bank.id == card.bank_id).first()
-            recommendations.append({
-                "card_name": card.name,
-                "card_id": card.id,
-                "bank_name": bank.name if bank else "Unknown",
-                "cashback_percent": cat.cashback_percent,
-                "category_name": cat.category_name
-            })
-    
-    # Сортируем по кешбеку (от большего к меньшему)
-    recommendations.sort(key=lambda x: x["cashback_percent"], reverse=True)
+    # Формируем список рекомендаций: от большего кешбека к меньшему,
+    # при равном кешбеке выше более точное совпадение
+    recommendations = [
+        {
+            "card_name": row.card_name,
+            "card_id": row.card_id,
+            "bank_name": row.bank_name,
+            "cashback_percent": row.cashback_percent,
+            "category_name": row.category_name,
+            "relevance": round(score, 2)
+        }
+        for row, score in (
+            (table.rows_by_id.get(category_id), score)
+            for category_id, score in relevance.items()
+        )
+        if row is not None
+    ]
+    recommendations.sort(key=lambda x: (-x["cashback_percent"], -x["relevance"]))
     
     return RecommendationResponse(
         category=category,
         recommendations=recommendations
     )
+
+
+@router.get("/recommendations/by-merchant/{name}", response_model=MerchantRecommendationResponse)
+async def get_merchant_recommendations(
+    name: str,
+    month: int = None,
+    year: int = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Рекомендации по магазину ("Пятёрочка", "Лукойл"): магазин -> категория -> карты"""
+    if not month:
+        month = datetime.now().month
+    if not year:
+        year = datetime.now().year
+    
+    # Справочник пользователя и таблица рекомендаций берутся из кеша
+    user_merchants = await db.run_sync(merchant_directory.user_index, current_user.id)
+    match, source = merchant_directory.resolve(name, user_merchants)
+    if match is None:
+        return MerchantRecommendationResponse(merchant=name, recommendations=[])
+    
+    table = await db.run_sync(recommendation_cache.get, current_user.id, year, month)
+    recommendations = [
+        {
+            "card_name": row.card_name,
+            "card_id": row.card_id,
+            "bank_name": row.bank_name,
+            "cashback_percent": row.cashback_percent,
+            "category_name": row.category_name
+        }
+        for row in table.match(match.category)
+    ]
+    
+    return MerchantRecommendationResponse(
+        merchant=name,
+        category=match.category,
+        source=source,
+        recommendations=recommendations
+    )
+
+
+@router.get("/merchants", response_model=List[UserMerchantResponse])
+async def get_user_merchants(
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Магазины, которые пользователь добавил в свой справочник"""
+    merchants = await db.scalars(
+        select(UserMerchant).where(UserMerchant.user_id == current_user.id).order_by(UserMerchant.name)
+    )
+    return merchants.all()
+
+
+@router.post("/merchants", response_model=UserMerchantResponse)
+async def save_user_merchant(
+    merchant: UserMerchantCreate,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Добавить магазин в справочник пользователя или сменить его категорию.
+    Справочник пользователя важнее общего.
+    """
+    if not merchant.name.strip() or not merchant.category_name.strip():
+        raise HTTPException(status_code=400, detail="Merchant name and category are required")
+    
+    db_merchant = await db.scalar(select(UserMerchant).where(
+        UserMerchant.user_id == current_user.id,
+        UserMerchant.name_key == normalize_category_name(merchant.name)
+    ))
+    if db_merchant is None:
+        db_merchant = UserMerchant(user_id=current_user.id)
+        db.add(db_merchant)
+    db_merchant.name = merchant.name.strip()
+    db_merchant.category_name = merchant.category_name.strip()
+    
+    await db.commit()
+    await db.refresh(db_merchant)
+    merchant_directory.invalidate_user(current_user.id)
+    return db_merchant
+
+
+@router.delete("/merchants/{merchant_id}")
+async def delete_user_merchant(
+    merchant_id: int,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Удалить магазин из справочника пользователя"""
+    db_merchant = await db.scalar(select(UserMerchant).where(
+        UserMerchant.id == merchant_id,
+        UserMerchant.user_id == current_user.id
+    ))
+    if not db_merchant:
+        raise HTTPException(status_code=404, detail="Merchant not found")
+    
+    await db.delete(db_merchant)
+    await db.commit()
+    merchant_directory.invalidate_user(current_user.id)
+    return {"message": "Merchant deleted successfully"}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Есть ли etag в заголовке If-None-Match: список через запятую,
+    слабые теги (W/"...") сравниваются по значению, "*" совпадает с любым
+    """
+    value = etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == value:
+            return True
+    return False
+
+
+@router.get("/optimal", response_model=OptimalCardsResponse)
+async def get_optimal_cards(
+    request: Request,
+    response: Response,
+    month: int = None,
+    year: int = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Лучшие карты сразу для всех категорий за месяц"""
+    if not month:
+        month = datetime.now().month
+    if not year:
+        year = datetime.now().year
+    
+    table = await db.run_sync(recommendation_cache.get, current_user.id, year, month)
+    
+    # Данные за месяц не менялись - клиент использует свою копию
+    headers = {"ETag": table.etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match", ""), table.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    
+    categories = []
+    for category_key, rows in table.by_key.items():
+        best = rows[0]
+        categories.append({
+            "category_key": category_key,
+            "category_name": best.category_name,
+            "icon": best.icon or DEFAULT_ICON,
+            "cards": [
+                {
+                    "card_id": row.card_id,
+                    "card_name": row.card_name,
+                    "bank_name": row.bank_name,
+                    "category_id": row.category_id,
+                    "cashback_percent": row.cashback_percent
+                }
+                for row in rows
+            ]
+        })
+    categories.sort(key=lambda x: (-x["cards"][0]["cashback_percent"], x["category_name"]))
+    
+    return OptimalCardsResponse(month=month, year=year, categories=categories)
+
+
+@router.post("/optimize", response_model=OptimizeResponse)
+async def optimize_spend(
+    request: OptimizeRequest,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Распределить траты месяца (сумма по каждой категории) по картам так,
+    чтобы кешбек был максимальным с учётом лимитов и минимальных трат.
+    """
+    month = request.month or datetime.now().month
+    year = request.year or datetime.now().year
+    if any(amount < 0 for amount in request.spend.values()):
+        raise HTTPException(status_code=400, detail="Spend amounts must not be negative")
+    
+    table = await db.run_sync(recommendation_cache.get, current_user.id, year, month)
+    result = optimize_allocation(request.spend, table)
+    return OptimizeResponse(month=month, year=year, **result)
+
+
+async def _plan_selection(
+    choices: List[CategoryChoice],
+    spend: Dict[str, float],
+    month: Optional[int],
+    year: Optional[int],
+    current_user: CurrentUser,
+    db: AsyncSession
+) -> SelectionPlanResponse:
+    month = month or datetime.now().month
+    year = year or datetime.now().year
+    if any(amount < 0 for amount in spend.values()):
+        raise HTTPException(status_code=400, detail="Spend amounts must not be negative")
+    if any(choice.choose < 1 for choice in choices):
+        raise HTTPException(status_code=400, detail="At least one category must be chosen")
+    card_ids = [choice.card_id for choice in choices]
+    if len(set(card_ids)) != len(card_ids):
+        raise HTTPException(status_code=400, detail="Each card can be planned only once")
+    
+    cards = {
+        row.id: row for row in (await db.execute(
+            select(Card.id, Card.name, Card.monthly_cashback_cap).join(Bank).where(
+                Card.id.in_(card_ids),
+                Bank.user_id == current_user.id
+            )
+        )).all()
+    }
+    if len(cards) != len(card_ids):
+        raise HTTPException(status_code=404, detail="Card not found")
+    
+    # Категории планируемых карт будут выбраны заново, остальные карты уже дают кешбек
+    table = await db.run_sync(recommendation_cache.get, current_user.id, year, month)
+    fixed = [
+        (row.category_name, row.cashback_percent, row.cashback_cap, row.icon)
+        for row in table.rows_by_id.values()
+        if row.card_id not in cards
+    ]
+    planned = [
+        PlannedCard(
+            card_id=choice.card_id,
+            name=cards[choice.card_id].name,
+            choose=choice.choose,
+            cap=cards[choice.card_id].monthly_cashback_cap,
+            offers=make_offers(spend, [
+                (
+                    category.category_name,
+                    category.cashback_percent,
+                    category.cashback_cap,
+                    resolve_category_icon(category.category_name, category.icon),
+                )
+                for category in choice.offered
+            ]),
+        )
+        for choice in choices
+    ]
+    
+    # Перебор занимает процессор: не держим цикл событий
+    result = await run_in_threadpool(plan_selection, spend, planned, baseline_offers(spend, fixed))
+    return SelectionPlanResponse(month=month, year=year, **result)
+
+
+@router.post("/cards/{card_id}/plan-selection", response_model=SelectionPlanResponse)
+async def plan_card_selection(
+    card_id: int,
+    request: SelectionPlanRequest,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Выбрать лучшие N категорий из предложенных банком для карты
+    (например, 4 из 10) с учётом трат и категорий других карт.
+    """
+    choice = CategoryChoice(card_id=card_id, choose=request.choose, offered=request.offered)
+    return await _plan_selection([choice], request.spend, request.month, request.year, current_user, db)
+
+
+@router.post("/plan-selection", response_model=SelectionPlanResponse)
+async def plan_cards_selection(
+    request: SelectionPlanBatchRequest,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Выбрать категории сразу для нескольких карт: одна и та же категория
+    не выбирается на двух картах, если это не увеличивает кешбек.
+    """
+    return await _plan_selection(request.cards, request.spend, request.month, request.year, current_user, db)
+
+
+@router.post("/statements/import")
+async def import_statement(
+    request: Request,
+    format: Optional[str] = None,
+    card_id: Optional[int] = None,
+    encoding: str = "utf-8-sig",
+    positive_expenses: bool = False,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Импорт выписки (CSV или OFX в теле запроса): по каждой трате - карта,
+    которой стоило платить, и недополученный кешбек; последняя строка - итоги.
+    Ответ в формате NDJSON отдаётся по мере чтения выписки.
+    card_id - карта, по которой выгружена выписка (если в ней нет колонки кешбека).
+    """
+    if format is not None and format not in STATEMENT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(STATEMENT_FORMATS)}")
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding: {encoding}")
+    if card_id is not None:
+        card = await db.scalar(select(Card.id).join(Bank).where(
+            Card.id == card_id,
+            Bank.user_id == current_user.id
+        ))
+        if not card:
+            raise HTTPException(status_code=404, detail="Card not found")
+    
+    # Тело читается по кускам, а не загружается целиком
+    chunks = request.stream()
+    head = b""
+    async for chunk in chunks:
+        head = chunk
+        if head.strip():
+            break
+    if not head.strip():
+        raise HTTPException(status_code=400, detail="Statement is empty")
+    
+    statement = StatementImport(
+        MissedCashbackAnalyzer(current_user.id, card_id),
+        statement_format=format,
+        encoding=encoding,
+        positive_expenses=positive_expenses,
+    )
+    try:
+        statement.start(head)
+    except StatementError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(statement.stream(chunks), media_type="application/x-ndjson")
+
+
+@router.get("/statistics", response_model=StatisticsResponse)
+async def get_statistics(
+    month: int = None,
+    year: int = None,
+    current_user: CurrentUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Статистика кешбека за месяц: категории, карты, банки и периоды с данными"""
+    if not month:
+        month = datetime.now().month
+    if not year:
+        year = datetime.now().year
+    
+    return await db.run_sync(load_statistics, current_user.id, year, month)
+
+
+@router.get("/cache-stats", include_in_schema=False)
+def get_cache_stats(current_user: CurrentUser = Depends(get_current_active_user)):
+    """Счётчики попаданий в кеш рекомендаций (только при CACHE_STATS_ENABLED=1)"""
+    if not recommendations.CACHE_STATS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return recommendation_cache.stats()
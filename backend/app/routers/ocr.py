@@ -1,189 +1,222 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from PIL import Image
-import pytesseract
-import io
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import json
+import os
 import re
-from app.models import OCRResponse
+from app.database import get_db
+from app.executors import BoundedProcessPool, PoolBrokenError, PoolSaturatedError
+from app.categories import STOP_WORDS, get_category_icon
+from app.models import OCRResponse, OCRJob, OCRJobResponse
+from app.ocr_cache import OCRResultCache
+from app.ocr_engine import OCREngineUnavailable, PreprocessSettings, init_worker, recognize_text
+from app.ocr_jobs import OCRJobQueue, job_to_response, submit_job
 from typing import List, Dict
 
 router = APIRouter(prefix="/ocr", tags=["ocr"])
 
+# Пул процессов для Tesseract: OCR не блокирует event loop,
+# а при переполнении очереди загрузки отклоняются с кодом 503
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "8"))
+# Максимальное число файлов в одной пакетной загрузке
+OCR_BATCH_MAX_FILES = int(os.getenv("OCR_BATCH_MAX_FILES", "20"))
 
-def get_category_icon(category_name: str) -> str:
-    """Определяет иконку для категории по её названию"""
-    category_lower = category_name.lower()
-    
-    icon_mapping = {
-        'азс': 'local_gas_station',
-        'заправка': 'local_gas_station',
-        'бензин': 'local_gas_station',
-        'кафе': 'restaurant',
-        'ресторан': 'restaurant',
-        'еда': 'restaurant',
-        'супермаркет': 'shopping_cart',
-        'продукты': 'shopping_cart',
-        'магазин': 'shopping_cart',
-        'аптека': 'local_pharmacy',
-        'лекарство': 'local_pharmacy',
-        'медицина': 'local_pharmacy',
-        'клиника': 'medical_services',
-        'больница': 'medical_services',
-        'транспорт': 'directions_bus',
-        'автобус': 'directions_bus',
-        'метро': 'train',
-        'такси': 'local_taxi',
-        'билет': 'confirmation_number',
-        'кино': 'movie',
-        'развлечение': 'sports_esports',
-        'игра': 'sports_esports',
-        'онлайн': 'shopping_bag',
-        'интернет': 'shopping_bag',
-        'курс': 'school',
-        'образование': 'school',
-        'книга': 'menu_book',
-        'отель': 'hotel',
-        'путешествие': 'flight',
-        'авиа': 'flight',
-        'спорт': 'fitness_center',
-        'тренажер': 'fitness_center',
-        'красота': 'face',
-        'салон': 'content_cut',
-        'ремонт': 'build',
-        'стройка': 'construction',
-        'услуга': 'support_agent',
-    }
+# Кеш результатов: повторная загрузка того же скриншота не запускает OCR.
+# OCR_CACHE_DIR включает дисковый уровень, например /app/uploads/ocr_cache
+ocr_cache = OCRResultCache(
+    max_entries=int(os.getenv("OCR_CACHE_SIZE", "256")),
+    disk_dir=os.getenv("OCR_CACHE_DIR"),
+    max_disk_entries=int(os.getenv("OCR_CACHE_DISK_SIZE", "5000")),
+)
+
+# Настройки распознавания, общие для всех OCR-эндпоинтов; входят в ключ кеша
+OCR_LANG = os.getenv("OCR_LANG", "rus+eng")
+OCR_PREPROCESS = PreprocessSettings.from_env()
+OCR_SETTINGS_KEY = f"lang={OCR_LANG};{OCR_PREPROCESS.cache_key()};clean=1"
+# Движок: tesserocr (модель держится в памяти процесса) или pytesseract
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+
+# Каждый процесс пула поднимает движок OCR при запуске
+ocr_pool = BoundedProcessPool(
+    "ocr",
+    workers=OCR_WORKERS,
+    queue_size=OCR_QUEUE_SIZE,
+    initializer=init_worker,
+    initargs=(OCR_ENGINE, OCR_LANG),
+)
+
+
+def queue_full_error() -> HTTPException:
+    """Ответ 503 при переполнении очереди OCR"""
+    return HTTPException(
+        status_code=503,
+        detail="OCR queue is full, try again later",
+        headers={"Retry-After": "5"},
+    )
+
+
+def worker_crashed_error() -> HTTPException:
+    """Ответ 503, если процесс OCR-пула упал и при повторной попытке"""
+    return HTTPException(
+        status_code=503,
+        detail="OCR worker crashed, try again later",
+        headers={"Retry-After": "5"},
+    )
+
+
+# Окончания служебных слов: "подробнее", "далее", "больше", "еще"
+NOISE_SUFFIXES = ('ее', 'ше', 'ще')
+
+# Текст разбивается за один проход на токены:
+# - percent: число со знаком процента ("5%", "1,5 %")
+# - words: непрерывный участок из букв, пробелов и дефисов
+# - other: всё остальное (знаки препинания, отдельные цифры)
+_TOKEN_RE = re.compile(
+    r'(?P<percent>\d+(?:[.,]\d+)?)\s*%'
+    r'|(?P<words>[А-ЯЁа-яёA-Za-z\s\-]+)'
+    r'|(?P<other>[^\dА-ЯЁа-яёA-Za-z\s\-]+|\d)',
+    re.IGNORECASE
+)
+_CATEGORY_JUNK_RE = re.compile(r'[^\w\s\-а-яА-ЯёЁ]')
+_SINGLE_LETTER_RE = re.compile(r'\b[а-яА-Яa-z]\b')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def _parse_percent(value: str):
+    try:
+        return float(value.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _clean_category(category: str) -> str:
+    """Очистка названия категории от иконок, стоп-слов и мусора"""
+    category = _CATEGORY_JUNK_RE.sub(' ', category).strip()
     
-    for key, icon in icon_mapping.items():
-        if key in category_lower:
-            return icon
+    # НЕ убираем "все" - оставляем "Все покупки" как есть
+    # Удаляем стоп-слова и слова, которые явно не являются названиями категорий
+    words = []
+    for word in category.split():
+        word_lower = word.lower()
+        if (len(word) > 1 and
+                word_lower not in STOP_WORDS and
+                not word_lower.endswith(NOISE_SUFFIXES)):
+            words.append(word)
+    category = ' '.join(words)
     
-    return 'shopping_cart'  # Иконка по умолчанию
+    # Удаляем одиночные буквы и множественные пробелы
+    category = _SINGLE_LETTER_RE.sub('', category).strip()
+    return _SPACES_RE.sub(' ', category).strip()
 
 
 def extract_cashback_info(text: str) -> List[Dict[str, float]]:
     """
     Извлекает категории и проценты кешбека из текста.
-    Использует регулярные выражения для поиска паттернов типа:
-    - "Категория: 5%" или "5% кешбек на АЗС"
+    Текст разбирается за один проход; для каждого процента проверяются паттерны:
+    - "5% Рестораны" (процент перед категорией, в том числе "5% на АЗС")
+    - "Рестораны: 5%" или "Рестораны - 5%"
+    - "Супермаркеты 2%"
+    Сначала идут совпадения первого паттерна, затем второго и третьего.
     """
-    categories = []
-    seen = set()  # Для избежания дубликатов
+    percent_first = []  # (процент, категория)
+    with_separator = []  # (категория, процент)
+    category_first = []  # (категория, процент)
     
-    # Слова, которые нужно удалить из названий категорий
-    stop_words = [
-        'подробнее', 'далее', 'еще', 'больше', 'всего', 'итого',
-        'сумма', 'бонус', 'кешбек', 'накопления', 'процент', '%', 'руб',
-        'рублей', 'коп', 'копеек', 'до', 'от', 'с', 'по', 'на', 'за',
-        'в', 'во', 'к', 'ко', 'о', 'об', 'обо', 'при', 'про', 'со', 'из',
-        'изо', 'над', 'под', 'подо', 'перед', 'передо', 'за', 'зао',
-        'между', 'среди', 'через', 'сквозь', 'для', 'ради', 'благодаря',
-        'согласно', 'вопреки', 'навстречу', 'наподобие', 'вроде', 'вследствие',
-        'ввиду', 'вслед', 'вместо', 'кроме', 'сверх', 'среди', 'между',
-        'около', 'возле', 'близ', 'вдоль', 'вокруг', 'около', 'против',
-        'напротив', 'позади', 'впереди', 'сверху', 'снизу', 'внутри',
-        'снаружи', 'вне', 'внутрь', 'наружу', 'вверх', 'вниз', 'вперед',
-        'назад', 'влево', 'вправо', 'налево', 'направо', 'туда', 'сюда',
-        'оттуда', 'отсюда', 'везде', 'всюду', 'нигде', 'никуда', 'никуда',
-        'никогда', 'всегда', 'иногда', 'часто', 'редко', 'всегда', 'никогда'
-    ]
+    # Три предыдущих токена: (тип, текст)
+    prev = prev2 = prev3 = (None, None)
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        value = match.group(kind)
+        
+        if kind == 'words':
+            if prev[0] == 'percent':
+                percent_first.append((prev[1], value))
+        elif kind == 'percent':
+            if prev[0] == 'other' and prev[1] == ':' and prev2[0] == 'words':
+                # "Рестораны:5%"
+                with_separator.append((prev2[1], value))
+            elif (prev[0] == 'words' and prev[1].isspace() and
+                    prev2 == ('other', ':') and prev3[0] == 'words'):
+                # "Рестораны: 5%"
+                with_separator.append((prev3[1], value))
+            elif prev[0] == 'words':
+                # "Рестораны - 5%"
+                stripped = prev[1].rstrip()
+                if len(stripped) > 1 and stripped.endswith('-'):
+                    with_separator.append((stripped[:-1], value))
+            
+            if prev[0] == 'words' and len(prev[1]) > 1 and prev[1][-1].isspace():
+                category_first.append((prev[1][:-1], value))
+        
+        prev3, prev2, prev = prev2, prev, (kind, value)
     
-    # Улучшенные паттерны для русских текстов
-    patterns = [
-        # Процент перед названием категории: "5% Рестораны"
-        r'(\d+(?:[.,]\d+)?)\s*%\s*([А-ЯЁа-яёA-Za-z\s\-]+)',
-        # Название категории перед процентом: "Рестораны: 5%"
-        r'([А-ЯЁа-яёA-Za-z\s\-]+)[:\-]\s*(\d+(?:[.,]\d+)?)\s*%',
-        # Название категории перед процентом без двоеточия: "Супермаркеты 2%"
-        r'([А-ЯЁа-яёA-Za-z\s\-]+)\s+(\d+(?:[.,]\d+)?)\s*%',
-        # Процент на/для категории: "5% на АЗС"
-        r'(\d+(?:[.,]\d+)?)\s*%\s*на\s+([А-ЯЁа-яёA-Za-z\s\-]+)',
-        # Процент для категории: "5% для АЗС"
-        r'(\d+(?:[.,]\d+)?)\s*%\s*для\s+([А-ЯЁа-яёA-Za-z\s\-]+)',
-    ]
+    categories = []
+    seen = {}  # нормализованное название -> найденные проценты
     
-    for pattern in patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
-        for match in matches:
-            groups = match.groups()
-            if len(groups) == 2:
-                try:
-                    # Пытаемся найти процент и категорию
-                    # Проверяем первую группу - это процент?
-                    try:
-                        percent_str = groups[0].replace(',', '.')
-                        percent = float(percent_str)
-                        category = groups[1].strip()
-                    except ValueError:
-                        # Если не процент, значит первая группа - категория
-                        try:
-                            percent_str = groups[1].replace(',', '.')
-                            percent = float(percent_str)
-                            category = groups[0].strip()
-                        except ValueError:
-                            continue
-                    
-                    # Очистка категории от лишних символов, иконок и мусора
-                    category = re.sub(r'[^\w\s\-а-яА-ЯёЁ]', ' ', category).strip()
-                    
-                    # НЕ убираем "все" - оставляем "Все покупки" как есть
-                    
-                    # Специальная обработка для случаев типа "Аптеки Подробнее"
-                    # Если есть слово "подробнее" или подобные, убираем их
-                    if 'подробнее' in category.lower() or 'далее' in category.lower():
-                        # Убираем слова "подробнее" и "далее" из конца
-                        words = category.split()
-                        filtered_words = []
-                        for word in words:
-                            if word.lower() not in ['подробнее', 'далее']:
-                                filtered_words.append(word)
-                        category = ' '.join(filtered_words)
-                    
-                    # Удаляем стоп-слова и лишние слова
-                    words = category.split()
-                    filtered_words = []
-                    for word in words:
-                        word_lower = word.lower()
-                        # Пропускаем стоп-слова и слова, которые явно не являются названиями категорий
-                        if (word_lower not in stop_words and 
-                            len(word) > 1 and 
-                            not word_lower.endswith('ее') and  # "подробнее", "далее"
-                            not word_lower.endswith('ше') and  # "больше"
-                            not word_lower.endswith('ще') and  # "еще"
-                            word_lower not in ['всего', 'итого', 'сумма', 'бонус']):
-                            filtered_words.append(word)
-                    category = ' '.join(filtered_words)
-                    
-                    # Удаляем одиночные буквы и цифры
-                    category = re.sub(r'\b[а-яА-Яa-z]\b', '', category).strip()
-                    # Удаляем множественные пробелы
-                    category = re.sub(r'\s+', ' ', category).strip()
-                    
-                    # Фильтрация
-                    if len(category) > 2 and 0 <= percent <= 100:
-                        # Нормализуем название категории для дедупликации
-                        normalized_category = category.lower().strip()
-                        
-                        # Проверяем, не является ли это дубликатом
-                        is_duplicate = False
-                        for existing_cat in categories:
-                            if (existing_cat["category_name"].lower().strip() == normalized_category and 
-                                abs(existing_cat["cashback_percent"] - percent) < 0.1):
-                                is_duplicate = True
-                                break
-                        
-                        if not is_duplicate:
-                            categories.append({
-                                "category_name": category,
-                                "cashback_percent": percent,
-                                "icon": get_category_icon(category)
-                            })
-                except Exception:
-                    continue
+    candidates = percent_first + with_separator + category_first
+    for first, second in candidates:
+        # Определяем, какая из групп - процент, а какая - категория
+        percent = _parse_percent(first)
+        if percent is not None:
+            category = second.strip()
+        else:
+            percent = _parse_percent(second)
+            if percent is None:
+                continue
+            category = first.strip()
+        
+        category = _clean_category(category)
+        
+        # Фильтрация
+        if len(category) > 2 and 0 <= percent <= 100:
+            # Нормализуем название категории для дедупликации
+            normalized_category = category.lower().strip()
+            percents = seen.setdefault(normalized_category, [])
+            if any(abs(existing - percent) < 0.1 for existing in percents):
+                continue
+            percents.append(percent)
+            categories.append({
+                "category_name": category,
+                "cashback_percent": percent,
+                "icon": get_category_icon(category)
+            })
     
     return categories
 
 
+def clean_ocr_text(text: str) -> str:
+    """Очистка распознанного текста от мусора и иконок"""
+    # Удаляем странные символы и иконки, но оставляем важные для распознавания
+    text = re.sub(r'[^\w\s%\.,:;\-\+\*\&\(\)\[\]а-яА-ЯёЁ]', ' ', text)
+    # Удаляем одиночные символы-мусор
+    text = re.sub(r'\s[^\w%а-яА-ЯёЁ]\s', ' ', text)
+    # Удаляем одиночные цифры и буквы, которые не являются процентами
+    text = re.sub(r'\b[а-яА-Яa-z]\b(?!\s*%)', ' ', text)
+    # Нормализуем пробелы
+    text = re.sub(r'\s+', ' ', text)
+    # Удаляем лишние пробелы в начале и конце
+    return text.strip()
+
+
+async def recognize_screenshot(image_bytes: bytes) -> List[Dict]:
+    """Распознаёт скриншот в OCR-пуле и извлекает категории кешбека"""
+    cache_key = OCRResultCache.make_key(image_bytes, OCR_SETTINGS_KEY)
+    categories = ocr_cache.get(cache_key)
+    if categories is not None:
+        return categories
+    
+    # Подготавливаем изображение и применяем OCR с поддержкой русского языка
+    text = await ocr_pool.run(recognize_text, image_bytes, OCR_PREPROCESS)
+    categories = extract_cashback_info(clean_ocr_text(text))
+    ocr_cache.put(cache_key, categories)
+    return categories
+
+
+job_queue = OCRJobQueue(recognize_screenshot, workers=OCR_WORKERS)
+
+
 @router.post("/screenshot", response_model=OCRResponse)
 async def process_screenshot(file: UploadFile = File(...)):
     """
@@ -195,45 +228,17 @@ async def process_screenshot(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Читаем изображение
+        # Читаем изображение и извлекаем категории
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Конвертируем в RGB, если нужно
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Улучшение качества изображения для лучшего распознавания
-        # Увеличиваем контраст
-        from PIL import ImageEnhance
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(2.0)
-        
-        # Применяем OCR с поддержкой русского языка
-        try:
-            text = pytesseract.image_to_string(image, lang='rus+eng')
-        except Exception:
-            # Если русский не установлен, используем английский
-            text = pytesseract.image_to_string(image, lang='eng')
-        
-        # Очистка текста от мусора и иконок
-        # Удаляем странные символы и иконки, но оставляем важные для распознавания
-        text = re.sub(r'[^\w\s%\.,:;\-\+\*\&\(\)\[\]а-яА-ЯёЁ]', ' ', text)
-        # Удаляем одиночные символы-мусор
-        text = re.sub(r'\s[^\w%а-яА-ЯёЁ]\s', ' ', text)
-        # Удаляем одиночные цифры и буквы, которые не являются процентами
-        text = re.sub(r'\b[а-яА-Яa-z]\b(?!\s*%)', ' ', text)
-        # Нормализуем пробелы
-        text = re.sub(r'\s+', ' ', text)
-        # Удаляем лишние пробелы в начале и конце
-        text = text.strip()
-        
-        # Извлекаем категории из текста
-        categories = extract_cashback_info(text)
+        categories = await recognize_screenshot(contents)
         
         return OCRResponse(categories=categories)
         
-    except pytesseract.TesseractNotFoundError:
+    except PoolSaturatedError:
+        raise queue_full_error()
+    except PoolBrokenError:
+        raise worker_crashed_error()
+    except OCREngineUnavailable:
         raise HTTPException(
             status_code=500, 
             detail="Tesseract OCR не установлен. Установите его через: brew install tesseract"
@@ -242,6 +247,60 @@ async def process_screenshot(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 
+@router.post("/screenshots")
+async def process_screenshots(files: List[UploadFile] = File(...)):
+    """
+    Пакетная обработка скриншотов.
+    Файлы распознаются параллельно, результаты возвращаются в формате NDJSON
+    по мере готовности: одна строка JSON на каждый файл.
+    """
+    if len(files) > OCR_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files, maximum is {OCR_BATCH_MAX_FILES}"
+        )
+    
+    # Читаем файлы до начала ответа: после него загрузки будут закрыты
+    uploads = []
+    for index, file in enumerate(files):
+        is_image = bool(file.content_type) and file.content_type.startswith("image/")
+        uploads.append((index, file.filename, await file.read() if is_image else None))
+    
+    # Не занимаем больше процессов, чем есть в пуле, чтобы не вытеснять другие загрузки
+    semaphore = asyncio.Semaphore(ocr_pool.workers)
+    
+    async def process(index: int, filename: str, contents) -> Dict:
+        result = {"index": index, "filename": filename}
+        if contents is None:
+            result["error"] = "File must be an image"
+            return result
+        try:
+            async with semaphore:
+                result["categories"] = await recognize_screenshot(contents)
+        except PoolSaturatedError:
+            result["error"] = "OCR queue is full, try again later"
+        except PoolBrokenError:
+            result["error"] = "OCR worker crashed, try again later"
+        except OCREngineUnavailable:
+            result["error"] = "Tesseract OCR не установлен"
+        except Exception as e:
+            result["error"] = f"Error processing image: {str(e)}"
+        return result
+    
+    async def stream():
+        tasks = [asyncio.create_task(process(*upload)) for upload in uploads]
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Клиент отключился: отменяем оставшиеся файлы
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.post("/screenshot-base64", response_model=OCRResponse)
 async def process_screenshot_base64(data: dict):
     """
@@ -254,20 +313,49 @@ async def process_screenshot_base64(data: dict):
         image_base64 = data.get("image_base64", "")
         image_bytes = base64.b64decode(image_base64)
         
-        # Открываем изображение
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Конвертируем в RGB
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Применяем OCR
-        text = pytesseract.image_to_string(image)
-        
-        # Извлекаем категории
-        categories = extract_cashback_info(text)
+        # Распознаём так же, как загруженный файл
+        categories = await recognize_screenshot(image_bytes)
         
         return OCRResponse(categories=categories)
         
+    except PoolSaturatedError:
+        raise queue_full_error()
+    except PoolBrokenError:
+        raise worker_crashed_error()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+
+@router.post("/jobs", response_model=OCRJobResponse, status_code=202)
+async def create_ocr_job(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    """
+    Ставит скриншот в очередь на распознавание и сразу возвращает задачу.
+    Повторная загрузка того же файла возвращает уже существующую задачу.
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    contents = await file.read()
+    image_hash = OCRResultCache.make_key(contents, OCR_SETTINGS_KEY)
+    job, queued = await db.run_sync(submit_job, image_hash, contents)
+    if queued:
+        job_queue.enqueue(job.id)
+    return job_to_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=OCRJobResponse)
+async def get_ocr_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    """Получить статус и результат OCR-задачи"""
+    job = await db.get(OCRJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="OCR job not found")
+    return job_to_response(job)
+
+
+@router.get("/stats")
+def get_ocr_stats():
+    """Загрузка OCR-пула: длина очереди и время обработки скриншотов"""
+    stats = ocr_pool.stats()
+    stats["jobs_pending"] = job_queue.pending()
+    stats["cache"] = ocr_cache.stats()
+    return stats
@@ -0,0 +1,429 @@
+"""
+Импорт банковской выписки (CSV или OFX) и подсчёт недополученного кешбека.
+
+Выписка читается потоком: тело запроса разбирается по мере получения
+кусков, каждый кусок обрабатывается в пуле потоков и сразу отдаётся
+клиенту строками NDJSON, поэтому память не растёт с размером файла.
+
+Категория операции определяется по справочнику магазинов (app.merchants),
+а если магазин не найден - по категории из самой выписки. Таблица
+рекомендаций каждого месяца берётся из recommendation_cache один раз
+за импорт, сопоставление категории с картами тоже запоминается.
+"""
+import codecs
+import csv
+import io
+import json
+import re
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import date
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple, Union
+from fastapi.concurrency import run_in_threadpool
+from app.categories import normalize_category_name
+from app.database import SessionLocal
+from app.merchants import MerchantDirectory, MerchantIndex, merchant_directory
+from app.recommendations import RecommendationRow, RecommendationTable, recommendation_cache
+
+STATEMENT_FORMATS = ("csv", "ofx")
+
+# Названия колонок CSV в порядке приоритета (выгрузки разных банков)
+_DATE_COLUMNS = ("дата операции", "дата", "date", "transaction date", "дата платежа")
+_AMOUNT_COLUMNS = ("сумма операции", "сумма", "amount", "сумма платежа", "сумма в валюте карты")
+_DESCRIPTION_COLUMNS = ("описание", "description", "назначение платежа", "merchant", "payee", "контрагент", "название")
+_CATEGORY_COLUMNS = ("категория", "category")
+_CASHBACK_COLUMNS = ("кэшбэк", "кешбек", "кешбэк", "cashback")
+
+_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})|(\d{2})[./](\d{2})[./](\d{4})|(\d{4})(\d{2})(\d{2})")
+_AMOUNT_JUNK_RE = re.compile(r"[^\d.,+-]")
+_OFX_TRANSACTION_RE = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.IGNORECASE | re.DOTALL)
+_OFX_FIELD_RE = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+class StatementError(ValueError):
+    """Выписку нельзя разобрать (нет нужных колонок, неизвестный формат)"""
+
+
+class Transaction(NamedTuple):
+    row: int  # номер операции в выписке
+    date: date
+    amount: float  # сумма траты, положительная
+    description: str
+    bank_category: Optional[str]  # категория, которую указал банк
+    cashback: Optional[float]  # кешбек, который начислил банк
+
+
+# Результат разбора строки: операция или описание ошибки {"row": ..., "error": ...}
+ParsedItem = Union[Transaction, Dict]
+
+
+def detect_format(head: str) -> str:
+    """Формат выписки по началу файла"""
+    start = head.lstrip("\ufeff \r\n\t")[:1024].upper()
+    if start.startswith("OFXHEADER") or "<OFX>" in start:
+        return "ofx"
+    return "csv"
+
+
+def parse_amount(text: str) -> float:
+    """Сумма с пробелами тысяч и десятичной запятой ("-1 234,56 ₽")"""
+    value = _AMOUNT_JUNK_RE.sub("", text)
+    if "," in value and "." in value:
+        # Разделитель тысяч стоит раньше десятичного
+        value = value.replace("," if value.index(",") < value.index(".") else ".", "")
+    return float(value.replace(",", "."))
+
+
+def parse_date(text: str) -> date:
+    """Дата в формате ГГГГ-ММ-ДД, ДД.ММ.ГГГГ, ДД/ММ/ГГГГ или ГГГГММДД из OFX (время игнорируется)"""
+    found = _DATE_RE.search(text)
+    if not found:
+        raise ValueError(f"Unknown date format: {text!r}")
+    if found.group(1):
+        return date(int(found.group(1)), int(found.group(2)), int(found.group(3)))
+    if found.group(4):
+        return date(int(found.group(6)), int(found.group(5)), int(found.group(4)))
+    return date(int(found.group(7)), int(found.group(8)), int(found.group(9)))
+
+
+class _StatementParser(ABC):
+    """Разбор выписки по кускам текста: feed() возвращает готовые операции"""
+
+    def __init__(self, positive_expenses: bool = False):
+        # Обычно траты в выписке отрицательные, у некоторых банков - положительные
+        self.sign = 1 if positive_expenses else -1
+        self.rows = 0
+
+    def _transaction(
+        self,
+        date_text: str,
+        amount_text: str,
+        description: str,
+        bank_category: Optional[str] = None,
+        cashback_text: Optional[str] = None,
+    ) -> Optional[ParsedItem]:
+        self.rows += 1
+        try:
+            amount = parse_amount(amount_text) * self.sign
+            operation_date = parse_date(date_text)
+            cashback = abs(parse_amount(cashback_text)) if cashback_text and cashback_text.strip() else None
+        except ValueError as e:
+            return {"row": self.rows, "error": str(e)}
+        if amount <= 0:
+            # Пополнения и возвраты не участвуют в подсчёте кешбека
+            return None
+        return Transaction(self.rows, operation_date, amount, description.strip(), bank_category or None, cashback)
+
+    @abstractmethod
+    def feed(self, text: str) -> List[ParsedItem]:
+        """Разбирает очередной кусок текста; незаконченная строка ждёт следующего"""
+
+    @abstractmethod
+    def close(self) -> List[ParsedItem]:
+        """Разбирает то, что осталось после последнего куска"""
+
+
+def _find_column(header: List[str], names: Tuple[str, ...]) -> Optional[int]:
+    normalized = [normalize_category_name(cell) for cell in header]
+    for name in names:
+        if name in normalized:
+            return normalized.index(name)
+    for name in names:
+        for index, cell in enumerate(normalized):
+            if cell.startswith(name):
+                return index
+    return None
+
+
+class CsvStatementParser(_StatementParser):
+    """CSV с заголовком; разделитель (; , или табуляция) определяется по заголовку"""
+
+    def __init__(self, positive_expenses: bool = False):
+        super().__init__(positive_expenses)
+        self._buffer = ""
+        self._delimiter: Optional[str] = None
+        self._columns: Optional[Dict[str, Optional[int]]] = None
+
+    def _take_complete(self, final: bool) -> str:
+        """Текст до последнего перевода строки вне кавычек"""
+        if final:
+            text, self._buffer = self._buffer, ""
+            return text
+        end = len(self._buffer)
+        while True:
+            cut = self._buffer.rfind("\n", 0, end)
+            if cut < 0:
+                return ""
+            # Чётное число кавычек до переноса - строка не оборвана внутри поля
+            if self._buffer.count('"', 0, cut) % 2 == 0:
+                text, self._buffer = self._buffer[:cut + 1], self._buffer[cut + 1:]
+                return text
+            end = cut
+
+    def _read_header(self, line: str):
+        self._delimiter = max(";,\t", key=line.count)
+        header = next(csv.reader([line], delimiter=self._delimiter))
+        self._columns = {
+            "date": _find_column(header, _DATE_COLUMNS),
+            "amount": _find_column(header, _AMOUNT_COLUMNS),
+            "description": _find_column(header, _DESCRIPTION_COLUMNS),
+            "category": _find_column(header, _CATEGORY_COLUMNS),
+            "cashback": _find_column(header, _CASHBACK_COLUMNS),
+        }
+        if self._columns["date"] is None or self._columns["amount"] is None:
+            raise StatementError("CSV header must contain date and amount columns")
+
+    def _parse(self, text: str) -> List[ParsedItem]:
+        if self._columns is None:
+            text = text.lstrip("\ufeff\r\n")
+            if not text:
+                return []
+            line_end = text.find("\n")
+            self._read_header(text if line_end < 0 else text[:line_end])
+            text = "" if line_end < 0 else text[line_end + 1:]
+
+        columns = self._columns
+        width = max(index for index in columns.values() if index is not None) + 1
+        items = []
+        for record in csv.reader(io.StringIO(text), delimiter=self._delimiter):
+            if not any(cell.strip() for cell in record):
+                continue
+            if len(record) < width:
+                record = record + [""] * (width - len(record))
+            item = self._transaction(
+                record[columns["date"]],
+                record[columns["amount"]],
+                record[columns["description"]] if columns["description"] is not None else "",
+                record[columns["category"]].strip() if columns["category"] is not None else None,
+                record[columns["cashback"]] if columns["cashback"] is not None else None,
+            )
+            if item is not None:
+                items.append(item)
+        return items
+
+    def feed(self, text: str) -> List[ParsedItem]:
+        self._buffer += text
+        return self._parse(self._take_complete(final=False))
+
+    def close(self) -> List[ParsedItem]:
+        items = self._parse(self._take_complete(final=True))
+        if self._columns is None:
+            raise StatementError("Statement is empty")
+        return items
+
+
+class OfxStatementParser(_StatementParser):
+    """OFX 1.x (SGML) и 2.x (XML): операции из блоков <STMTTRN>"""
+
+    def __init__(self, positive_expenses: bool = False):
+        super().__init__(positive_expenses)
+        self._buffer = ""
+
+    def _parse(self, text: str) -> Tuple[List[ParsedItem], int]:
+        items = []
+        end = 0
+        for found in _OFX_TRANSACTION_RE.finditer(text):
+            fields = {name.upper(): value.strip() for name, value in _OFX_FIELD_RE.findall(found.group(1))}
+            description = " ".join(filter(None, (fields.get("NAME"), fields.get("MEMO"))))
+            item = self._transaction(fields.get("DTPOSTED", ""), fields.get("TRNAMT", ""), description)
+            if item is not None:
+                items.append(item)
+            end = found.end()
+        return items, end
+
+    def feed(self, text: str) -> List[ParsedItem]:
+        self._buffer += text
+        items, end = self._parse(self._buffer)
+        rest = self._buffer[end:]
+        # Храним только начало незаконченной операции
+        start = rest.upper().rfind("<STMTTRN>")
+        self._buffer = rest[start:] if start >= 0 else rest[-len("<STMTTRN>"):]
+        return items
+
+    def close(self) -> List[ParsedItem]:
+        items, _ = self._parse(self._buffer)
+        self._buffer = ""
+        return items
+
+
+def make_parser(statement_format: str, positive_expenses: bool = False) -> _StatementParser:
+    if statement_format == "ofx":
+        return OfxStatementParser(positive_expenses)
+    if statement_format == "csv":
+        return CsvStatementParser(positive_expenses)
+    raise StatementError(f"Unknown statement format: {statement_format}")
+
+
+class MissedCashbackAnalyzer:
+    """
+    Лучшая карта для каждой операции и недополученный кешбек.
+
+    Полученный кешбек берётся из колонки выписки, если она есть, иначе
+    считается по категориям карты выписки (card_id), иначе равен нулю.
+    Лимиты кешбека категорий и карт копятся по месяцам отдельно для
+    лучших карт и для карты выписки.
+    """
+
+    def __init__(self, user_id: int, card_id: Optional[int] = None, directory: MerchantDirectory = merchant_directory):
+        self.user_id = user_id
+        self.card_id = card_id
+        self.directory = directory
+        self._user_merchants: Optional[MerchantIndex] = None
+        self._tables: Dict[Tuple[int, int], RecommendationTable] = {}
+        self._best_earned: Dict[Tuple, float] = defaultdict(float)
+        self._card_earned: Dict[Tuple, float] = defaultdict(float)
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def _table(self, year: int, month: int) -> RecommendationTable:
+        period = (year, month)
+        table = self._tables.get(period)
+        if table is None:
+            db = SessionLocal()
+            try:
+                table = recommendation_cache.get(db, self.user_id, year, month)
+            finally:
+                db.close()
+            self._tables[period] = table
+        return table
+
+    def _merchants(self) -> MerchantIndex:
+        if self._user_merchants is None:
+            db = SessionLocal()
+            try:
+                self._user_merchants = self.directory.user_index(db, self.user_id)
+            finally:
+                db.close()
+        return self._user_merchants
+
+    @staticmethod
+    def _earn(
+        rows: List[RecommendationRow], amount: float, period: Tuple[int, int], earned: Dict[Tuple, float]
+    ) -> Tuple[Optional[RecommendationRow], float]:
+        """Первая карта из rows, у которой не исчерпан лимит, и кешбек по ней"""
+        for row in rows:
+            if row.cashback_percent <= 0:
+                break
+            cashback = amount * row.cashback_percent / 100
+            if row.cashback_cap is not None:
+                cashback = min(cashback, row.cashback_cap - earned[(period, "category", row.category_id)])
+            if row.card_cashback_cap is not None:
+                cashback = min(cashback, row.card_cashback_cap - earned[(period, "card", row.card_id)])
+            if cashback <= 0:
+                continue
+            earned[(period, "category", row.category_id)] += cashback
+            earned[(period, "card", row.card_id)] += cashback
+            return row, cashback
+        return None, 0.0
+
+    def _analyze_one(self, item: Transaction) -> Dict:
+        category = self.directory.classify(item.description, self._merchants())
+        source = "merchant" if category else None
+        if category is None and item.bank_category:
+            category, source = item.bank_category, "statement"
+
+        period = (item.date.year, item.date.month)
+        rows = self._table(*period).match(category) if category else []
+        best, best_cashback = self._earn(rows, item.amount, period, self._best_earned)
+
+        if item.cashback is not None:
+            received = item.cashback
+        elif self.card_id is not None:
+            own_rows = [row for row in rows if row.card_id == self.card_id]
+            received = self._earn(own_rows, item.amount, period, self._card_earned)[1]
+        else:
+            received = 0.0
+        missed = max(0.0, best_cashback - received)
+
+        self.counts["transactions"] += 1
+        self.counts["classified" if category else "unclassified"] += 1
+        self.totals["spend"] += item.amount
+        self.totals["best_cashback"] += best_cashback
+        self.totals["received_cashback"] += received
+        self.totals["missed_cashback"] += missed
+        return {
+            "row": item.row,
+            "date": item.date.isoformat(),
+            "description": item.description,
+            "amount": round(item.amount, 2),
+            "category": category,
+            "category_source": source,
+            "best_card_id": best.card_id if best else None,
+            "best_card_name": best.card_name if best else None,
+            "best_bank_name": best.bank_name if best else None,
+            "best_percent": best.cashback_percent if best else None,
+            "best_cashback": round(best_cashback, 2),
+            "received_cashback": round(received, 2),
+            "missed_cashback": round(missed, 2),
+        }
+
+    def analyze(self, items: List[ParsedItem]) -> str:
+        """Строки NDJSON для пачки разобранных операций"""
+        lines = []
+        for item in items:
+            if isinstance(item, Transaction):
+                result = self._analyze_one(item)
+            else:
+                self.counts["errors"] += 1
+                result = item
+            lines.append(json.dumps(result, ensure_ascii=False))
+        return "".join(line + "\n" for line in lines)
+
+    def summary(self) -> Dict:
+        return {
+            "summary": {
+                "transactions": self.counts["transactions"],
+                "classified": self.counts["classified"],
+                "unclassified": self.counts["unclassified"],
+                "errors": self.counts["errors"],
+                "months": [f"{year}-{month:02d}" for year, month in sorted(self._tables)],
+                **{name: round(self.totals[name], 2) for name in (
+                    "spend", "best_cashback", "received_cashback", "missed_cashback"
+                )},
+            }
+        }
+
+
+class StatementImport:
+    """Импорт одной выписки: разбор кусков тела запроса и анализ операций"""
+
+    def __init__(
+        self,
+        analyzer: MissedCashbackAnalyzer,
+        statement_format: Optional[str] = None,
+        encoding: str = "utf-8-sig",
+        positive_expenses: bool = False,
+    ):
+        self.analyzer = analyzer
+        self.format = statement_format
+        self.positive_expenses = positive_expenses
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._parser: Optional[_StatementParser] = None
+        self._pending: List[ParsedItem] = []
+
+    def start(self, head: bytes):
+        """
+        Разбирает первый кусок до начала ответа, чтобы ошибки формата
+        вернуть обычным ответом 400, а не строкой в потоке.
+        """
+        text = self._decoder.decode(head)
+        self._parser = make_parser(self.format or detect_format(text), self.positive_expenses)
+        self._pending = self._parser.feed(text)
+
+    def _process(self, data: bytes, final: bool = False) -> str:
+        items, self._pending = self._pending + self._parser.feed(self._decoder.decode(data, final=final)), []
+        if final:
+            items += self._parser.close()
+        return self.analyzer.analyze(items)
+
+    async def stream(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+        """Строки NDJSON по мере получения выписки, в конце - итоги"""
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    yield await run_in_threadpool(self._process, chunk)
+            yield await run_in_threadpool(self._process, b"", True)
+        except StatementError as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+            return
+        yield json.dumps(self.analyzer.summary(), ensure_ascii=False) + "\n"
@@ -0,0 +1,160 @@
+"""
+Статистика кешбека пользователя за месяц.
+
+Агрегаты считаются в базе (GROUP BY и оконные функции), поэтому клиенту
+не нужно загружать всё дерево банков со всей историей категорий.
+"""
+from typing import Dict, List, Optional
+from sqlalchemy import and_, desc, distinct, func, select
+from sqlalchemy.orm import Session
+from app.models import Bank, Card, CashbackCategory
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+def _category_stats(db: Session, user_id: int, year: int, month: int) -> List[Dict]:
+    """По каждой категории: число карт, максимум и среднее, лучшая карта"""
+    partition = CashbackCategory.category_key
+    ranked = select(
+        CashbackCategory.category_key,
+        CashbackCategory.category_name,
+        CashbackCategory.cashback_percent,
+        Card.id.label("card_id"),
+        Card.name.label("card_name"),
+        Bank.name.label("bank_name"),
+        func.row_number().over(
+            partition_by=partition,
+            order_by=(desc(CashbackCategory.cashback_percent), CashbackCategory.id)
+        ).label("rank"),
+        func.count().over(partition_by=partition).label("cards"),
+        func.max(CashbackCategory.cashback_percent).over(partition_by=partition).label("max_percent"),
+        func.avg(CashbackCategory.cashback_percent).over(partition_by=partition).label("avg_percent"),
+    ).join(Card, CashbackCategory.card_id == Card.id).join(Bank, Card.bank_id == Bank.id).where(
+        Bank.user_id == user_id,
+        CashbackCategory.year == year,
+        CashbackCategory.month == month
+    ).subquery()
+
+    rows = db.execute(
+        select(ranked).where(ranked.c.rank == 1).order_by(desc(ranked.c.max_percent), ranked.c.category_name)
+    ).all()
+    return [
+        {
+            "category_key": row.category_key,
+            "category_name": row.category_name,
+            "cards": row.cards,
+            "max_percent": row.max_percent,
+            "avg_percent": _round(row.avg_percent),
+            "best_card_id": row.card_id,
+            "best_card_name": row.card_name,
+            "best_bank_name": row.bank_name,
+        }
+        for row in rows
+    ]
+
+
+def _card_stats(db: Session, user_id: int, year: int, month: int) -> List[Dict]:
+    """По каждой карте: число категорий, максимум и среднее (карты без категорий тоже)"""
+    rows = db.execute(
+        select(
+            Card.id,
+            Card.name,
+            Card.bank_id,
+            func.count(CashbackCategory.id).label("categories"),
+            func.max(CashbackCategory.cashback_percent).label("max_percent"),
+            func.avg(CashbackCategory.cashback_percent).label("avg_percent"),
+            func.sum(CashbackCategory.cashback_percent).label("percent_sum"),
+        ).join(Bank, Card.bank_id == Bank.id).outerjoin(CashbackCategory, and_(
+            CashbackCategory.card_id == Card.id,
+            CashbackCategory.year == year,
+            CashbackCategory.month == month
+        )).where(Bank.user_id == user_id).group_by(Card.id, Card.name, Card.bank_id).order_by(Card.bank_id, Card.id)
+    ).all()
+    return [
+        {
+            "card_id": row.id,
+            "card_name": row.name,
+            "bank_id": row.bank_id,
+            "categories": row.categories,
+            "max_percent": row.max_percent,
+            "avg_percent": _round(row.avg_percent),
+            "percent_sum": row.percent_sum or 0.0,
+        }
+        for row in rows
+    ]
+
+
+def _bank_stats(db: Session, user_id: int, year: int, month: int, total_categories: int) -> List[Dict]:
+    """По каждому банку: карты, категории и доля всех категорий месяца, которые он покрывает"""
+    rows = db.execute(
+        select(
+            Bank.id,
+            Bank.name,
+            func.count(distinct(Card.id)).label("cards"),
+            func.count(distinct(CashbackCategory.card_id)).label("cards_with_categories"),
+            func.count(distinct(CashbackCategory.category_key)).label("categories"),
+            func.max(CashbackCategory.cashback_percent).label("max_percent"),
+            func.avg(CashbackCategory.cashback_percent).label("avg_percent"),
+        ).outerjoin(Card, Card.bank_id == Bank.id).outerjoin(CashbackCategory, and_(
+            CashbackCategory.card_id == Card.id,
+            CashbackCategory.year == year,
+            CashbackCategory.month == month
+        )).where(Bank.user_id == user_id).group_by(Bank.id, Bank.name).order_by(Bank.id)
+    ).all()
+    return [
+        {
+            "bank_id": row.id,
+            "bank_name": row.name,
+            "cards": row.cards,
+            "cards_with_categories": row.cards_with_categories,
+            "categories": row.categories,
+            "coverage": round(row.categories / total_categories, 3) if total_categories else 0.0,
+            "max_percent": row.max_percent,
+            "avg_percent": _round(row.avg_percent),
+        }
+        for row in rows
+    ]
+
+
+def _periods(db: Session, user_id: int) -> List[Dict]:
+    """Месяцы, за которые у пользователя есть категории (от новых к старым)"""
+    rows = db.execute(
+        select(
+            CashbackCategory.year,
+            CashbackCategory.month,
+            func.count(CashbackCategory.id).label("categories"),
+        ).join(Card, CashbackCategory.card_id == Card.id).join(Bank, Card.bank_id == Bank.id).where(
+            Bank.user_id == user_id
+        ).group_by(CashbackCategory.year, CashbackCategory.month).order_by(
+            desc(CashbackCategory.year), desc(CashbackCategory.month)
+        )
+    ).all()
+    return [{"year": row.year, "month": row.month, "categories": row.categories} for row in rows]
+
+
+def load_statistics(db: Session, user_id: int, year: int, month: int) -> Dict:
+    """Сводка за месяц: итоги, категории, карты, банки и доступные периоды"""
+    categories = _category_stats(db, user_id, year, month)
+    cards = _card_stats(db, user_id, year, month)
+    banks = _bank_stats(db, user_id, year, month, len(categories))
+
+    rows_total = sum(card["categories"] for card in cards)
+    percent_sum = sum(card.pop("percent_sum") for card in cards)
+    return {
+        "year": year,
+        "month": month,
+        "totals": {
+            "categories": rows_total,
+            "unique_categories": len(categories),
+            "cards_with_categories": sum(1 for card in cards if card["categories"]),
+            "banks_with_categories": sum(1 for bank in banks if bank["categories"]),
+            "max_percent": max((category["max_percent"] for category in categories), default=None),
+            "avg_percent": round(percent_sum / rows_total, 2) if rows_total else None,
+        },
+        "categories": categories,
+        "cards": cards,
+        "banks": banks,
+        "periods": _periods(db, user_id),
+    }
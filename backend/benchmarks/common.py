@@ -0,0 +1,97 @@
+"""
+Общий код нагрузочных бенчмарков: приложение с временной базой, клиент
+и подсчёт перцентилей.
+
+Переменные окружения задаются до импорта приложения: движок базы
+создаётся при импорте app.database. Чтобы проверить другую базу
+(например, PostgreSQL), укажите её в BENCH_DATABASE_URL.
+"""
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, List, Sequence, Tuple
+
+_BENCH_DIR = tempfile.mkdtemp(prefix="cashback-bench-")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL", f"sqlite:///{os.path.join(_BENCH_DIR, 'bench.db')}")
+os.environ["UPLOAD_DIR"] = os.path.join(_BENCH_DIR, "uploads")
+os.environ.setdefault("ROLLOVER_INTERVAL", "0")
+
+import httpx
+from app.main import app
+
+PASSWORD = "bench-password"
+CATEGORIES = [
+    "Рестораны", "АЗС", "Аптеки", "Супермаркеты", "Такси", "Кино", "Одежда", "Красота",
+    "Авиабилеты", "Фастфуд", "Спорт", "Книги", "Цветы", "Транспорт", "Развлечения",
+]
+
+
+@asynccontextmanager
+async def running_app():
+    """Запускает приложение (startup/shutdown) и отдаёт клиент к нему"""
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                yield client
+    finally:
+        shutil.rmtree(_BENCH_DIR, ignore_errors=True)
+
+
+async def create_user(client: httpx.AsyncClient) -> Tuple[str, Dict[str, str]]:
+    """Регистрирует пользователя: (логин, заголовки авторизации)"""
+    username = f"bench-{uuid.uuid4().hex[:12]}"
+    response = await client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": PASSWORD},
+    )
+    response.raise_for_status()
+    response = await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return username, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def seed_portfolio(
+    client: httpx.AsyncClient, headers: Dict[str, str], cards: int, month: int, year: int
+) -> List[int]:
+    """Карты в трёх банках, по 15 категорий на карту; возвращает id карт"""
+    bank_ids = []
+    card_ids = []
+    for index in range(cards):
+        if len(bank_ids) < 3:
+            response = await client.post("/banks/", json={"name": f"Банк {index}"}, headers=headers)
+            response.raise_for_status()
+            bank_ids.append(response.json()["id"])
+        response = await client.post(
+            f"/banks/{bank_ids[index % len(bank_ids)]}/cards", json={"name": f"Карта {index}"}, headers=headers
+        )
+        response.raise_for_status()
+        card_id = response.json()["id"]
+        card_ids.append(card_id)
+        response = await client.post(
+            f"/cashback/cards/{card_id}/categories:bulk",
+            json={
+                "categories": [
+                    {"category_name": name, "cashback_percent": float(1 + (index + offset) % 5),
+                     "month": month, "year": year}
+                    for offset, name in enumerate(CATEGORIES)
+                ]
+            },
+            headers=headers,
+        )
+        response.raise_for_status()
+    return card_ids
+
+
+def percentiles(latencies: Sequence[float]) -> Dict[str, float]:
+    """p50 / p95 / max в миллисекундах"""
+    if not latencies:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(latencies)
+    return {
+        "p50": round(ordered[len(ordered) // 2] * 1000, 1),
+        "p95": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 1),
+        "max": round(ordered[-1] * 1000, 1),
+    }
@@ -0,0 +1,96 @@
+"""
+Пропускная способность API в синхронном и асинхронном режимах базы.
+
+Для каждого режима (DB_ASYNC=0 и DB_ASYNC=1) в отдельном процессе
+запускается приложение, создаётся портфель карт и выполняется смесь
+запросов на чтение и запись с заданной параллельностью. Печатаются
+запросы в секунду и задержки.
+
+Запуск из каталога backend:
+    python -m benchmarks.db_throughput [--requests 2000] [--concurrency 64]
+Режим выбирается переменной окружения при импорте app.database, поэтому
+каждый режим выполняется в своём процессе.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+MONTH = 5
+YEAR = 2026
+MODES = {"sync": "0", "async": "1"}
+
+
+async def run_child(args):
+    from benchmarks.common import percentiles, running_app, create_user, seed_portfolio
+
+    async with running_app() as client:
+        _, headers = await create_user(client)
+        card_ids = await seed_portfolio(client, headers, cards=args.cards, month=MONTH, year=YEAR)
+        period = {"month": MONTH, "year": YEAR}
+        # Смесь запросов: в основном чтение, каждый десятый - запись
+        requests = [
+            ("GET", "/banks/", period, None),
+            ("GET", "/cashback/categories", period, None),
+            ("GET", "/cashback/recommendations/Рестораны", period, None),
+            ("GET", "/cashback/optimal", period, None),
+            ("GET", "/cashback/statistics", period, None),
+        ]
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies, errors = [], 0
+
+        async def call(index: int):
+            nonlocal errors
+            if index % 10 == 9:
+                method, url, params = "PUT", f"/banks/cards/{card_ids[index % len(card_ids)]}", None
+                body = {"name": f"Карта {index}"}
+            else:
+                method, url, params, body = requests[index % len(requests)]
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.request(method, url, params=params, json=body, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call(index) for index in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "requests_per_s": round(args.requests / elapsed, 1),
+        "errors": errors,
+        "latency_ms": percentiles(latencies),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--cards", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args))
+        return
+
+    for mode in args.modes:
+        env = dict(os.environ, DB_ASYNC=MODES[mode])
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.db_throughput", "--child",
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--cards", str(args.cards)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<6} {result['requests_per_s']:>8} req/s  errors {result['errors']}  latency ms {result['latency_ms']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Сравнение разбора OCR-текста: прежний вариант (пять регулярных выражений
+по всему тексту) и однопроходный токенизатор extract_cashback_info.
+
+Проверяет, что на корпусе синтетических страниц банков и случайных
+фрагментов результаты совпадают, и печатает время разбора больших дампов.
+
+Запуск из каталога backend:
+    python -m benchmarks.ocr_extraction [--pages 400] [--fragments 20000]
+"""
+import argparse
+import random
+import re
+import time
+from typing import Dict, List
+from app.categories import get_category_icon
+from app.routers.ocr import extract_cashback_info
+
+LEGACY_STOP_WORDS = [
+    'подробнее', 'далее', 'еще', 'больше', 'всего', 'итого',
+    'сумма', 'бонус', 'кешбек', 'накопления', 'процент', '%', 'руб',
+    'рублей', 'коп', 'копеек', 'до', 'от', 'с', 'по', 'на', 'за',
+    'в', 'во', 'к', 'ко', 'о', 'об', 'обо', 'при', 'про', 'со', 'из',
+    'изо', 'над', 'под', 'подо', 'перед', 'передо', 'за', 'зао',
+    'между', 'среди', 'через', 'сквозь', 'для', 'ради', 'благодаря',
+    'согласно', 'вопреки', 'навстречу', 'наподобие', 'вроде', 'вследствие',
+    'ввиду', 'вслед', 'вместо', 'кроме', 'сверх', 'среди', 'между',
+    'около', 'возле', 'близ', 'вдоль', 'вокруг', 'около', 'против',
+    'напротив', 'позади', 'впереди', 'сверху', 'снизу', 'внутри',
+    'снаружи', 'вне', 'внутрь', 'наружу', 'вверх', 'вниз', 'вперед',
+    'назад', 'влево', 'вправо', 'налево', 'направо', 'туда', 'сюда',
+    'оттуда', 'отсюда', 'везде', 'всюду', 'нигде', 'никуда', 'никуда',
+    'никогда', 'всегда', 'иногда', 'часто', 'редко', 'всегда', 'никогда'
+]
+
+LEGACY_PATTERNS = [
+    r'(\d+(?:[.,]\d+)?)\s*%\s*([А-ЯЁа-яёA-Za-z\s\-]+)',
+    r'([А-ЯЁа-яёA-Za-z\s\-]+)[:\-]\s*(\d+(?:[.,]\d+)?)\s*%',
+    r'([А-ЯЁа-яёA-Za-z\s\-]+)\s+(\d+(?:[.,]\d+)?)\s*%',
+    r'(\d+(?:[.,]\d+)?)\s*%\s*на\s+([А-ЯЁа-яёA-Za-z\s\-]+)',
+    r'(\d+(?:[.,]\d+)?)\s*%\s*для\s+([А-ЯЁа-яёA-Za-z\s\-]+)',
+]
+
+
+def legacy_extract_cashback_info(text: str) -> List[Dict[str, float]]:
+    """extract_cashback_info до перехода на токенизатор"""
+    categories = []
+    for pattern in LEGACY_PATTERNS:
+        for match in re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE):
+            groups = match.groups()
+            try:
+                percent = float(groups[0].replace(',', '.'))
+                category = groups[1].strip()
+            except ValueError:
+                try:
+                    percent = float(groups[1].replace(',', '.'))
+                    category = groups[0].strip()
+                except ValueError:
+                    continue
+
+            category = re.sub(r'[^\w\s\-а-яА-ЯёЁ]', ' ', category).strip()
+            if 'подробнее' in category.lower() or 'далее' in category.lower():
+                category = ' '.join(
+                    word for word in category.split() if word.lower() not in ['подробнее', 'далее']
+                )
+            words = []
+            for word in category.split():
+                word_lower = word.lower()
+                if (word_lower not in LEGACY_STOP_WORDS and
+                        len(word) > 1 and
+                        not word_lower.endswith('ее') and
+                        not word_lower.endswith('ше') and
+                        not word_lower.endswith('ще') and
+                        word_lower not in ['всего', 'итого', 'сумма', 'бонус']):
+                    words.append(word)
+            category = ' '.join(words)
+            category = re.sub(r'\b[а-яА-Яa-z]\b', '', category).strip()
+            category = re.sub(r'\s+', ' ', category).strip()
+
+            if len(category) > 2 and 0 <= percent <= 100:
+                normalized_category = category.lower().strip()
+                is_duplicate = False
+                for existing in categories:
+                    if (existing["category_name"].lower().strip() == normalized_category and
+                            abs(existing["cashback_percent"] - percent) < 0.1):
+                        is_duplicate = True
+                        break
+                if not is_duplicate:
+                    categories.append({
+                        "category_name": category,
+                        "cashback_percent": percent,
+                        "icon": get_category_icon(category)
+                    })
+    return categories
+
+
+CATEGORIES = [
+    "Рестораны", "АЗС", "Аптеки", "Супермаркеты", "Такси", "Кино", "Все покупки",
+    "Одежда и обувь", "Красота", "Авиабилеты", "Ж/д билеты", "Фастфуд", "Спорт",
+]
+NOISE = ["Подробнее", "до 3000 руб", "•", "›", "Кешбек", "Ещё", "|", "1", "%", "-", ":"]
+
+
+def make_line(rng: random.Random) -> str:
+    category = rng.choice(CATEGORIES)
+    percent = rng.choice(["1", "2", "3", "5", "7", "10", "1,5", "2.5"])
+    space = rng.choice(["", " "])
+    layout = rng.randrange(5)
+    if layout == 0:
+        line = f"{percent}{space}% {category}"
+    elif layout == 1:
+        line = f"{category}: {percent}{space}%"
+    elif layout == 2:
+        line = f"{category} - {percent}%"
+    elif layout == 3:
+        line = f"{category} {percent}%"
+    else:
+        line = f"{percent}% на {category}"
+    if rng.random() < 0.3:
+        line += " " + rng.choice(NOISE)
+    if rng.random() < 0.2:
+        line = rng.choice(NOISE) + " " + line
+    return line
+
+
+def make_page(rng: random.Random) -> str:
+    lines = [rng.choice(["Кешбек в этом месяце", "Выберите категории", "Повышенный кешбек"])]
+    lines += [make_line(rng) for _ in range(rng.randint(4, 12))]
+    return "\n".join(lines)
+
+
+def make_fragment(rng: random.Random) -> str:
+    alphabet = "абвгдеёжзиклмнопрстуфхцчшщыэюяАБВГКМПРС  -:%%.,0123456789\n"
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40)))
+
+
+def timed(fn, text: str) -> float:
+    started = time.perf_counter()
+    fn(text)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--fragments", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # Совпадение результатов
+    corpus = [make_page(rng) for _ in range(args.pages)]
+    corpus += [make_fragment(rng) for _ in range(args.fragments)]
+    mismatches = sum(
+        1 for text in corpus if legacy_extract_cashback_info(text) != extract_cashback_info(text)
+    )
+    print(f"corpus: {len(corpus)} texts, mismatches: {mismatches}")
+
+    # Большие дампы: многостраничный текст и длинные строки из слов без процентов
+    dumps = {
+        f"{args.pages}-page dump": "\n\n".join(corpus[:args.pages]),
+        "long letter runs": "\n".join(
+            " ".join(rng.choice(CATEGORIES) for _ in range(200)) + " 5%" for _ in range(20)
+        ),
+    }
+    for name, text in dumps.items():
+        before = timed(legacy_extract_cashback_info, text)
+        after = timed(extract_cashback_info, text)
+        print(f"{name}: legacy {before:.3f}s, tokenizer {after:.3f}s, x{before / max(after, 1e-9):.1f}")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
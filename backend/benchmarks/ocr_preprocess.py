@@ -0,0 +1,117 @@
+"""
+Точность и скорость OCR при разных настройках подготовки изображения.
+
+На синтетических скриншотах банков (1290x2796, светлая и тёмная тема)
+с известными категориями для каждого набора настроек печатает время
+подготовки и распознавания, размер изображения после подготовки и долю
+найденных пар (категория, процент).
+
+Запуск из каталога backend (нужен установленный tesseract с rus):
+    python -m benchmarks.ocr_preprocess [--screens 6] [--font DejaVuSans.ttf]
+Без tesseract можно измерить только подготовку: --preprocess-only
+"""
+import argparse
+import io
+import random
+import statistics
+import time
+from dataclasses import replace
+from typing import Dict, List, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from app.ocr_engine import OCREngineUnavailable, PreprocessSettings, create_backend, preprocess_image
+from app.routers.ocr import clean_ocr_text, extract_cashback_info
+
+CATEGORIES = [
+    "Рестораны", "АЗС", "Аптеки", "Супермаркеты", "Такси", "Кино", "Все покупки",
+    "Одежда и обувь", "Красота", "Авиабилеты", "Фастфуд", "Спорт", "Книги", "Цветы",
+]
+
+DEFAULT = PreprocessSettings()
+PRESETS: Dict[str, PreprocessSettings] = {
+    # Как до появления подготовки: только контраст
+    "baseline": PreprocessSettings(grayscale=False, target_dpi=0, binarize_threshold=0, autocrop=False),
+    "grayscale": replace(DEFAULT, target_dpi=0, binarize_threshold=0, autocrop=False),
+    "default": DEFAULT,
+    "no-binarize": replace(DEFAULT, binarize_threshold=0),
+    "no-autocrop": replace(DEFAULT, autocrop=False),
+    "dpi-200": replace(DEFAULT, target_dpi=200),
+    "env": PreprocessSettings.from_env(),
+}
+
+Expected = List[Tuple[str, float]]
+
+
+def render_screen(rng: random.Random, font_path: str, dark: bool) -> Tuple[bytes, Expected]:
+    """Скриншот со списком категорий и процентов; PNG с dpi=72, как при экспорте"""
+    background, foreground, muted = ("#121212", "#f0f0f0", "#8a8a8a") if dark else ("#ffffff", "#202020", "#9a9a9a")
+    image = Image.new("RGB", (1290, 2796), background)
+    draw = ImageDraw.Draw(image)
+    title_font = ImageFont.truetype(font_path, 72)
+    font = ImageFont.truetype(font_path, 54)
+    small = ImageFont.truetype(font_path, 38)
+
+    draw.text((80, 260), "Кешбек в этом месяце", fill=foreground, font=title_font)
+    expected = []
+    y = 460
+    for category in rng.sample(CATEGORIES, 8):
+        percent = float(rng.choice([1, 2, 3, 5, 7, 10]))
+        draw.ellipse((80, y, 180, y + 100), outline=muted, width=4)
+        draw.text((220, y + 15), category, fill=foreground, font=font)
+        draw.text((1080, y + 15), f"{percent:g}%", fill=foreground, font=font)
+        draw.text((220, y + 95), "Подробнее", fill=muted, font=small)
+        expected.append((category, percent))
+        y += 260
+
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", dpi=(72, 72))
+    return buffer.getvalue(), expected
+
+
+def recall(found: List[Dict], expected: Expected) -> float:
+    got = {(item["category_name"].lower(), item["cashback_percent"]) for item in found}
+    return sum(1 for category, percent in expected if (category.lower(), percent) in got) / len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--screens", type=int, default=6)
+    parser.add_argument("--font", default="DejaVuSans.ttf")
+    parser.add_argument("--lang", default="rus+eng")
+    parser.add_argument("--preprocess-only", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    screens = [render_screen(rng, args.font, dark=index % 2 == 1) for index in range(args.screens)]
+    backend = None
+    if not args.preprocess_only:
+        try:
+            backend = create_backend("auto", args.lang)
+        except OCREngineUnavailable as e:
+            raise SystemExit(f"{e}\nInstall tesseract or run with --preprocess-only")
+    if backend is not None:
+        print(f"engine: {backend.name}, lang: {backend.lang}")
+
+    print(f"{'preset':<12} {'size':>10} {'prep ms':>8} {'ocr ms':>8} {'recall':>7}")
+    for name, settings in PRESETS.items():
+        prep_times, ocr_times, recalls = [], [], []
+        size = None
+        for image_bytes, expected in screens:
+            started = time.perf_counter()
+            image = preprocess_image(Image.open(io.BytesIO(image_bytes)), settings)
+            prep_times.append(time.perf_counter() - started)
+            size = f"{image.width}x{image.height}"
+            if backend is None:
+                continue
+            started = time.perf_counter()
+            text = backend.image_to_text(image)
+            ocr_times.append(time.perf_counter() - started)
+            recalls.append(recall(extract_cashback_info(clean_ocr_text(text)), expected))
+
+        ocr_ms = f"{statistics.mean(ocr_times) * 1000:8.0f}" if ocr_times else f"{'-':>8}"
+        accuracy = f"{statistics.mean(recalls):7.0%}" if recalls else f"{'-':>7}"
+        print(f"{name:<12} {size:>10} {statistics.mean(prep_times) * 1000:8.0f} {ocr_ms} {accuracy}")
+
+
+if __name__ == "__main__":
+    main()
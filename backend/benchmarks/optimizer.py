@@ -0,0 +1,179 @@
+"""
+Оптимизатор распределения трат на синтетических портфелях карт.
+
+На маленьких задачах (до шести пар категория-карта) результат allocate
+сравнивается с точным решением перебором вершин многогранника: кешбек
+должен совпасть. Там же считается, насколько ниже оптимума прежнее жадное
+распределение по убыванию процента. На больших портфелях печатается время
+optimize_allocation (с лимитами и порогами трат) и прирост кешбека
+относительно жадного распределения.
+
+Запуск из каталога backend:
+    python -m benchmarks.optimizer [--exact 100] [--sizes 10 30 60] [--runs 20]
+"""
+import argparse
+import random
+import statistics
+import time
+from itertools import combinations, product
+from typing import Dict, List, Optional, Sequence
+from app.optimizer import Edge, allocate, build_options, optimize_allocation
+from app.recommendations import RecommendationRow, RecommendationTable
+
+# Названия без цифр: цифры не входят в ключ категории
+NAMES = ["".join(letters).capitalize() + "ия" for letters in product("бвгдклмнпрст", repeat=3)]
+
+
+def greedy_allocate(spend: Dict[str, float], edges: Sequence[Edge], card_caps: Dict) -> List[float]:
+    """Прежний вариант: пары по убыванию процента забирают траты до лимитов"""
+    remaining = dict(spend)
+    room = dict(card_caps)
+    amounts = [0.0] * len(edges)
+    for index in sorted(range(len(edges)), key=lambda index: -edges[index].percent):
+        edge = edges[index]
+        rate = edge.percent / 100
+        limit = min(room.get(edge.card, float("inf")), edge.cap if edge.cap is not None else float("inf"))
+        amount = min(remaining[edge.category], max(0.0, limit) / rate)
+        amounts[index] = amount
+        remaining[edge.category] -= amount
+        if edge.card in room:
+            room[edge.card] -= amount * rate
+    return amounts
+
+
+def cashback(edges: Sequence[Edge], amounts: Sequence[float]) -> float:
+    return sum(amount * edge.percent / 100 for edge, amount in zip(edges, amounts))
+
+
+def _solve_linear(matrix: List[List[float]], rhs: List[float]) -> Optional[List[float]]:
+    """Метод Гаусса; None для вырожденной системы"""
+    n = len(rhs)
+    rows = [row[:] + [value] for row, value in zip(matrix, rhs)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(n):
+            if row != column:
+                factor = rows[row][column] / rows[column][column]
+                rows[row] = [a - factor * b for a, b in zip(rows[row], rows[column])]
+    return [rows[row][n] / rows[row][row] for row in range(n)]
+
+
+def exact_cashback(spend: Dict[str, float], edges: Sequence[Edge], card_caps: Dict) -> float:
+    """Максимум линейной задачи перебором вершин: n активных ограничений из всех"""
+    n = len(edges)
+    constraints = []  # (коэффициенты, граница) для a·x <= b
+    for category in spend:
+        constraints.append(([1.0 if edge.category == category else 0.0 for edge in edges], spend[category]))
+    for card, cap in card_caps.items():
+        constraints.append(([edge.percent / 100 if edge.card == card else 0.0 for edge in edges], cap))
+    for index, edge in enumerate(edges):
+        unit = [1.0 if column == index else 0.0 for column in range(n)]
+        constraints.append(([-value for value in unit], 0.0))
+        if edge.cap is not None:
+            constraints.append((unit, edge.cap / (edge.percent / 100)))
+
+    best = 0.0
+    for active in combinations(constraints, n):
+        point = _solve_linear([row for row, _ in active], [bound for _, bound in active])
+        if point is None:
+            continue
+        if all(sum(a * x for a, x in zip(row, point)) <= bound + 1e-6 for row, bound in constraints):
+            best = max(best, cashback(edges, point))
+    return best
+
+
+def small_instance(rng: random.Random):
+    categories = NAMES[:rng.randint(2, 3)]
+    cards = list(range(rng.randint(2, 3)))
+    pairs = [(category, card) for category in categories for card in cards]
+    pairs = rng.sample(pairs, rng.randint(2, min(6, len(pairs))))
+    spend = {category: float(rng.choice([500, 1000, 3000, 10000])) for category in categories}
+    edges = [
+        Edge(category, card, float(rng.choice([1, 3, 5, 8, 10, 15])), rng.choice([None, None, 100.0, 300.0]))
+        for category, card in pairs
+    ]
+    card_caps = {card: float(rng.choice([100, 200, 500])) for card in cards if rng.random() < 0.7}
+    return spend, edges, card_caps
+
+
+def portfolio(rng: random.Random, size: int, per_card: int = 8):
+    """size карт и size категорий трат; лимиты и пороги у части карт и категорий"""
+    rows = []
+    for card_id in range(1, size + 1):
+        card_cap = rng.choice([300.0, 1000.0, 3000.0]) if rng.random() < 0.7 else None
+        card_min = rng.choice([10000.0, 30000.0]) if rng.random() < 0.2 else None
+        for index in rng.sample(range(size), min(per_card, size)):
+            rows.append(RecommendationRow(
+                category_id=len(rows) + 1,
+                category_name=NAMES[index],
+                category_key=NAMES[index].lower(),
+                cashback_percent=float(rng.choice([1, 2, 3, 5, 7, 10, 15])),
+                icon="",
+                card_id=card_id,
+                card_name=f"Карта {card_id}",
+                bank_id=card_id,
+                bank_name=f"Банк {card_id}",
+                cashback_cap=rng.choice([None, None, 200.0, 500.0]),
+                min_spend=rng.choice([None, None, None, 3000.0]),
+                card_cashback_cap=card_cap,
+                card_min_spend=card_min,
+            ))
+    spend = {NAMES[index]: float(rng.choice([1000, 5000, 20000, 50000])) for index in range(size)}
+    return spend, RecommendationTable(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--exact", type=int, default=100, help="число маленьких задач для сравнения с точным решением")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 30, 60])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    mismatches, greedy_below, greedy_gaps = 0, 0, []
+    for _ in range(args.exact):
+        spend, edges, card_caps = small_instance(rng)
+        exact = exact_cashback(spend, edges, card_caps)
+        if abs(cashback(edges, allocate(spend, edges, card_caps)) - exact) > 0.01:
+            mismatches += 1
+        greedy = cashback(edges, greedy_allocate(spend, edges, card_caps))
+        if greedy < exact - 0.01:
+            greedy_below += 1
+            greedy_gaps.append((exact - greedy) / exact)
+    worst = f"{max(greedy_gaps):.1%}" if greedy_gaps else "-"
+    print(f"exact check: {args.exact} instances, mismatches: {mismatches}, "
+          f"greedy below optimum: {greedy_below} (worst gap {worst})")
+
+    print(f"{'cards x categories':>18} {'p50 ms':>8} {'p95 ms':>8} {'greedy ms':>10} {'gain vs greedy':>15}")
+    for size in args.sizes:
+        times, greedy_times, gains = [], [], []
+        for _ in range(args.runs):
+            spend, table = portfolio(rng, size)
+            started = time.perf_counter()
+            optimize_allocation(spend, table)
+            times.append(time.perf_counter() - started)
+
+            options, cards, _ = build_options(spend, table)
+            edges = [Edge(option.category, option.card_id, option.percent, option.category_cap) for option in options]
+            card_caps = {card_id: limits.cap for card_id, limits in cards.items() if limits.cap is not None}
+            started = time.perf_counter()
+            greedy = cashback(edges, greedy_allocate(spend, edges, card_caps))
+            greedy_times.append(time.perf_counter() - started)
+            gains.append(cashback(edges, allocate(spend, edges, card_caps)) / greedy - 1)
+        ordered = sorted(times)
+        print(
+            f"{f'{size} x {size}':>18} {statistics.median(times) * 1000:8.1f} "
+            f"{ordered[int(0.95 * (len(ordered) - 1))] * 1000:8.1f} "
+            f"{statistics.median(greedy_times) * 1000:10.1f} {statistics.mean(gains):15.2%}"
+        )
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Нагрузочный бенчмарк входа: всплеск логинов и параллельные CRUD-запросы.
+
+Сравнивает проверку пароля в пуле процессов хеширования (текущий вариант)
+и в общем пуле потоков (как было раньше): пропускную способность входа,
+число ответов 503 и задержку обычных запросов во время всплеска.
+
+Запуск из каталога backend:
+    python -m benchmarks.password_hashing [--logins 200] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import time
+from fastapi.concurrency import run_in_threadpool
+from benchmarks.common import PASSWORD, create_user, percentiles, running_app, seed_portfolio
+from app import auth
+from app.passwords import verify_password, verify_password_async
+
+MONTH = 5
+YEAR = 2026
+
+
+async def _verify_in_threads(plain_password: str, hashed_password: str) -> bool:
+    """Прежний вариант: проверка в общем пуле потоков AnyIO"""
+    return await run_in_threadpool(verify_password, plain_password, hashed_password)
+
+
+MODES = {
+    "process-pool": verify_password_async,
+    "threadpool": _verify_in_threads,
+}
+
+
+async def run_mode(client, usernames, headers, logins: int, concurrency: int, readers: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    login_latencies, statuses = [], {}
+    crud_latencies = []
+    done = asyncio.Event()
+
+    async def login(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(
+                "/auth/login", json={"username": usernames[index % len(usernames)], "password": PASSWORD}
+            )
+            login_latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async def reader():
+        while not done.is_set():
+            for url in ("/banks/", "/cashback/categories"):
+                started = time.perf_counter()
+                response = await client.get(url, params={"month": MONTH, "year": YEAR}, headers=headers)
+                response.raise_for_status()
+                crud_latencies.append(time.perf_counter() - started)
+
+    reader_tasks = [asyncio.create_task(reader()) for _ in range(readers)]
+    started = time.perf_counter()
+    await asyncio.gather(*(login(index) for index in range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*reader_tasks)
+
+    return {
+        "logins_per_s": round(statuses.get(200, 0) / elapsed, 1),
+        "statuses": statuses,
+        "login_ms": percentiles(login_latencies),
+        "crud_ms": percentiles(crud_latencies),
+        "crud_requests": len(crud_latencies),
+    }
+
+
+async def main(args):
+    async with running_app() as client:
+        usernames = []
+        for _ in range(args.users):
+            username, headers = await create_user(client)
+            usernames.append(username)
+        await seed_portfolio(client, headers, cards=args.cards, month=MONTH, year=YEAR)
+
+        for mode in args.modes:
+            auth.verify_password_async = MODES[mode]
+            try:
+                result = await run_mode(client, usernames, headers, args.logins, args.concurrency, args.readers)
+            finally:
+                auth.verify_password_async = verify_password_async
+            print(
+                f"{mode:<13} logins/s {result['logins_per_s']:>7}  statuses {result['statuses']}\n"
+                f"{'':<13} login ms {result['login_ms']}\n"
+                f"{'':<13} CRUD ms  {result['crud_ms']} ({result['crud_requests']} requests during the burst)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--cards", type=int, default=6)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Общие фикстуры: приложение с временной базой SQLite, пользователи, карты
+и подсчёт SQL-запросов.
+
+Переменные окружения задаются до импорта приложения: движок базы
+создаётся при импорте app.database.
+"""
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_TEST_DIR = tempfile.mkdtemp(prefix="cashback-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_TEST_DIR, "uploads")
+os.environ.setdefault("ROLLOVER_INTERVAL", "0")
+os.environ.setdefault("OCR_WORKERS", "1")
+os.environ.setdefault("AUTH_HASH_WORKERS", "1")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import database
+from app.main import app
+
+MONTH = 5
+YEAR = 2026
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+    shutil.rmtree(_TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def make_user(client):
+    """Регистрирует нового пользователя и возвращает заголовки авторизации"""
+
+    def make() -> Dict[str, str]:
+        username = f"user-{uuid.uuid4().hex[:12]}"
+        response = client.post(
+            "/auth/register",
+            json={"username": username, "email": f"{username}@example.com", "password": "secret"},
+        )
+        assert response.status_code == 200, response.text
+        response = client.post("/auth/login", json={"username": username, "password": "secret"})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return make
+
+
+@pytest.fixture
+def headers(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def make_card(client):
+    """Создаёт карту (и банк, если bank_id не указан) с категориями (название, процент)"""
+
+    def make(
+        headers: Dict[str, str],
+        categories: Sequence[Tuple[str, float]] = (),
+        bank_id: Optional[int] = None,
+        name: Optional[str] = None,
+        month: int = MONTH,
+        year: int = YEAR,
+        **card_fields,
+    ) -> Tuple[int, int]:
+        if bank_id is None:
+            response = client.post("/banks/", json={"name": f"Банк {uuid.uuid4().hex[:6]}"}, headers=headers)
+            assert response.status_code == 200, response.text
+            bank_id = response.json()["id"]
+        response = client.post(
+            f"/banks/{bank_id}/cards",
+            json={"name": name or f"Карта {uuid.uuid4().hex[:6]}", **card_fields},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        card_id = response.json()["id"]
+        for category_name, percent in categories:
+            response = client.post(
+                f"/cashback/cards/{card_id}/categories",
+                json={"category_name": category_name, "cashback_percent": percent, "month": month, "year": year},
+                headers=headers,
+            )
+            assert response.status_code == 200, response.text
+        return bank_id, card_id
+
+    return make
+
+
+@pytest.fixture
+def count_queries():
+    """Контекстный менеджер, собирающий SQL-запросы к базе"""
+    engine = database.async_engine.sync_engine if database.async_engine is not None else database.engine
+
+    @contextmanager
+    def count():
+        statements: List[str] = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return count
@@ -0,0 +1,118 @@
+import os
+import signal
+import uuid
+from datetime import timedelta
+from jose import jwt
+from app import auth as auth_module
+from app.auth import ALGORITHM, SECRET_KEY, AuthCache, CurrentUser, create_access_token
+from app.database import SessionLocal
+from app.models import User
+from app.passwords import hash_pool
+
+
+def _register(client):
+    username = f"user-{uuid.uuid4().hex[:12]}"
+    response = client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": "secret"},
+    )
+    assert response.status_code == 200, response.text
+    return username
+
+
+def test_login_returns_token(client):
+    username = _register(client)
+    response = client.post("/auth/login", json={"username": username, "password": "secret"})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+    response = client.post("/auth/login", json={"username": username, "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_login_survives_crashed_hash_worker(client):
+    username = _register(client)
+
+    # Процесс пула погиб (например, нехватка памяти): пул пересоздаётся
+    restarts = hash_pool.stats()["restarts"]
+    for process in list(hash_pool._executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+
+    response = client.post("/auth/login", json={"username": username, "password": "secret"})
+    assert response.status_code == 200, response.text
+    assert hash_pool.stats()["restarts"] == restarts + 1
+    assert client.post("/auth/login", json={"username": username, "password": "secret"}).status_code == 200
+    _register(client)
+
+
+def _login(client, username):
+    response = client.post("/auth/login", json={"username": username, "password": "secret"})
+    assert response.status_code == 200, response.text
+    return response.json()["access_token"]
+
+
+def _user_queries(statements):
+    return [statement for statement in statements if "FROM users" in statement]
+
+
+def test_token_user_is_cached(client, count_queries):
+    username = _register(client)
+    token = _login(client, username)
+    headers = {"Authorization": f"Bearer {token}"}
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    assert payload["sub"] == username and isinstance(payload["uid"], int)
+
+    # Первый запрос ищет пользователя по id из токена, следующие берут его из кеша
+    with count_queries() as statements:
+        assert client.get("/banks/", headers=headers).status_code == 200
+    [query] = _user_queries(statements)
+    assert "users.id =" in query
+    with count_queries() as statements:
+        assert client.get("/banks/", headers=headers).status_code == 200
+    assert _user_queries(statements) == []
+
+
+def test_token_without_user_id_is_accepted(client):
+    username = _register(client)
+    token = create_access_token({"sub": username}, timedelta(minutes=5))
+    assert client.get("/banks/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    # id из токена должен принадлежать пользователю с тем же username
+    user_id = jwt.decode(_login(client, username), SECRET_KEY, algorithms=[ALGORITHM])["uid"]
+    token = create_access_token({"sub": "someone-else", "uid": user_id})
+    assert client.get("/banks/", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+
+def test_deactivation_drops_cached_tokens(client):
+    username = _register(client)
+    headers = {"Authorization": f"Bearer {_login(client, username)}"}
+    assert client.get("/banks/", headers=headers).status_code == 200
+
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.username == username).one().is_active = False
+        db.commit()
+    finally:
+        db.close()
+    response = client.get("/banks/", headers=headers)
+    assert (response.status_code, response.json()["detail"]) == (400, "Inactive user")
+
+
+def test_auth_cache_expiry_and_size(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth_module.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(auth_module.time, "time", lambda: now[0])
+    cache = AuthCache(max_entries=2, ttl=60)
+    user = CurrentUser(id=1, username="user", is_active=True)
+
+    cache.put("ttl", user)
+    cache.put("token-expires", user, token_expires_at=now[0] + 10)
+    now[0] += 30
+    assert cache.get("ttl") == user
+    assert cache.get("token-expires") is None
+
+    cache.put("a", user)
+    cache.put("b", user)
+    assert cache.get("ttl") is None  # вытеснен самым старым
+    now[0] += 61
+    assert cache.get("b") is None
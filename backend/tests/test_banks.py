@@ -0,0 +1,51 @@
+from conftest import MONTH, YEAR
+
+
+def _tree_queries(client, headers, count_queries, params=None):
+    client.get("/banks/", headers=headers)  # пользователь из токена попадает в кеш
+    with count_queries() as statements:
+        response = client.get("/banks/", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json(), statements
+
+
+def test_bank_tree_query_count_does_not_grow(client, make_user, make_card, count_queries):
+    small = make_user()
+    make_card(small, [("Рестораны", 5.0)])
+    large = make_user()
+    for _ in range(3):
+        bank_id, _ = make_card(large, [("Рестораны", 5.0), ("АЗС", 3.0)])
+        for _ in range(2):
+            make_card(large, [("Аптеки", 7.0)], bank_id=bank_id)
+
+    _, small_statements = _tree_queries(client, small, count_queries)
+    banks, large_statements = _tree_queries(client, large, count_queries)
+
+    assert [len(bank["cards"]) for bank in banks] == [3, 3, 3]
+    # Банки, карты и категории - по одному запросу на уровень дерева
+    assert len(small_statements) == len(large_statements) == 3
+
+
+def test_bank_tree_filters_categories_by_period(client, headers, make_card, count_queries):
+    bank_id, card_id = make_card(headers, [("Рестораны", 5.0)])
+    for name, month, year in (("АЗС", MONTH - 1, YEAR), ("Аптеки", MONTH, YEAR - 1)):
+        response = client.post(
+            f"/cashback/cards/{card_id}/categories",
+            json={"category_name": name, "cashback_percent": 3.0, "month": month, "year": year},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+
+    def names(params):
+        banks, _ = _tree_queries(client, headers, count_queries, params)
+        [bank] = banks
+        [card] = bank["cards"]
+        return sorted(category["category_name"] for category in card["cashback_categories"])
+
+    assert names(None) == ["АЗС", "Аптеки", "Рестораны"]
+    assert names({"month": MONTH, "year": YEAR}) == ["Рестораны"]
+    assert names({"month": MONTH}) == ["Аптеки", "Рестораны"]
+    assert names({"year": YEAR}) == ["АЗС", "Рестораны"]
+    # Банк без категорий за период остаётся в дереве вместе с картой
+    banks, _ = _tree_queries(client, headers, count_queries, {"month": MONTH + 1, "year": YEAR})
+    assert [(bank["id"], [card["cashback_categories"] for card in bank["cards"]]) for bank in banks] == [(bank_id, [[]])]
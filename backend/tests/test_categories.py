@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from app import database
+from conftest import MONTH, YEAR
+
+
+def _bulk(client, headers, card_id, categories):
+    return client.post(
+        f"/cashback/cards/{card_id}/categories:bulk",
+        json={"categories": [
+            {"category_name": name, "cashback_percent": percent, "month": MONTH, "year": YEAR}
+            for name, percent in categories
+        ]},
+        headers=headers,
+    )
+
+
+def _card_categories(client, headers, card_id):
+    response = client.get("/cashback/categories", params={"card_id": card_id, "month": MONTH, "year": YEAR}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_bulk_save_updates_existing_categories(client, headers, make_card):
+    _, card_id = make_card(headers)
+    first = _bulk(client, headers, card_id, [("Аптеки", 3.0), ("АЗС", 5.0)]).json()
+    second = _bulk(client, headers, card_id, [("аптеки", 7.0), ("Такси", 1.0)]).json()
+
+    assert second[0]["id"] == first[0]["id"]
+    assert second[0]["cashback_percent"] == 7.0
+    categories = {category["category_name"]: category["cashback_percent"] for category in _card_categories(client, headers, card_id)}
+    assert categories == {"аптеки": 7.0, "АЗС": 5.0, "Такси": 1.0}
+
+
+def test_bulk_save_keeps_settings_the_client_did_not_send(client, headers, make_card):
+    _, card_id = make_card(headers)
+    response = client.post(
+        f"/cashback/cards/{card_id}/categories:bulk",
+        json={"categories": [
+            {"category_name": "Аптеки", "cashback_percent": 3.0, "month": MONTH, "year": YEAR,
+             "is_permanent": True, "cashback_cap": 500.0, "min_spend": 1000.0},
+            {"category_name": "АЗС", "cashback_percent": 5.0, "month": MONTH, "year": YEAR,
+             "is_permanent": True, "cashback_cap": 300.0},
+        ]},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+
+    # Как ScreenshotUpload.js: только название, процент, период и иконка; у АЗС лимит снимается явно
+    response = client.post(
+        f"/cashback/cards/{card_id}/categories:bulk",
+        json={"categories": [
+            {"category_name": "Аптеки", "cashback_percent": 7.0, "month": MONTH, "year": YEAR, "icon": "pharmacy"},
+            {"category_name": "АЗС", "cashback_percent": 4.0, "month": MONTH, "year": YEAR, "cashback_cap": None},
+        ]},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+
+    categories = {category["category_name"]: category for category in _card_categories(client, headers, card_id)}
+    pharmacy, fuel = categories["Аптеки"], categories["АЗС"]
+    assert (pharmacy["cashback_percent"], pharmacy["is_permanent"], pharmacy["cashback_cap"], pharmacy["min_spend"]) == (
+        7.0, True, 500.0, 1000.0
+    )
+    assert (fuel["cashback_percent"], fuel["is_permanent"], fuel["cashback_cap"]) == (4.0, True, None)
+
+
+def test_concurrent_bulk_saves_do_not_duplicate(client, headers, make_card):
+    _, card_id = make_card(headers)
+    payload = [("Рестораны", 5.0), ("АЗС", 3.0), ("Аптеки", 2.0)]
+
+    # Двойное нажатие "Сохранить"
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(lambda _: _bulk(client, headers, card_id, payload), range(4)))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert len(_card_categories(client, headers, card_id)) == len(payload)
+
+
+def test_duplicate_category_is_rejected(client, headers, make_card):
+    _, card_id = make_card(headers, [("Рестораны", 5.0)])
+    response = client.post(
+        f"/cashback/cards/{card_id}/categories",
+        json={"category_name": "рестораны", "cashback_percent": 7.0, "month": MONTH, "year": YEAR},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+    category_id = _bulk(client, headers, card_id, [("АЗС", 3.0)]).json()[0]["id"]
+    response = client.put(f"/cashback/categories/{category_id}", json={"category_name": "Рестораны"}, headers=headers)
+    assert response.status_code == 400
+    assert len(_card_categories(client, headers, card_id)) == 2
+
+
+def test_migration_merges_duplicates_before_unique_index(client, headers, make_card):
+    _, card_id = make_card(headers)
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_cashback_categories_card_key_period"))
+        # Названия с одним ключом, которые пользователь считал разными категориями
+        for name, percent, permanent, cap in (("Кешбек на АЗС", 5.0, True, 300.0), ("АЗС", 7.0, False, None)):
+            conn.execute(text(
+                "INSERT INTO cashback_categories "
+                "(category_name, category_key, cashback_percent, card_id, month, year, is_permanent, cashback_cap) "
+                "VALUES (:name, 'азс', :percent, :card_id, :month, :year, :permanent, :cap)"
+            ), {"name": name, "percent": percent, "card_id": card_id, "month": MONTH, "year": YEAR,
+                "permanent": permanent, "cap": cap})
+
+    database.migrate_db()
+
+    with database.engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT category_name, cashback_percent, is_permanent, cashback_cap FROM cashback_categories "
+            "WHERE card_id = :card_id"
+        ), {"card_id": card_id}).all()
+        backup = conn.execute(text(
+            f"SELECT category_name FROM {database.DUPLICATES_TABLE} WHERE card_id = :card_id"
+        ), {"card_id": card_id}).all()
+        indexes = {row[1] for row in conn.execute(text("PRAGMA index_list('cashback_categories')"))}
+    # Остаётся больший процент, признак постоянной категории и лимит переходят к нему
+    assert [tuple(row) for row in rows] == [("АЗС", 7.0, True, 300.0)]
+    assert [row.category_name for row in backup] == ["Кешбек на АЗС"]
+    assert "ix_cashback_categories_card_key_period" in indexes
@@ -0,0 +1,73 @@
+import pytest
+from app.category_search import _UserIndex
+from conftest import MONTH, YEAR
+
+NAMES = ["Супермаркеты", "Маркетплейсы", "Авиабилеты", "Ж/д билеты", "Фастфуд", "Аптеки", "Рестораны"]
+
+
+@pytest.fixture
+def index():
+    index = _UserIndex()
+    for category_id, name in enumerate(NAMES):
+        index.add(category_id, name, YEAR, MONTH)
+    return index
+
+
+def _found(index, query):
+    return {NAMES[category_id] for category_id, _, _ in index.search(query, YEAR, MONTH, 0.4)}
+
+
+@pytest.mark.parametrize("query, expected", [
+    # Подстрока названия, как при прежнем ILIKE '%запрос%'
+    ("маркет", {"Супермаркеты", "Маркетплейсы"}),
+    ("билеты", {"Авиабилеты", "Ж/д билеты"}),
+    ("фуд", {"Фастфуд"}),
+    ("СТОРАН", {"Рестораны"}),
+    # Окончания, синонимы и опечатки
+    ("аптека", {"Аптеки"}),
+    ("pharmacy", {"Аптеки"}),
+    ("супрмаркет", {"Супермаркеты"}),
+])
+def test_search_finds_categories(index, query, expected):
+    assert expected <= _found(index, query)
+
+
+def test_search_ignores_other_periods(index):
+    index.add(100, "Супермаркеты", YEAR, MONTH + 1)
+    assert {category_id for category_id, _, _ in index.search("маркет", YEAR, MONTH + 1, 0.4)} == {100}
+
+
+def test_removed_category_is_not_found_by_substring(index):
+    index.remove(NAMES.index("Супермаркеты"))
+    assert _found(index, "маркет") == {"Маркетплейсы"}
+    assert all(NAMES.index("Супермаркеты") not in ids for ids in index.name_trigram_docs.values())
+
+
+def test_recommendations_keep_substring_matches(client, headers, make_card):
+    make_card(headers, [("Авиабилеты", 5.0)], name="Путешествия")
+    make_card(headers, [("Билеты", 3.0)], name="Досуг")
+
+    response = client.get("/cashback/recommendations/билеты", params={"month": MONTH, "year": YEAR}, headers=headers)
+    assert response.status_code == 200
+    assert [row["card_name"] for row in response.json()["recommendations"]] == ["Путешествия", "Досуг"]
+
+
+def _ranked(index, query):
+    return [(NAMES[category_id], score) for category_id, score, _ in index.search(query, YEAR, MONTH, 0.4)]
+
+
+def test_prefix_matches_rank_above_infix(index):
+    # Слово целиком выше начала слова, начало слова выше подстроки
+    assert _ranked(index, "марк") == [("Маркетплейсы", 0.8), ("Супермаркеты", 0.7)]
+    assert _ranked(index, "билеты") == [("Ж/д билеты", 1.0), ("Авиабилеты", 0.7)]
+
+
+def test_recommendations_prefer_prefix_match_at_equal_percent(client, headers, make_card):
+    make_card(headers, [("Супермаркеты", 5.0)], name="Продукты")
+    make_card(headers, [("Маркетплейсы", 5.0)], name="Онлайн")
+
+    response = client.get("/cashback/recommendations/марк", params={"month": MONTH, "year": YEAR}, headers=headers)
+    assert response.status_code == 200
+    assert [(row["card_name"], row["relevance"]) for row in response.json()["recommendations"]] == [
+        ("Онлайн", 0.8), ("Продукты", 0.7)
+    ]
@@ -0,0 +1,74 @@
+import re
+from typing import List, Tuple
+from sqlalchemy import event
+from app import database
+from conftest import MONTH, YEAR
+
+
+def _capture(client, headers, url, params) -> List[Tuple[str, tuple]]:
+    """SQL-запросы (с параметрами), выполненные при обработке запроса к API"""
+    engine = database.async_engine.sync_engine if database.async_engine is not None else database.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(url, params=params, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200, response.text
+    return statements
+
+
+def _plan(statement: str, parameters) -> str:
+    with database.engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, tuple(parameters)).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def _category_query(statements, marker: str, exclude: str = None) -> Tuple[str, tuple]:
+    matching = [
+        (sql, params) for sql, params in statements
+        if "FROM cashback_categories" in sql and marker in sql and not (exclude and exclude in sql)
+    ]
+    assert len(matching) == 1, statements
+    return matching[0]
+
+
+def _portfolio(make_card, headers):
+    for index in range(3):
+        make_card(headers, [("Рестораны", 1.0 + index), ("АЗС", 2.0), ("Аптеки", 3.0)])
+
+
+def test_recommendation_table_uses_period_key_index(client, headers, make_card):
+    _portfolio(make_card, headers)
+    statements = _capture(client, headers, "/cashback/recommendations/Рестораны", {"month": MONTH, "year": YEAR})
+
+    plan = _plan(*_category_query(statements, "cashback_categories.year ="))
+    assert "USING INDEX ix_cashback_categories_period_key" in plan
+    assert "SCAN cashback_categories" not in plan
+
+
+def test_search_index_load_uses_user_and_card_indexes(client, headers, make_card):
+    _portfolio(make_card, headers)
+    statements = _capture(client, headers, "/cashback/recommendations/Рестораны", {"month": MONTH, "year": YEAR})
+
+    # Индекс поиска загружает категории пользователя за все периоды
+    plan = _plan(*_category_query(statements, "banks.user_id =", exclude="cashback_categories.year ="))
+    assert "USING COVERING INDEX ix_banks_user_id" in plan
+    assert "USING COVERING INDEX ix_cards_bank_id" in plan
+    # Подходит любой индекс, который начинается с card_id
+    assert re.search(r"USING INDEX ix_cashback_categories_card_(key_)?period \(card_id=\?\)", plan)
+    assert "SCAN cashback_categories" not in plan
+
+
+def test_card_categories_use_card_period_index(client, headers, make_card):
+    _, card_id = make_card(headers, [("Рестораны", 5.0), ("АЗС", 2.0)])
+    statements = _capture(
+        client, headers, "/cashback/categories", {"card_id": card_id, "month": MONTH, "year": YEAR}
+    )
+
+    plan = _plan(*_category_query(statements, "cashback_categories.card_id ="))
+    assert "USING INDEX ix_cashback_categories_card_period (card_id=? AND year=? AND month=?)" in plan
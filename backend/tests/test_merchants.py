@@ -0,0 +1,17 @@
+from conftest import MONTH, YEAR
+
+
+def test_merchant_recommendations_include_same_stem_categories(client, headers, make_card):
+    _, black = make_card(headers, [("Аптеки", 5.0)], name="Black")
+    _, all_card = make_card(headers, [("Аптека", 8.0)], name="All")
+
+    response = client.get(
+        "/cashback/recommendations/by-merchant/Ригла", params={"month": MONTH, "year": YEAR}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    # Справочник относит магазин к "Аптеки"; "Аптека" на другой карте - та же категория
+    assert result["category"] == "Аптеки"
+    assert [
+        (row["card_id"], row["category_name"], row["cashback_percent"]) for row in result["recommendations"]
+    ] == [(all_card, "Аптека", 8.0), (black, "Аптеки", 5.0)]
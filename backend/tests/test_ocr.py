@@ -0,0 +1,171 @@
+import base64
+import json
+import random
+import time
+import uuid
+import pytest
+from app.routers import ocr
+from benchmarks.ocr_extraction import legacy_extract_cashback_info, make_fragment, make_page
+
+TEXT = "Рестораны: 5%\n3% на АЗС"
+# Сначала совпадения "процент категория", затем "категория: процент"
+CATEGORIES = [("АЗС", 3.0), ("Рестораны", 5.0)]
+
+
+@pytest.fixture
+def recognized(monkeypatch):
+    """Подменяет OCR-пул (Tesseract в тестах не нужен): возвращает TEXT и запоминает изображения"""
+    images = []
+
+    async def run(fn, image_bytes, settings):
+        images.append(image_bytes)
+        return TEXT
+
+    monkeypatch.setattr(ocr.ocr_pool, "run", run)
+    return images
+
+
+def _image() -> bytes:
+    # Для кеша и задач важны только байты, поэтому каждый тест берёт новые
+    return b"\x89PNG" + uuid.uuid4().bytes
+
+
+def _names(categories):
+    return [(category["category_name"], category["cashback_percent"]) for category in categories]
+
+
+def _wait_job(client, job_id):
+    deadline = time.monotonic() + 5
+    while True:
+        job = client.get(f"/ocr/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def test_ocr_job_is_processed_in_background(client, recognized):
+    image = _image()
+    response = client.post("/ocr/jobs", files={"file": ("shot.png", image, "image/png")})
+    assert response.status_code == 202, response.text
+    job_id = response.json()["id"]
+
+    job = _wait_job(client, job_id)
+    assert job["status"] == "done", job
+    assert _names(job["categories"]) == CATEGORIES
+    assert job["finished_at"] is not None
+
+    # Повторная загрузка того же файла возвращает готовую задачу без нового распознавания
+    response = client.post("/ocr/jobs", files={"file": ("copy.png", image, "image/png")})
+    assert response.status_code == 202
+    assert (response.json()["id"], response.json()["status"]) == (job_id, "done")
+    assert recognized == [image]
+
+
+def test_ocr_job_errors(client):
+    assert client.get(f"/ocr/jobs/{uuid.uuid4().hex}").status_code == 404
+    response = client.post("/ocr/jobs", files={"file": ("notes.txt", b"text", "text/plain")})
+    assert response.status_code == 400
+
+
+def test_same_image_is_recognized_once(client, recognized):
+    image = _image()
+    hits = ocr.ocr_cache.hits
+
+    first = client.post("/ocr/screenshot", files={"file": ("shot.png", image, "image/png")})
+    second = client.post("/ocr/screenshot", files={"file": ("again.png", image, "image/png")})
+    assert first.status_code == second.status_code == 200, first.text
+    assert first.json() == second.json()
+    assert _names(first.json()["categories"]) == CATEGORIES
+    # Кеш общий для всех OCR-эндпоинтов
+    response = client.post("/ocr/screenshot-base64", json={"image_base64": base64.b64encode(image).decode()})
+    assert response.json() == first.json()
+    assert recognized == [image]
+    assert ocr.ocr_cache.hits == hits + 2
+
+    other = _image()
+    client.post("/ocr/screenshot", files={"file": ("other.png", other, "image/png")})
+    assert recognized == [image, other]
+
+
+def test_cache_key_depends_on_image_and_settings():
+    image = _image()
+    key = ocr.OCRResultCache.make_key(image, ocr.OCR_SETTINGS_KEY)
+    assert key == ocr.OCRResultCache.make_key(bytes(image), ocr.OCR_SETTINGS_KEY)
+    assert key != ocr.OCRResultCache.make_key(image + b"\0", ocr.OCR_SETTINGS_KEY)
+    assert key != ocr.OCRResultCache.make_key(image, ocr.OCR_SETTINGS_KEY + ";contrast=1.0")
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    key = ocr.OCRResultCache.make_key(_image(), ocr.OCR_SETTINGS_KEY)
+    categories = [{"category_name": "АЗС", "cashback_percent": 3.0, "icon": "local_gas_station"}]
+    ocr.OCRResultCache(max_entries=4, disk_dir=str(tmp_path)).put(key, categories)
+
+    cache = ocr.OCRResultCache(max_entries=4, disk_dir=str(tmp_path))
+    assert cache.get(key) == categories
+    assert cache.get(key) == categories
+    assert (cache.disk_hits, cache.hits, cache.misses) == (1, 1, 0)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("5% Рестораны", [("Рестораны", 5.0, "restaurant")]),
+    ("3% на АЗС", [("АЗС", 3.0, "local_gas_station")]),
+    ("Кино - 1,5%", [("Кино", 1.5, "movie")]),
+    ("Рестораны:5%", [("Рестораны", 5.0, "restaurant")]),
+    ("Одежда и обувь: 7%", [("Одежда обувь", 7.0, "shopping_cart")]),
+    ("Такси 2.5%", [("Такси", 2.5, "local_taxi")]),
+    ("10% Такси, 3% Кино", [("Такси", 10.0, "local_taxi"), ("Кино", 3.0, "movie")]),
+    # Повтор той же категории с тем же процентом и процент больше 100 отбрасываются
+    ("Рестораны 5%\nРестораны 5%", [("Рестораны", 5.0, "restaurant")]),
+    ("АЗС 150%", []),
+])
+def test_extract_cashback_info(text, expected):
+    assert [
+        (category["category_name"], category["cashback_percent"], category["icon"])
+        for category in ocr.extract_cashback_info(text)
+    ] == expected
+
+
+def test_tokenizer_matches_legacy_patterns():
+    rng = random.Random(4)
+    texts = [make_page(rng) for _ in range(200)] + [make_fragment(rng) for _ in range(2000)]
+    for text in texts:
+        assert ocr.extract_cashback_info(text) == legacy_extract_cashback_info(text), text
+
+
+def _ndjson(response):
+    return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda item: item["index"])
+
+
+def test_batch_streams_result_per_file(client, recognized):
+    first, second = _image(), _image()
+    response = client.post("/ocr/screenshots", files=[
+        ("files", ("a.png", first, "image/png")),
+        ("files", ("notes.txt", b"text", "text/plain")),
+        ("files", ("b.png", second, "image/png")),
+    ])
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = _ndjson(response)
+    assert [(item["index"], item["filename"]) for item in results] == [(0, "a.png"), (1, "notes.txt"), (2, "b.png")]
+    assert _names(results[0]["categories"]) == _names(results[2]["categories"]) == CATEGORIES
+    assert results[1]["error"] == "File must be an image"
+    assert sorted(recognized) == sorted([first, second])
+
+
+def test_saturated_pool_returns_503(client, monkeypatch):
+    # Очередь заполнена: новые задачи отклоняются, не доходя до процессов пула
+    monkeypatch.setattr(ocr.ocr_pool, "_pending", ocr.ocr_pool.capacity)
+
+    response = client.post("/ocr/screenshot", files={"file": ("shot.png", _image(), "image/png")})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+    response = client.post("/ocr/screenshots", files=[("files", ("a.png", _image(), "image/png"))])
+    assert response.status_code == 200
+    assert _ndjson(response)[0]["error"] == "OCR queue is full, try again later"
+
+
+def test_batch_rejects_too_many_files(client, monkeypatch):
+    monkeypatch.setattr(ocr, "OCR_BATCH_MAX_FILES", 2)
+    files = [("files", (f"{index}.png", _image(), "image/png")) for index in range(3)]
+    assert client.post("/ocr/screenshots", files=files).status_code == 400
@@ -0,0 +1,33 @@
+import pytest
+from app.routers.cashback import _etag_matches
+from conftest import MONTH, YEAR
+
+
+@pytest.mark.parametrize("header, matches", [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ("*", True),
+    ("", False),
+    ('"ab"', False),
+    ('"abcd"', False),
+    ('"xabcx"', False),
+])
+def test_etag_matches(header, matches):
+    assert _etag_matches(header, '"abc"') is matches
+
+
+def test_optimal_returns_304_for_current_etag(client, headers, make_card):
+    make_card(headers, [("Рестораны", 5.0)])
+    params = {"month": MONTH, "year": YEAR}
+
+    response = client.get("/cashback/optimal", params=params, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get("/cashback/optimal", params=params, headers={**headers, "If-None-Match": f'"stale", {etag}'})
+    assert response.status_code == 304
+
+    # Часть тега - не совпадение
+    response = client.get("/cashback/optimal", params=params, headers={**headers, "If-None-Match": etag[:-3] + '"'})
+    assert response.status_code == 200
@@ -0,0 +1,58 @@
+import pytest
+from app.optimizer import Edge, allocate
+from conftest import MONTH, YEAR
+
+
+def _cashback(edges, amounts):
+    return sum(amount * edge.percent / 100 for edge, amount in zip(edges, amounts))
+
+
+def test_card_cap_is_left_for_category_without_other_cards():
+    # Аптеки забирают лимит карты X, хотя у них есть карта Y почти с тем же процентом
+    edges = [Edge("Аптеки", "X", 10, None), Edge("Аптеки", "Y", 9, None), Edge("Кино", "X", 8, None)]
+    amounts = allocate({"Аптеки": 1000, "Кино": 1000}, edges, {"X": 100})
+
+    assert _cashback(edges, amounts) == pytest.approx(172)
+    assert amounts[2] == pytest.approx(1000)
+    assert amounts[0] * 0.10 + amounts[2] * 0.08 <= 100 + 1e-6
+
+
+def test_category_and_card_caps():
+    edges = [
+        Edge("Рестораны", "A", 10, 150),
+        Edge("Рестораны", "B", 5, None),
+        Edge("АЗС", "A", 7, None),
+        Edge("АЗС", "B", 3, None),
+    ]
+    amounts = allocate({"Рестораны": 4000, "АЗС": 3000}, edges, {"A": 200, "B": 100})
+
+    # A: 150 на ресторанах (лимит категории) и 50 на АЗС, B: 100 - остаток лимита
+    assert _cashback(edges, amounts) == pytest.approx(300)
+    assert amounts[0] == pytest.approx(1500)
+
+
+def test_optimize_merges_differently_named_categories(client, headers, make_card):
+    make_card(headers, [("Аптеки", 5.0)], name="Black")
+    _, all_card = make_card(headers, [("Аптека", 8.0)], name="All")
+
+    response = client.post(
+        "/cashback/optimize", json={"spend": {"Аптеки": 1000}, "month": MONTH, "year": YEAR}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["total_cashback"] == 80
+    assert [(item["card_id"], item["cashback_percent"]) for item in result["allocations"]] == [(all_card, 8.0)]
+
+
+def test_min_spend_top_up_reports_effective_percent(client, headers, make_card):
+    _, card_id = make_card(headers, [("Рестораны", 10.0)], monthly_cashback_cap=50, min_monthly_spend=1000)
+
+    response = client.post(
+        "/cashback/optimize", json={"spend": {"Рестораны": 2000}, "month": MONTH, "year": YEAR}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["excluded_cards"] == []
+    [allocation] = result["allocations"]
+    # 500 приносят кешбек до лимита, ещё 500 добирают минимальную сумму трат
+    assert (allocation["amount"], allocation["cashback"], allocation["cashback_percent"]) == (1000, 50, 5.0)
@@ -0,0 +1,52 @@
+import random
+from itertools import combinations, product
+import pytest
+from app.planner import PlannedCard, _Evaluator, make_offers, plan_selection
+
+SPEND = {"Рестораны": 20000, "Одежда": 1000}
+NAMES = ["Рестораны", "Одежда", "Кино", "Такси"]
+
+
+def _card(index, choose, offered, cap=500.0):
+    return PlannedCard(index, f"Карта {index}", choose, cap, make_offers(SPEND, [
+        (name, percent, category_cap, None) for name, percent, category_cap in offered
+    ]))
+
+
+def _exhaustive(spend, cards):
+    """Лучший кешбек среди всех наборов не больше N категорий на каждой карте"""
+    evaluator = _Evaluator(spend, cards, [])
+    variants = [
+        [chosen for size in range(card.choose + 1) for chosen in combinations(range(len(card.offers)), size)]
+        for card in cards
+    ]
+    return max(evaluator.total(list(selection)) for selection in product(*variants))
+
+
+def test_plan_is_optimal_under_card_caps():
+    # Лимиты карт по 500: рестораны дают 500 на картах 0 и 1, одежда - 50 на карте 2.
+    # Жадное распределение по убыванию процента находило только 800
+    cards = [
+        _card(0, 2, [("Одежда", 7.0, None), ("Кино", 10.0, None), ("Рестораны", 5.0, None)]),
+        _card(1, 2, [("Кино", 3.0, None), ("Такси", 1.0, None), ("Рестораны", 7.0, None)]),
+        _card(2, 2, [("Одежда", 5.0, None), ("Кино", 7.0, None), ("Такси", 7.0, None)]),
+    ]
+    result = plan_selection(SPEND, cards, [])
+
+    assert result["optimal"] is True
+    assert result["total_cashback"] == pytest.approx(_exhaustive(SPEND, cards)) == pytest.approx(1050)
+
+
+def test_optimal_plans_match_exhaustive_search():
+    rng = random.Random(7)
+    for _ in range(30):
+        cards = [
+            _card(index, rng.choice([1, 2]), [
+                (name, float(rng.choice([1, 3, 5, 7, 10])), rng.choice([None, None, 300.0]))
+                for name in rng.sample(NAMES, 3)
+            ], cap=rng.choice([300.0, 500.0, None]))
+            for index in range(3)
+        ]
+        result = plan_selection(SPEND, cards, [])
+        assert result["optimal"] is True
+        assert result["total_cashback"] == pytest.approx(_exhaustive(SPEND, cards), abs=0.01)
@@ -0,0 +1,81 @@
+from app.categories import make_category_key
+from app import recommendations
+from app.recommendations import RecommendationRow, RecommendationTable
+from conftest import MONTH, YEAR
+
+CATEGORIES = [
+    "Рестораны", "АЗС", "Аптеки", "Супермаркеты", "Такси", "Кино", "Одежда", "Красота",
+    "Авиабилеты", "Фастфуд", "Спорт", "Книги", "Цветы", "Транспорт", "Развлечения",
+]
+
+
+def _portfolio(make_card, headers, cards: int):
+    bank_ids = []
+    for index in range(cards):
+        bank_id = bank_ids[index % 3] if len(bank_ids) == 3 else None
+        bank_id, _ = make_card(
+            headers,
+            [(name, float(1 + (index + offset) % 5)) for offset, name in enumerate(CATEGORIES)],
+            bank_id=bank_id,
+        )
+        if len(bank_ids) < 3:
+            bank_ids.append(bank_id)
+
+
+def test_recommendations_query_count_does_not_depend_on_cards(client, make_user, make_card, count_queries):
+    counts = {}
+    for cards in (1, 10):
+        headers = make_user()
+        _portfolio(make_card, headers, cards)
+        with count_queries() as statements:
+            response = client.get(
+                "/cashback/recommendations/Рестораны", params={"month": MONTH, "year": YEAR}, headers=headers
+            )
+        assert response.status_code == 200
+        assert len(response.json()["recommendations"]) == cards
+        counts[cards] = len(statements)
+
+    assert counts[1] == counts[10]
+    # Индекс поиска категорий и таблица рекомендаций - по одному запросу
+    assert counts[10] <= 2
+
+
+def test_recommendations_are_sorted_by_percent(client, headers, make_card):
+    make_card(headers, [("Рестораны", 3.0)], name="Тройка")
+    make_card(headers, [("Рестораны", 7.0)], name="Семёрка")
+    make_card(headers, [("АЗС", 10.0)], name="Заправка")
+
+    response = client.get("/cashback/recommendations/рестораны", params={"month": MONTH, "year": YEAR}, headers=headers)
+    assert response.status_code == 200
+    recommendations = response.json()["recommendations"]
+    assert [row["card_name"] for row in recommendations] == ["Семёрка", "Тройка"]
+    assert [row["cashback_percent"] for row in recommendations] == [7.0, 3.0]
+
+
+def _row(category_id, name, percent, card_id):
+    return RecommendationRow(
+        category_id, name, make_category_key(name), percent, "", card_id, f"Карта {card_id}", 1, "Банк"
+    )
+
+
+def test_match_merges_exact_key_with_same_stem_categories():
+    table = RecommendationTable([
+        _row(1, "Аптеки", 5.0, 1),
+        _row(2, "Аптека", 8.0, 2),
+        _row(3, "Одежда и обувь", 3.0, 3),
+    ])
+
+    # Точное совпадение ключа не скрывает ту же категорию, записанную иначе
+    for name in ("Аптеки", "аптек", "pharmacy"):
+        assert [row.category_id for row in table.match(name)] == [2, 1]
+    # Слова одной категории входят в другую - только если равных по основам нет
+    assert [row.category_id for row in table.match("Одежда")] == [3]
+
+
+def test_cache_stats_are_disabled_by_default(client, headers, monkeypatch):
+    assert client.get("/cashback/cache-stats", headers=headers).status_code == 404
+
+    monkeypatch.setattr(recommendations, "CACHE_STATS_ENABLED", True)
+    response = client.get("/cashback/cache-stats", headers=headers)
+    assert response.status_code == 200, response.text
+    assert set(response.json()) == {"users", "tables", "hits", "misses"}
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime
+from app.rollover import previous_period, rollover_permanent
+
+
+def _categories(client, headers, card_id, year, month):
+    response = client.get("/cashback/categories", params={"card_id": card_id, "month": month, "year": year}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_permanent_categories_roll_over_once_per_month(client, headers, make_card):
+    now = datetime.now()
+    year, month = previous_period(now.year, now.month)
+    _, card_id = make_card(headers, month=month, year=year)
+    for name, permanent in (("Рестораны", True), ("АЗС", True), ("Кино", False)):
+        response = client.post(
+            f"/cashback/cards/{card_id}/categories",
+            json={"category_name": name, "cashback_percent": 5.0, "month": month, "year": year, "is_permanent": permanent},
+            headers=headers,
+        )
+        assert response.status_code == 200
+
+    asyncio.run(rollover_permanent(year, month))
+    copied = _categories(client, headers, card_id, now.year, now.month)
+    assert sorted(category["category_name"] for category in copied) == ["АЗС", "Рестораны"]
+
+    # Пользователь удалил одну копию и переименовал другую
+    by_name = {category["category_name"]: category["id"] for category in copied}
+    assert client.delete(f"/cashback/categories/{by_name['АЗС']}", headers=headers).status_code == 200
+    response = client.put(f"/cashback/categories/{by_name['Рестораны']}", json={"category_name": "Кафе"}, headers=headers)
+    assert response.status_code == 200
+
+    # Следующая проверка планировщика ничего не возвращает
+    assert asyncio.run(rollover_permanent(year, month)) == 0
+    assert [category["category_name"] for category in _categories(client, headers, card_id, now.year, now.month)] == ["Кафе"]
+
+
+def test_manual_copy_to_next_month_does_not_duplicate(client, headers, make_card):
+    _, card_id = make_card(headers, [("Рестораны", 5.0), ("АЗС", 3.0)], month=3, year=2026)
+    request = {"month": 3, "year": 2026, "card_id": card_id}
+
+    response = client.post("/cashback/rollover", json=request, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["copied"] == 2
+    assert client.post("/cashback/rollover", json=request, headers=headers).json()["copied"] == 0
+    assert len(_categories(client, headers, card_id, 2026, 4)) == 2
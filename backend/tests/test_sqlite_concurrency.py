@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import anyio
+from app import database
+from conftest import MONTH, YEAR
+
+WRITERS = 6
+ROUNDS = 15
+NAMES = ("Рестораны", "АЗС", "Аптеки", "Такси")
+
+
+def test_concurrent_bulk_upserts_and_reads_do_not_lock(client, make_user, make_card):
+    users = []
+    for _ in range(WRITERS):
+        headers = make_user()
+        _, card_id = make_card(headers)
+        users.append((headers, card_id))
+
+    errors = []
+    start = threading.Barrier(WRITERS * 2)
+
+    def writer(headers, card_id):
+        start.wait()
+        for round_number in range(ROUNDS):
+            response = client.post(
+                f"/cashback/cards/{card_id}/categories:bulk",
+                json={"categories": [
+                    {"category_name": name, "cashback_percent": float(round_number % 10 + 1),
+                     "month": MONTH, "year": YEAR}
+                    for name in NAMES
+                ]},
+                headers=headers,
+            )
+            if response.status_code != 200:
+                errors.append(response.text)
+
+    def reader(headers, card_id):
+        start.wait()
+        for _ in range(ROUNDS):
+            for url in ("/banks/", "/cashback/categories", "/cashback/optimal"):
+                response = client.get(url, params={"month": MONTH, "year": YEAR}, headers=headers)
+                if response.status_code != 200:
+                    errors.append(response.text)
+
+    with ThreadPoolExecutor(max_workers=WRITERS * 2) as executor:
+        futures = [executor.submit(writer, *user) for user in users]
+        futures += [executor.submit(reader, *user) for user in users]
+        for future in futures:
+            future.result()
+
+    assert not [error for error in errors if "locked" in error.lower()]
+    assert not errors
+
+    # Повторные сохранения обновляют категории, а не дублируют их
+    headers, card_id = users[0]
+    response = client.get("/cashback/categories", params={"card_id": card_id, "month": MONTH, "year": YEAR}, headers=headers)
+    categories = response.json()
+    assert sorted(category["category_name"] for category in categories) == sorted(NAMES)
+    assert {category["cashback_percent"] for category in categories} == {float((ROUNDS - 1) % 10 + 1)}
+
+
+def test_more_writers_than_threadpool_workers(client, make_user, make_card):
+    # Запись держит блокировку писателя только внутри одного вызова пула потоков:
+    # если бы она переживала await, ждущие запросы заняли бы оба потока и commit
+    # владельца ждал бы busy_timeout
+    writers = []
+    for _ in range(WRITERS):
+        headers = make_user()
+        _, card_id = make_card(headers, [("Рестораны", 5.0)], is_permanent=True)
+        writers.append((headers, card_id))
+    limiter = client.portal.call(anyio.to_thread.current_default_thread_limiter)
+    total_tokens = limiter.total_tokens
+    client.portal.call(setattr, limiter, "total_tokens", 2)
+    start = threading.Barrier(WRITERS * 2)
+
+    def bulk(headers, card_id):
+        start.wait()
+        return client.post(
+            f"/cashback/cards/{card_id}/categories:bulk",
+            json={"categories": [{"category_name": name, "cashback_percent": 3.0, "month": MONTH, "year": YEAR}
+                                 for name in NAMES]},
+            headers=headers,
+        )
+
+    def rollover(headers, card_id):
+        start.wait()
+        return client.post("/cashback/rollover", json={"month": MONTH, "year": YEAR}, headers=headers)
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=WRITERS * 2) as executor:
+            futures = [executor.submit(bulk, *writer) for writer in writers]
+            futures += [executor.submit(rollover, *writer) for writer in writers]
+            responses = [future.result() for future in futures]
+    finally:
+        client.portal.call(setattr, limiter, "total_tokens", total_tokens)
+
+    assert [response.text for response in responses if response.status_code != 200] == []
+    assert time.perf_counter() - started < database.SQLITE_PRAGMAS["busy_timeout"] / 1000
+    assert not database._writer_lock.locked()
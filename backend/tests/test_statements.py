@@ -0,0 +1,27 @@
+import pytest
+from app.statements import CsvStatementParser, Transaction, _StatementParser
+
+
+def test_statement_parser_requires_feed_and_close():
+    with pytest.raises(TypeError):
+        _StatementParser()
+
+    class Incomplete(_StatementParser):
+        def feed(self, text):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_csv_parser_joins_rows_split_between_chunks():
+    parser = CsvStatementParser()
+    text = 'Дата;Сумма;Описание;Категория\n01.05.2026;-1200,50;"Аптека ""36,6""";Аптеки\n02.05.2026;500;Пополнение;\n'
+    items = []
+    for start in range(0, len(text), 7):
+        items += parser.feed(text[start:start + 7])
+    items += parser.close()
+
+    [transaction] = items
+    assert isinstance(transaction, Transaction)
+    assert (transaction.amount, transaction.description, transaction.bank_category) == (1200.5, 'Аптека "36,6"', "Аптеки")
@@ -0,0 +1,65 @@
+from conftest import MONTH, YEAR
+
+
+def test_statistics_aggregates(client, make_user, make_card):
+    headers = make_user()
+    bank_a, a1 = make_card(headers, [("Рестораны", 5.0), ("АЗС", 7.0)], name="A1")
+    _, a2 = make_card(headers, [("Рестораны", 10.0)], bank_id=bank_a, name="A2")
+    _, a3 = make_card(headers, bank_id=bank_a, name="A3")
+    bank_b, b1 = make_card(headers, [("АЗС", 3.0), ("Кино", 4.0)], name="B1")
+    make_card(headers, [("Такси", 2.0)], bank_id=bank_b, month=MONTH - 1)
+    bank_c = client.post("/banks/", json={"name": "Пустой"}, headers=headers).json()["id"]
+    # Категории другого пользователя в статистику не попадают
+    make_card(make_user(), [("Рестораны", 15.0)])
+
+    response = client.get("/cashback/statistics", params={"month": MONTH, "year": YEAR}, headers=headers)
+    assert response.status_code == 200, response.text
+    stats = response.json()
+
+    assert stats["totals"] == {
+        "categories": 5,
+        "unique_categories": 3,
+        "cards_with_categories": 3,
+        "banks_with_categories": 2,
+        "max_percent": 10.0,
+        "avg_percent": 5.8,
+    }
+    assert [
+        (item["category_name"], item["cards"], item["max_percent"], item["avg_percent"], item["best_card_id"])
+        for item in stats["categories"]
+    ] == [
+        ("Рестораны", 2, 10.0, 7.5, a2),
+        ("АЗС", 2, 7.0, 5.0, a1),
+        ("Кино", 1, 4.0, 4.0, b1),
+    ]
+    # Карты без категорий за месяц тоже в списке (в том числе карта банка B с категорией прошлого месяца)
+    cards = {item["card_id"]: item for item in stats["cards"]}
+    assert [(cards[card]["categories"], cards[card]["max_percent"], cards[card]["avg_percent"])
+            for card in (a1, a2, a3, b1)] == [(2, 7.0, 6.0), (1, 10.0, 10.0), (0, None, None), (2, 4.0, 3.5)]
+    assert len(cards) == 5
+    assert [
+        (item["bank_id"], item["cards"], item["cards_with_categories"], item["categories"],
+         item["coverage"], item["max_percent"], item["avg_percent"])
+        for item in stats["banks"]
+    ] == [
+        (bank_a, 3, 2, 2, 0.667, 10.0, 7.33),
+        (bank_b, 2, 1, 2, 0.667, 4.0, 3.5),
+        (bank_c, 0, 0, 0, 0.0, None, None),
+    ]
+    assert stats["periods"] == [
+        {"year": YEAR, "month": MONTH, "categories": 5},
+        {"year": YEAR, "month": MONTH - 1, "categories": 1},
+    ]
+
+
+def test_statistics_for_month_without_categories(client, headers, make_card):
+    make_card(headers, [("Рестораны", 5.0)])
+
+    response = client.get("/cashback/statistics", params={"month": MONTH + 1, "year": YEAR}, headers=headers)
+    assert response.status_code == 200, response.text
+    stats = response.json()
+    assert stats["totals"]["categories"] == 0
+    assert stats["totals"]["avg_percent"] is None
+    assert stats["categories"] == []
+    assert stats["banks"][0]["coverage"] == 0.0
+    assert stats["periods"] == [{"year": YEAR, "month": MONTH, "categories": 1}]
@@ -49,16 +49,14 @@ function ScreenshotUpload() {
     setError(null);
 
     try {
-      // Сохраняем каждую категорию
-      for (const category of results.categories) {
-        await cashbackApi.createCategory(selectedCard, {
-          category_name: category.category_name,
-          cashback_percent: category.cashback_percent,
-          month: month,
-          year: year,
-          icon: category.icon || "shopping_cart"
-        });
-      }
+      // Сохраняем все категории одним запросом
+      await cashbackApi.bulkCreateCategories(selectedCard, results.categories.map((category) => ({
+        category_name: category.category_name,
+        cashback_percent: category.cashback_percent,
+        month: month,
+        year: year,
+        icon: category.icon || "shopping_cart"
+      })));
 
       // Очистка всех данных для возможности добавления новых скриншотов
       setResults(null);
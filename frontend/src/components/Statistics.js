@@ -9,9 +9,10 @@ import {
   Chip,
   Grid,
   Alert,
+  LinearProgress,
 } from '@mui/material';
 import { Timeline as TimelineIcon } from '@mui/icons-material';
-import { banksApi } from '../services/api';
+import { cashbackApi } from '../services/api';
 
 const months = [
   'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
@@ -19,61 +20,28 @@ const months = [
 ];
 
 function Statistics() {
-  const [banks, setBanks] = useState([]);
+  const [statistics, setStatistics] = useState(null);
   const [selectedMonth, setSelectedMonth] = useState(new Date().getMonth() + 1);
   const [selectedYear, setSelectedYear] = useState(new Date().getFullYear());
 
-  const loadBanks = useCallback(async () => {
+  const loadStatistics = useCallback(async () => {
     try {
-      const response = await banksApi.getAll();
-      
-      // Фильтруем категории по выбранному месяцу и году
-      const filteredBanks = response.data.map(bank => ({
-        ...bank,
-        cards: bank.cards?.map(card => ({
-          ...card,
-          cashback_categories: card.cashback_categories?.filter(
-            cat => cat.month === selectedMonth && cat.year === selectedYear
-          ) || []
-        })) || []
-      }));
-      
-      setBanks(filteredBanks);
+      // Агрегаты считает сервер: дерево банков со всей историей категорий не загружается
+      const response = await cashbackApi.getStatistics({ month: selectedMonth, year: selectedYear });
+      setStatistics(response.data);
     } catch (error) {
-      console.error('Error loading banks:', error);
+      console.error('Error loading statistics:', error);
     }
   }, [selectedMonth, selectedYear]);
 
   useEffect(() => {
-    loadBanks();
-  }, [loadBanks]);
+    loadStatistics();
+  }, [loadStatistics]);
 
-  // Получаем список всех месяцев, в которых есть данные
-  const getAllDataMonths = () => {
-    const allData = {};
-    banks.forEach(bank => {
-      bank.cards?.forEach(card => {
-        card.cashback_categories?.forEach(cat => {
-          if (!allData[`${cat.year}-${cat.month}`]) {
-            allData[`${cat.year}-${cat.month}`] = true;
-          }
-        });
-      });
-    });
-    return Object.keys(allData)
-      .map(key => {
-        const [year, month] = key.split('-').map(Number);
-        return { year, month, monthName: months[month - 1] };
-      })
-      .sort((a, b) => b.year - a.year || b.month - a.month);
-  };
-
-  const dataMonths = getAllDataMonths();
-  const hasData = banks.some(bank => 
-    bank.cards?.some(card => 
-      card.cashback_categories && card.cashback_categories.length > 0
-    )
-  );
+  const totals = statistics?.totals;
+  const periods = statistics?.periods || [];
+  const hasData = totals && totals.categories > 0;
+  const banks = (statistics?.banks || []).filter(bank => bank.categories > 0);
 
   return (
     <Box>
@@ -107,17 +75,17 @@ function Statistics() {
         </Box>
       </Box>
 
-      {dataMonths.length > 0 && (
+      {periods.length > 0 && (
         <Card sx={{ mb: 3 }}>
           <CardContent>
             <Typography variant="subtitle2" color="text.secondary" gutterBottom>
               Доступные периоды с данными:
             </Typography>
             <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 1 }}>
-              {dataMonths.map(({ year, month, monthName }) => (
+              {periods.map(({ year, month, categories }) => (
                 <Chip
                   key={`${year}-${month}`}
-                  label={`${monthName} ${year}`}
+                  label={`${months[month - 1]} ${year} (${categories})`}
                   onClick={() => {
                     setSelectedMonth(month);
                     setSelectedYear(year);
@@ -131,53 +99,73 @@ function Statistics() {
         </Card>
       )}
 
-      {!hasData && (
+      {statistics && !hasData && (
         <Alert severity="info">
           Нет данных по категориям кешбека для {months[selectedMonth - 1]} {selectedYear}.
           Перейдите в раздел "Скриншот" для добавления категорий.
         </Alert>
       )}
 
-      {banks.filter(bank => 
-        bank.cards?.some(card => card.cashback_categories && card.cashback_categories.length > 0)
-      ).map((bank) => (
-        <Card key={bank.id} sx={{ mb: 3 }}>
+      {hasData && (
+        <Card sx={{ mb: 3 }}>
+          <CardContent>
+            <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 1 }}>
+              <Chip label={`Категорий: ${totals.categories}`} />
+              <Chip label={`Разных категорий: ${totals.unique_categories}`} />
+              <Chip label={`Карт с категориями: ${totals.cards_with_categories}`} />
+              <Chip label={`Банков: ${totals.banks_with_categories}`} />
+              <Chip label={`Максимум: ${totals.max_percent}%`} color="primary" />
+              <Chip label={`Средний: ${totals.avg_percent}%`} />
+            </Box>
+          </CardContent>
+        </Card>
+      )}
+
+      {hasData && (
+        <Card sx={{ mb: 3 }}>
           <CardContent>
             <Typography variant="h6" gutterBottom sx={{ mb: 2 }}>
-              {bank.name}
+              Лучшие карты по категориям
+            </Typography>
+            <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 1 }}>
+              {statistics.categories.map((category) => (
+                <Chip
+                  key={category.category_key}
+                  label={`${category.category_name}: ${category.max_percent}% - ${category.best_card_name} (${category.best_bank_name})`}
+                  title={`Карт: ${category.cards}, средний процент: ${category.avg_percent}%`}
+                  size="small"
+                  color="primary"
+                  variant="outlined"
+                />
+              ))}
+            </Box>
+          </CardContent>
+        </Card>
+      )}
+
+      {banks.map((bank) => (
+        <Card key={bank.bank_id} sx={{ mb: 3 }}>
+          <CardContent>
+            <Typography variant="h6" gutterBottom>
+              {bank.bank_name}
+            </Typography>
+            <Typography variant="body2" color="text.secondary">
+              Покрытие категорий месяца: {Math.round(bank.coverage * 100)}%
+              {' · '}максимум {bank.max_percent}%{' · '}средний {bank.avg_percent}%
             </Typography>
+            <LinearProgress variant="determinate" value={bank.coverage * 100} sx={{ mt: 1, mb: 2 }} />
             <Grid container spacing={2}>
-              {bank.cards
-                ?.filter(card => card.cashback_categories && card.cashback_categories.length > 0)
+              {statistics.cards
+                .filter(card => card.bank_id === bank.bank_id && card.categories > 0)
                 .map((card) => (
-                  <Grid item xs={12} key={card.id}>
+                  <Grid item xs={12} sm={6} md={4} key={card.card_id}>
                     <Card variant="outlined" sx={{ p: 2, bgcolor: 'background.default' }}>
                       <Typography variant="subtitle1" fontWeight="bold" gutterBottom>
-                        {card.name}
-                        {card.card_type && (
-                          <Typography component="span" variant="caption" color="text.secondary" sx={{ ml: 1 }}>
-                            ({card.card_type})
-                          </Typography>
-                        )}
+                        {card.card_name}
+                      </Typography>
+                      <Typography variant="body2" color="text.secondary">
+                        Категорий: {card.categories}{' · '}максимум {card.max_percent}%{' · '}средний {card.avg_percent}%
                       </Typography>
-                      <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 1, mt: 1 }}>
-                        {card.cashback_categories.map((category) => {
-                          let IconComponent =
-                            require('@mui/icons-material')[category.icon || 'ShoppingCart'] ||
-                            require('@mui/icons-material').ShoppingCart;
-
-                          return (
-                            <Chip
-                              key={category.id}
-                              icon={<IconComponent />}
-                              label={`${category.category_name}: ${category.cashback_percent}%`}
-                              size="small"
-                              color="primary"
-                              variant="outlined"
-                            />
-                          );
-                        })}
-                      </Box>
                     </Card>
                   </Grid>
                 ))}
@@ -190,4 +178,3 @@ function Statistics() {
 }
 
 export default Statistics;
-
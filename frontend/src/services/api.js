@@ -67,9 +67,27 @@ export const cardsApi = {
 export const cashbackApi = {
   getCategories: (params) => api.get('/cashback/categories', { params }),
   createCategory: (cardId, data) => api.post(`/cashback/cards/${cardId}/categories`, data),
+  bulkCreateCategories: (cardId, categories) => api.post(`/cashback/cards/${cardId}/categories:bulk`, { categories }),
   updateCategory: (categoryId, data) => api.put(`/cashback/categories/${categoryId}`, data),
   deleteCategory: (categoryId) => api.delete(`/cashback/categories/${categoryId}`),
   getRecommendations: (category, params) => api.get(`/cashback/recommendations/${category}`, { params }),
+  getByMerchant: (name, params) => api.get(`/cashback/recommendations/by-merchant/${encodeURIComponent(name)}`, { params }),
+  getMerchants: () => api.get('/cashback/merchants'),
+  saveMerchant: (data) => api.post('/cashback/merchants', data),
+  deleteMerchant: (id) => api.delete(`/cashback/merchants/${id}`),
+  getOptimal: (params) => api.get('/cashback/optimal', { params }),
+  getStatistics: (params) => api.get('/cashback/statistics', { params }),
+  optimize: (data) => api.post('/cashback/optimize', data),
+  planSelection: (cardId, data) => api.post(`/cashback/cards/${cardId}/plan-selection`, data),
+  planSelectionBatch: (data) => api.post('/cashback/plan-selection', data),
+  // Файл выписки отправляется телом запроса; ответ - NDJSON, последняя строка - итоги
+  importStatement: (file, params) => api.post('/cashback/statements/import', file, {
+    params,
+    headers: {
+      'Content-Type': file.type || 'text/csv',
+    },
+    responseType: 'text',
+  }),
 };
 
 // OCR API